@@ -0,0 +1,420 @@
+"""
+文档存储 - 按会话和文档ID管理上传的文档
+
+原始文件和提取出的文本、处理后的文本都保存在磁盘上，内存中只缓存最近使用的文本，
+按占用字节数进行LRU淘汰；每个会话最多保留固定数量的文档，超出时删除最早上传的文档。
+客户端不带会话Cookie时每次都会得到新的会话，因此另外限制所有会话的文档总数和磁盘占用，
+超出时跨会话删除最久未使用的文档。
+文档ID由会话和文件内容的哈希得到，file_id可以在O(1)时间内找到对应文档。
+"""
+
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, List, Optional, Union
+
+logger = logging.getLogger("document_store")
+
+# 内存中缓存的文档文本的最大字节数
+DEFAULT_MEMORY_BYTES = int(os.getenv("DOCUMENT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# 每个会话最多保留的文档数量
+DEFAULT_SESSION_QUOTA = int(os.getenv("DOCUMENT_SESSION_QUOTA", "20"))
+# 所有会话合计最多保留的文档数量
+DEFAULT_MAX_DOCUMENTS = int(os.getenv("DOCUMENT_MAX_COUNT", "1000"))
+# 所有文档合计占用的磁盘字节数上限
+DEFAULT_MAX_DISK_BYTES = int(os.getenv("DOCUMENT_MAX_DISK_BYTES", str(1024 * 1024 * 1024)))
+
+ORIGINAL_FILE = "original.docx"
+CONTENT_FILE = "content.txt"
+PROCESSED_FILE = "processed.txt"
+META_FILE = "meta.json"
+# 由原始文件和处理结果生成的文件（例如修补后的docx），处理结果变化时全部删除
+DERIVED_PREFIX = "derived_"
+# 复制上传文件时每次读取的字节数
+COPY_CHUNK_SIZE = 64 * 1024
+
+
+@dataclass
+class DocumentRecord:
+    """文档元数据，始终保存在内存中"""
+    document_id: str
+    session_id: str
+    filename: str
+    size: int
+    userid: str = "system"
+    updatetime: str = field(default_factory=lambda: datetime.now().isoformat())
+    has_processed: bool = False
+
+    def to_file_item(self) -> Dict[str, Any]:
+        """转换为前端文件列表使用的格式"""
+        return {
+            "id": self.document_id,
+            "filename": self.filename,
+            "fileuuid": self.document_id,
+            "fileurl": "",
+            "updatetime": self.updatetime,
+            "userid": self.userid,
+        }
+
+
+def _session_digest(session_id: str):
+    digest = hashlib.sha256()
+    digest.update(session_id.encode("utf-8"))
+    digest.update(b"\0")
+    return digest
+
+
+def make_document_id(session_id: str, data: bytes) -> str:
+    """由会话和文件内容生成稳定的文档ID"""
+    digest = _session_digest(session_id)
+    digest.update(data)
+    return digest.hexdigest()[:32]
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    # 每次写入使用独立的临时文件，同一文件的并发写入不会互相覆盖或删除对方的临时文件
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class DocumentStore:
+    """按会话和文档ID索引的文档存储"""
+
+    def __init__(self, root_dir: str, max_memory_bytes: int = DEFAULT_MEMORY_BYTES,
+                 session_quota: int = DEFAULT_SESSION_QUOTA, max_documents: int = DEFAULT_MAX_DOCUMENTS,
+                 max_disk_bytes: int = DEFAULT_MAX_DISK_BYTES):
+        self.root_dir = Path(root_dir)
+        self.max_memory_bytes = max_memory_bytes
+        self.session_quota = max(1, session_quota)
+        self.max_documents = max(1, max_documents)
+        self.max_disk_bytes = max_disk_bytes
+        self._lock = threading.RLock()
+        self._records: Dict[str, DocumentRecord] = {}
+        # 会话 -> 按上传时间排列的文档ID
+        self._sessions: Dict[str, "OrderedDict[str, None]"] = {}
+        # 所有会话的文档ID，按最近使用排序，超出总量时从最久未使用的开始删除
+        self._recent: "OrderedDict[str, None]" = OrderedDict()
+        # 文档ID -> 文档目录占用的磁盘字节数
+        self._disk_sizes: Dict[str, int] = {}
+        self._disk_bytes = 0
+        # (文档ID, 文本类型) -> 文本，按最近使用排序
+        self._texts: "OrderedDict[tuple, str]" = OrderedDict()
+        self._text_sizes: Dict[tuple, int] = {}
+        self._memory_bytes = 0
+        self.memory_hits = 0
+        self.disk_reads = 0
+        self.root_dir.mkdir(parents=True, exist_ok=True)
+        self._load_index()
+
+    def _document_dir(self, document_id: str) -> Path:
+        return self.root_dir / document_id[:2] / document_id
+
+    def _load_index(self) -> None:
+        """启动时从磁盘上的元数据重建索引"""
+        records = []
+        for meta_path in self.root_dir.glob(f"*/*/{META_FILE}"):
+            try:
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    records.append(DocumentRecord(**json.load(f)))
+            except (OSError, ValueError, TypeError) as e:
+                logger.warning(f"跳过损坏的文档元数据 {meta_path}: {e}")
+        for record in sorted(records, key=lambda r: r.updatetime):
+            self._records[record.document_id] = record
+            self._sessions.setdefault(record.session_id, OrderedDict())[record.document_id] = None
+            self._recent[record.document_id] = None
+            self._set_disk_size(record.document_id, self._measure(record.document_id))
+        if records:
+            logger.info(f"已从 {self.root_dir} 加载 {len(records)} 个文档")
+        self._remove_dirs(self._evict_over_limits())
+
+    def _measure(self, document_id: str) -> int:
+        """文档目录中所有文件的字节数"""
+        try:
+            paths = list(self._document_dir(document_id).iterdir())
+        except OSError:
+            # 文档已被删除
+            return 0
+        total = 0
+        for path in paths:
+            try:
+                total += path.stat().st_size
+            except OSError:
+                pass
+        return total
+
+    def _write_meta(self, record: DocumentRecord) -> None:
+        _write_atomic(self._document_dir(record.document_id) / META_FILE,
+                      json.dumps(asdict(record), ensure_ascii=False).encode("utf-8"))
+
+    # ---- 全局配额 ----
+
+    def _set_disk_size(self, document_id: str, size: int) -> None:
+        self._disk_bytes += size - self._disk_sizes.get(document_id, 0)
+        self._disk_sizes[document_id] = size
+
+    def _touch(self, document_id: str) -> None:
+        if document_id in self._recent:
+            self._recent.move_to_end(document_id)
+
+    def _evict_over_limits(self, keep: Optional[str] = None) -> List[str]:
+        """文档总数或磁盘占用超出上限时，跨会话删除最久未使用的文档，返回需要删除目录的文档ID"""
+        evicted = []
+        with self._lock:
+            while len(self._records) > self.max_documents or self._disk_bytes > self.max_disk_bytes:
+                oldest = next((document_id for document_id in self._recent if document_id != keep), None)
+                if oldest is None:
+                    break
+                self._unlink_record(oldest)
+                evicted.append(oldest)
+        return evicted
+
+    def _remove_dirs(self, document_ids: List[str], reason: str = "超出文档总量上限") -> None:
+        for document_id in document_ids:
+            shutil.rmtree(self._document_dir(document_id), ignore_errors=True)
+            logger.info(f"{reason}，已删除文档 {document_id}")
+
+    # ---- 内存文本缓存 ----
+
+    def _cache_text(self, key: tuple, text: str) -> None:
+        self._drop_text(key)
+        size = len(text.encode("utf-8"))
+        if size > self.max_memory_bytes:
+            return
+        self._texts[key] = text
+        self._text_sizes[key] = size
+        self._memory_bytes += size
+        while self._memory_bytes > self.max_memory_bytes:
+            evicted, _ = self._texts.popitem(last=False)
+            self._memory_bytes -= self._text_sizes.pop(evicted)
+
+    def _drop_text(self, key: tuple) -> None:
+        if self._texts.pop(key, None) is not None:
+            self._memory_bytes -= self._text_sizes.pop(key)
+
+    def _read_text(self, document_id: str, kind: str) -> Optional[str]:
+        key = (document_id, kind)
+        with self._lock:
+            text = self._texts.get(key)
+            if text is not None:
+                self._texts.move_to_end(key)
+                self.memory_hits += 1
+                return text
+            if document_id not in self._records:
+                return None
+        path = self._document_dir(document_id) / kind
+        try:
+            text = path.read_text(encoding="utf-8")
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            self.disk_reads += 1
+            if document_id in self._records:
+                self._cache_text(key, text)
+        return text
+
+    # ---- 公共接口 ----
+
+    def _spool_original(self, session_id: str, source: BinaryIO):
+        """把上传文件分块复制到临时文件，同时计算文档ID，不在内存中保留完整文件"""
+        digest = _session_digest(session_id)
+        size = 0
+        source.seek(0)
+        tmp = tempfile.NamedTemporaryFile(dir=self.root_dir, prefix="upload_", suffix=".tmp", delete=False)
+        try:
+            with tmp:
+                while True:
+                    block = source.read(COPY_CHUNK_SIZE)
+                    if not block:
+                        break
+                    digest.update(block)
+                    tmp.write(block)
+                    size += len(block)
+        except BaseException:
+            os.unlink(tmp.name)
+            raise
+        return digest.hexdigest()[:32], size, tmp.name
+
+    def put(self, session_id: str, filename: str, data: Union[bytes, BinaryIO], content: str,
+            userid: Optional[str] = None) -> DocumentRecord:
+        """保存上传的文档，同一会话重复上传相同文件时返回同一个ID
+
+        data可以是字节串，也可以是可seek的文件对象（按块复制到磁盘）。
+        """
+        if isinstance(data, (bytes, bytearray)):
+            data = io.BytesIO(data)
+        document_id, size, tmp_path = self._spool_original(session_id, data)
+        record = DocumentRecord(document_id=document_id, session_id=session_id, filename=filename,
+                                size=size, userid=userid or "system")
+        document_dir = self._document_dir(document_id)
+        document_dir.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp_path, document_dir / ORIGINAL_FILE)
+        _write_atomic(document_dir / CONTENT_FILE, content.encode("utf-8"))
+        # 重新上传后之前的处理结果失效
+        (document_dir / PROCESSED_FILE).unlink(missing_ok=True)
+        self._clear_derived(document_id)
+        self._write_meta(record)
+        disk_size = self._measure(document_id)
+
+        with self._lock:
+            self._drop_text((document_id, PROCESSED_FILE))
+            self._records[document_id] = record
+            documents = self._sessions.setdefault(session_id, OrderedDict())
+            documents[document_id] = None
+            documents.move_to_end(document_id)
+            self._recent[document_id] = None
+            self._recent.move_to_end(document_id)
+            self._set_disk_size(document_id, disk_size)
+            self._cache_text((document_id, CONTENT_FILE), content)
+            evicted = []
+            while len(documents) > self.session_quota:
+                oldest = next(iter(documents))
+                self._unlink_record(oldest)
+                evicted.append(oldest)
+        self._remove_dirs(evicted, f"会话 {session_id} 超出文档配额")
+        self._remove_dirs(self._evict_over_limits(keep=document_id))
+        return record
+
+    def _unlink_record(self, document_id: str) -> None:
+        """从所有索引中移除文档，调用方需持有锁"""
+        record = self._records.pop(document_id, None)
+        if record is not None:
+            documents = self._sessions.get(record.session_id)
+            if documents is not None:
+                documents.pop(document_id, None)
+                if not documents:
+                    self._sessions.pop(record.session_id, None)
+        self._recent.pop(document_id, None)
+        self._disk_bytes -= self._disk_sizes.pop(document_id, 0)
+        self._drop_text((document_id, CONTENT_FILE))
+        self._drop_text((document_id, PROCESSED_FILE))
+
+    def get(self, document_id: Optional[str]) -> Optional[DocumentRecord]:
+        """按文档ID查找文档"""
+        if not document_id:
+            return None
+        return self._records.get(str(document_id))
+
+    def latest(self, session_id: str) -> Optional[DocumentRecord]:
+        """返回会话最近上传的文档"""
+        with self._lock:
+            documents = self._sessions.get(session_id)
+            if not documents:
+                return None
+            return self._records.get(next(reversed(documents)))
+
+    def resolve(self, session_id: str, document_id: Optional[str] = None) -> Optional[DocumentRecord]:
+        """有文档ID时按ID查找会话中的文档，否则返回会话最近上传的文档
+
+        文档属于其他会话时返回None，持有其他会话的文档ID也无法访问该文档。
+        """
+        if document_id:
+            record = self.get(document_id)
+            if record is None or record.session_id != session_id:
+                return None
+        else:
+            record = self.latest(session_id)
+        if record is not None:
+            with self._lock:
+                self._touch(record.document_id)
+        return record
+
+    def list(self, session_id: str) -> List[DocumentRecord]:
+        """按上传顺序列出会话的文档"""
+        with self._lock:
+            return [self._records[document_id] for document_id in self._sessions.get(session_id, ())]
+
+    def get_content(self, document_id: str) -> Optional[str]:
+        """读取从文档中提取的原始文本"""
+        return self._read_text(document_id, CONTENT_FILE)
+
+    def get_processed(self, document_id: str) -> Optional[str]:
+        """读取处理后的文本，没有处理结果时返回None"""
+        record = self.get(document_id)
+        if record is None or not record.has_processed:
+            return None
+        return self._read_text(document_id, PROCESSED_FILE)
+
+    def get_latest_text(self, document_id: str) -> Optional[str]:
+        """读取处理后的文本，没有处理结果时返回原始文本"""
+        processed = self.get_processed(document_id)
+        return processed if processed is not None else self.get_content(document_id)
+
+    def set_processed(self, document_id: str, text: str) -> bool:
+        """保存处理后的文本，返回文档是否存在"""
+        record = self.get(document_id)
+        if record is None or text is None:
+            return False
+        try:
+            _write_atomic(self._document_dir(document_id) / PROCESSED_FILE, text.encode("utf-8"))
+            self._clear_derived(document_id)
+            with self._lock:
+                record.has_processed = True
+                self._cache_text((document_id, PROCESSED_FILE), text)
+            self._write_meta(record)
+        except FileNotFoundError:
+            # 文档在写入期间被删除
+            return False
+        disk_size = self._measure(document_id)
+        with self._lock:
+            if document_id in self._records:
+                self._set_disk_size(document_id, disk_size)
+        self._remove_dirs(self._evict_over_limits(keep=document_id))
+        return True
+
+    def _clear_derived(self, document_id: str) -> None:
+        for path in self._document_dir(document_id).glob(f"{DERIVED_PREFIX}*"):
+            path.unlink(missing_ok=True)
+
+    def derived_path(self, document_id: str, name: str) -> Optional[Path]:
+        """生成文件的保存路径，文件名中应包含输入内容的哈希，避免使用过期的结果"""
+        if self.get(document_id) is None:
+            return None
+        return self._document_dir(document_id) / f"{DERIVED_PREFIX}{name}"
+
+    def original_path(self, document_id: str) -> Optional[Path]:
+        """原始上传文件在磁盘上的路径"""
+        if self.get(document_id) is None:
+            return None
+        return self._document_dir(document_id) / ORIGINAL_FILE
+
+    def remove(self, session_id: str, document_id: str) -> bool:
+        """删除会话中的文档及其磁盘文件，文档不存在或属于其他会话时返回False"""
+        with self._lock:
+            record = self._records.get(document_id)
+            if record is None or record.session_id != session_id:
+                return False
+            self._unlink_record(document_id)
+        shutil.rmtree(self._document_dir(document_id), ignore_errors=True)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "documents": len(self._records),
+                "sessions": len(self._sessions),
+                "disk_bytes": self._disk_bytes,
+                "max_disk_bytes": self.max_disk_bytes,
+                "memory_entries": len(self._texts),
+                "memory_bytes": self._memory_bytes,
+                "max_memory_bytes": self.max_memory_bytes,
+                "memory_hits": self.memory_hits,
+                "disk_reads": self.disk_reads,
+            }
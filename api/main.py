@@ -18,16 +18,26 @@ from my_agent.utils.shared.intent_classifier import IntentClassifier
 from langchain_openai import ChatOpenAI
 import os
 from dotenv import load_dotenv
-import re
+import time
 import asyncio
-from io import BytesIO
 from datetime import datetime
 from pathlib import Path
-# 从my_agent.agent_tools导入CSC和调用MCP的方法
-from my_agent.agent_tools import csc as mcp_csc, call_mcp_service
+# 从my_agent.agent_tools导入CSC和调用MCP的方法（异步版本，不阻塞事件循环）
+from my_agent.agent_tools import csc_async as mcp_csc_async, call_mcp_service_async
+from my_agent.csc_pipeline import correct_document_async, iter_document_correction
+from my_agent.utils.mcp_pool import shutdown_async_pools
+from my_agent.utils.shared.correction_cache import get_correction_cache
+from my_agent.utils.shared.docx_writer import get_render_cache, render_key, text_to_docx_bytes
+from my_agent.utils.shared.docx_patcher import DocxPatchError, patch_docx
+from my_agent.utils.shared.embedding_provider import EMBEDDING_WARMUP, get_embedding_provider
+from starlette.concurrency import run_in_threadpool
+from api.storage import SQLiteRecordStore
+from api.repository import RecordRepository
+from api.document_store import DocumentStore
+from api.upload import UploadSizeLimitMiddleware, UploadTooLarge, check_upload_size, ingest_docx
+from api.session import SessionCookieMiddleware, session_id_of
 # 直接导入完整的模块以便于调试
 import my_agent.agent_tools
-from docx import Document
 
 # 定义存储文件路径
 DATA_DIR = Path(__file__).parent / "data"
@@ -37,67 +47,174 @@ FILE_LIST_FILE = DATA_DIR / "file_list.json"
 # 确保数据目录存在
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 
-# 全局变量，用于存储最近上传的文档
-last_uploaded_document = None
-# 全局变量，用于存储当前文件列表
-file_list = []
+# 上传的文档按会话和文档ID保存，原始文件和文本保存在磁盘上
+DOCUMENT_DIR = os.getenv("DOCUMENT_DIR", str(DATA_DIR / "documents"))
+document_store = DocumentStore(DOCUMENT_DIR)
 # 全局变量，记录用户会话是否进入强制公文纠错模式
 forced_correction_mode = {}
-# 全局变量，存储聊天历史记录
-chat_list = []
-# 全局变量存储处理后的文档
-last_uploaded_document = None
-# 全局变量存储聊天历史
-chat_list = []
-# 全局变量存储文件历史记录
-file_history_list = []
-
-# 保存聊天历史的文件路径
+
+# 旧版聊天历史JSON文件路径，启动时导入到聊天记录存储
 CHAT_HISTORY_FILE = "chat_history.json"
-# 保存文件历史记录的文件路径
+# 聊天记录存储（SQLite），每次增删改只写入一行
+CHAT_STORE_DB = os.getenv("CHAT_STORE_DB", str(DATA_DIR / "chat_store.sqlite3"))
+chat_store = SQLiteRecordStore(CHAT_STORE_DB, "chats")
+# 聊天记录仓库，按id和userid建立内存索引
+chat_repo = RecordRepository(chat_store)
+# 旧版文件历史记录JSON文件路径，启动时导入到文件历史存储
 FILE_HISTORY_FILE = "file_history.json"
+FILE_HISTORY_DB = os.getenv("FILE_HISTORY_DB", str(DATA_DIR / "file_history.sqlite3"))
+file_history_store = SQLiteRecordStore(FILE_HISTORY_DB, "file_history")
+file_history_repo = RecordRepository(file_history_store)
 
-# 加载聊天历史
-def load_chat_history():
-    global chat_list
+def get_session_id(request: Request) -> str:
+    """确定文档所属的会话：请求头中的会话ID，否则使用会话Cookie（见api/session.py）"""
+    session_id = session_id_of(request)
+    if not session_id:
+        raise HTTPException(status_code=400, detail="缺少会话ID")
+    return f"session_{session_id}"
+
+def document_payload(record, message: str = "文档上传成功，请在聊天框中输入处理指令"):
+    """/api/upload-document 返回的文档信息"""
+    content = document_store.get_content(record.document_id)
+    return {
+        "document_id": record.document_id,
+        "content": content,
+        "original_content": content,
+        "filename": record.filename,
+        "message": message
+    }
+
+def get_page_params(body: Optional[Dict[str, Any]]):
+    """从请求体中读取分页参数，未提供limit和cursor时返回全部记录
+
+    Raises:
+        ValueError: limit不是正整数、offset不是整数，或cursor不是上一页返回的next_cursor
+    """
+    body = body or {}
+    limit = body.get('limit')
+    cursor = body.get('cursor')
+    offset = body.get('offset') or 0
     try:
-        if os.path.exists(CHAT_HISTORY_FILE):
-            with open(CHAT_HISTORY_FILE, "r", encoding="utf-8") as f:
-                chat_list = json.load(f)
-                print(f"从文件加载聊天历史，共 {len(chat_list)} 条记录")
-    except Exception as e:
-        print(f"加载聊天历史出错: {str(e)}")
-        chat_list = []
+        limit = int(limit) if limit is not None else None
+        offset = int(offset)
+    except (TypeError, ValueError):
+        raise ValueError("limit和offset必须是整数")
+    if limit is not None and limit < 1:
+        raise ValueError("limit必须大于0")
+    cursor = str(cursor) if cursor else None
+    if cursor is not None and not (cursor.isascii() and cursor.isdigit()):
+        raise ValueError(f"无效的cursor: {cursor}")
+    return limit, cursor, max(0, offset)
+
+def list_response(repo: RecordRepository, body: Optional[Dict[str, Any]], msg: str):
+    """按userid和分页参数列出记录，分页时返回next_cursor"""
+    body = body or {}
+    limit, cursor, offset = get_page_params(body)
+    userid = body.get('userid')
+    items, next_cursor = repo.list(userid, limit=limit, cursor=cursor, offset=offset)
+    response = {
+        "code": 200,
+        "data": items,
+        "msg": msg
+    }
+    if limit is not None or cursor:
+        response["next_cursor"] = next_cursor
+    return response
+
+DOCX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+# 预览和下载的生成方式：patch在原始文档上写回处理结果，保留原有格式；regenerate按纯文本重新生成
+DOCX_OUTPUT_MODE = os.getenv("DOCX_OUTPUT_MODE", "patch")
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """检查请求头If-None-Match是否包含当前ETag"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
 
-# 保存聊天历史到文件
-def save_chat_history():
+async def docx_response(request: Request, text: str, content_disposition: str) -> Response:
+    """把文本生成docx返回，按内容哈希缓存生成结果，内容未变化时返回304"""
+    etag = f'"{render_key(text)}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    _, doc_bytes = await run_in_threadpool(get_render_cache().render, text)
+    headers["Content-Disposition"] = content_disposition
+    return Response(content=doc_bytes, media_type=DOCX_MEDIA_TYPE, headers=headers)
+
+def build_patched_docx(document_id: str, text: str, key: str) -> Optional[Path]:
+    """在原始文档上写回处理结果，结果文件按内容哈希保存在文档目录中，无法写回时返回None"""
+    path = document_store.derived_path(document_id, f"patched_{key[:16]}.docx")
+    original = document_store.original_path(document_id)
+    if path is None or original is None:
+        return None
+    if path.exists():
+        return path
+    tmp_path = None
     try:
-        with open(CHAT_HISTORY_FILE, "w", encoding="utf-8") as f:
-            json.dump(chat_list, f, ensure_ascii=False, indent=2)
-            print(f"聊天历史已保存到文件，共 {len(chat_list)} 条记录")
-    except Exception as e:
-        print(f"保存聊天历史出错: {str(e)}")
+        # 同一结果可能被并发请求同时生成，各自写入唯一的临时文件，再原子替换为结果文件
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".", suffix=".tmp")
+        with os.fdopen(fd, "wb") as output, open(original, "rb") as source:
+            result = patch_docx(source, text, output)
+        os.replace(tmp_path, path)
+        print(f"已在原始文档上修改{result.changed_paragraphs}/{result.total_paragraphs}个段落")
+        return path
+    except (DocxPatchError, OSError) as e:
+        print(f"无法在原始文档上写回处理结果，改为重新生成: {str(e)}")
+        if tmp_path is not None:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+        return None
 
-# 加载文件历史记录
-def load_file_history():
-    global file_history_list
+async def document_docx_response(request: Request, document, content_disposition: str,
+                                 mode: Optional[str] = None) -> Response:
+    """返回文档的docx：优先在原始文档上写回处理结果，失败时按纯文本重新生成"""
+    if (mode or DOCX_OUTPUT_MODE) == "patch" and document.filename.lower().endswith(".docx"):
+        text = None
+        if document.has_processed:
+            text = await run_in_threadpool(document_store.get_processed, document.document_id)
+        marker = "original" if text is None else f"processed\0{text}"
+        key = render_key(f"patch\0{document.document_id}\0{marker}")
+        etag = f'"{key}"'
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers=headers)
+        if text is None:
+            # 没有处理结果时直接返回上传的原始文件
+            path = document_store.original_path(document.document_id)
+        else:
+            path = await run_in_threadpool(build_patched_docx, document.document_id, text, key)
+        if path is not None and path.exists():
+            headers["Content-Disposition"] = content_disposition
+            return FileResponse(path, media_type=DOCX_MEDIA_TYPE, headers=headers)
+
+    content = await run_in_threadpool(document_store.get_latest_text, document.document_id)
+    return await docx_response(request, content, content_disposition)
+
+# 加载聊天历史：首次启动时把旧版JSON文件导入聊天记录存储
+def load_chat_history():
     try:
-        if os.path.exists(FILE_HISTORY_FILE):
-            with open(FILE_HISTORY_FILE, "r", encoding="utf-8") as f:
-                file_history_list = json.load(f)
-                print(f"从文件加载文件历史记录，共 {len(file_history_list)} 条记录")
+        migrated = chat_store.migrate_from_json(CHAT_HISTORY_FILE)
+        if migrated:
+            print(f"已从 {CHAT_HISTORY_FILE} 导入 {migrated} 条聊天记录")
+        chat_repo.reload()
+        print(f"聊天记录存储共 {len(chat_repo)} 条记录")
     except Exception as e:
-        print(f"加载文件历史记录出错: {str(e)}")
-        file_history_list = []
+        print(f"加载聊天历史出错: {str(e)}")
 
-# 保存文件历史记录到文件
-def save_file_history():
+# 加载文件历史记录：首次启动时把旧版JSON文件导入文件历史存储
+def load_file_history():
     try:
-        with open(FILE_HISTORY_FILE, "w", encoding="utf-8") as f:
-            json.dump(file_history_list, f, ensure_ascii=False, indent=2)
-            print(f"文件历史记录已保存到文件，共 {len(file_history_list)} 条记录")
+        migrated = file_history_store.migrate_from_json(FILE_HISTORY_FILE)
+        if migrated:
+            print(f"已从 {FILE_HISTORY_FILE} 导入 {migrated} 条文件历史记录")
+        file_history_repo.reload()
+        print(f"文件历史记录存储共 {len(file_history_repo)} 条记录")
     except Exception as e:
-        print(f"保存文件历史记录出错: {str(e)}")
+        print(f"加载文件历史记录出错: {str(e)}")
 
 # 首先创建FastAPI应用实例
 app = FastAPI(title="文档处理API")
@@ -110,6 +227,36 @@ async def startup_event():
     # 初始化时加载文件历史记录
     load_file_history()
     print("应用启动，已加载聊天历史和文件历史记录")
+    # 在后台加载检索用的嵌入模型，第一个检索请求不需要等待
+    if EMBEDDING_WARMUP:
+        get_embedding_provider().warmup()
+
+# 应用关闭时回收MCP工作进程
+@app.on_event("shutdown")
+async def shutdown_event():
+    await shutdown_async_pools()
+
+class ClientDisconnected(Exception):
+    """HTTP客户端在等待结果期间断开了连接"""
+
+async def run_unless_disconnected(request: Request, awaitable, poll_interval: float = 0.5):
+    """等待awaitable完成，期间客户端断开连接则取消它并抛出ClientDisconnected
+    
+    仅用于普通（非流式）接口；流式接口在客户端断开时由StreamingResponse直接取消生成器。
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                print("客户端已断开连接，取消正在进行的纠错调用")
+                task.cancel()
+                raise ClientDisconnected()
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
 
 # 配置CORS
 app.add_middleware(
@@ -120,6 +267,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 没有会话请求头和会话Cookie的请求生成新的会话，文档按会话隔离
+app.add_middleware(SessionCookieMiddleware)
+
+# 上传接口的请求体大小限制，超过MAX_UPLOAD_BYTES时返回413
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    paths=["/api/upload-document", "/api/process-document", "/file/upload", "/api/upload"],
+)
+
 # 定义临时文件路径
 TEMP_DIR = tempfile.gettempdir()
 
@@ -156,6 +312,28 @@ except Exception as e:
     # 备用配置，使用最基本的设置
     llm = ChatOpenAI(model="deepseek-chat")
 
+async def astream_llm(messages):
+    """使用ChatOpenAI.astream逐个产出模型生成的文本片段
+    
+    每次产出 (chunk_text, ttft_ms)，ttft_ms 仅在第一个非空片段上给出首字延迟（毫秒），其余为None。
+    """
+    start_time = time.perf_counter()
+    first_token = True
+    async for chunk in llm.astream(messages):
+        text = chunk.content
+        if not text:
+            continue
+        ttft_ms = None
+        if first_token:
+            first_token = False
+            ttft_ms = round((time.perf_counter() - start_time) * 1000, 1)
+            print(f"LLM首字延迟: {ttft_ms} ms")
+        yield text, ttft_ms
+
+def sse_event(payload: dict) -> str:
+    """构造一条SSE数据事件"""
+    return f"data: {json.dumps(payload)}\n\n"
+
 # 闲聊计数器 - 全局变量
 chat_counter = {}
 
@@ -169,6 +347,7 @@ class ChatRequest(BaseModel):
     message: str
     document_content: str = None  # 新增文档内容字段
     chat_history: list = []
+    file_id: str = None  # 指定处理的文档ID，未指定时使用会话最近上传的文档
 
 class ChatResponse(BaseModel):
     response: str
@@ -203,7 +382,7 @@ def read_root():
 @app.get("/api/health-check")
 async def health_check():
     """健康检查端点"""
-    return {"status": "ok", "message": "Service is running"}
+    return {"status": "ok", "message": "Service is running", "embedding": get_embedding_provider().status()}
 
 # 添加简单的登录API端点
 @app.post("/api/login", response_model=LoginResponse)
@@ -232,49 +411,38 @@ async def login(login_request: LoginRequest):
 
 # 修改文档上传函数，添加对file为None的处理
 @app.post("/api/upload-document")
-async def upload_document(file: UploadFile = None):
+async def upload_document(request: Request, file: UploadFile = None):
     """上传Word文档并返回内容，不进行处理"""
-    # 存储最近上传的文档内容
-    global last_uploaded_document
+    session_id = get_session_id(request)
     
-    # 如果file为None，返回上次上传的文档内容
+    # 如果file为None，返回当前会话上次上传的文档内容
     if file is None:
-        if not last_uploaded_document:
+        record = document_store.latest(session_id)
+        if not record:
             raise HTTPException(status_code=404, detail="没有已上传的文档")
-        return last_uploaded_document
+        return document_payload(record)
     
     if not file.filename.endswith(('.docx')):
         raise HTTPException(status_code=400, detail="只支持.docx格式文件")
     
     try:
-        # 读取文件内容到内存
-        file_content = await file.read()
-        
-        # 直接从内存流读取文档，避免临时文件I/O开销
-        content = DocProcessor.load_doc_stream(file_content, file.filename)
+        check_upload_size(file.size)
         
-        # 生成唯一文档ID
-        document_id = str(hash(content + file.filename))
+        # 直接从上传的临时文件读取文档，在线程池中提取文本并保存到当前会话的文档存储
+        record, content = await run_in_threadpool(ingest_docx, document_store, session_id, file.filename, file.file)
         
-        # 保存最近上传的文档
-        last_uploaded_document = {
-            "document_id": document_id,
-            "content": content,
-            "original_content": content,
-            "filename": file.filename,
-            "message": "文档上传成功，请在聊天框中输入处理指令"
-        }
-        
-        return last_uploaded_document
+        return document_payload(record)
         
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         print(f"处理文档时出错: {str(e)}")
         raise HTTPException(status_code=500, detail=f"处理文档时出错: {str(e)}")
 
 @app.post("/api/process-document", deprecated=True)
-async def process_document_api(file: UploadFile = File(...)):
+async def process_document_api(request: Request, file: UploadFile = File(...)):
     """上传并处理Word文档 (已弃用，保留兼容)"""
-    return await upload_document(file)
+    return await upload_document(request, file)
 
 # 修改聊天接口，处理带有文档内容的请求
 @app.post("/api/chat", response_model=ChatResponse)
@@ -286,11 +454,12 @@ async def chat_endpoint(chat_request: ChatRequest, request: Request):
         # 准备消息历史
         messages = chat_request.chat_history.copy()
         
-        # 检查是否有文档内容，如果没有，尝试从最近上传的文档中获取
+        # 检查是否有文档内容，如果没有，尝试从当前会话上传的文档中获取
         document_content = chat_request.document_content
-        if (document_content is None or document_content.strip() == "") and last_uploaded_document:
-            document_content = last_uploaded_document["content"]
-            print(f"使用最近上传的文档内容，长度: {len(document_content)}")
+        document = document_store.resolve(get_session_id(request), chat_request.file_id)
+        if (document_content is None or document_content.strip() == "") and document:
+            document_content = document_store.get_content(document.document_id)
+            print(f"使用最近上传的文档内容，长度: {len(document_content or '')}")
         
         has_document = document_content is not None and document_content.strip() != ""
         
@@ -348,7 +517,7 @@ async def chat_endpoint(chat_request: ChatRequest, request: Request):
             print("使用MCP协议的CSC服务处理文档...")
             
             # 调用MCP服务进行文档纠错
-            csc_result = mcp_csc(document_content)
+            csc_result = await run_unless_disconnected(request, correct_document_async(document_content))
             
             if csc_result["status"] == "success":
                 # 获取处理后的文档内容
@@ -366,9 +535,9 @@ async def chat_endpoint(chat_request: ChatRequest, request: Request):
                 success_message = f"已完成文档纠错。{processing_message}"
                 messages.append({"role": "assistant", "content": success_message})
                 
-                # 保存处理后的文档到全局变量
-                if last_uploaded_document:
-                    last_uploaded_document["processed_content"] = processed_document
+                # 保存处理后的文档
+                if document:
+                    await run_in_threadpool(document_store.set_processed, document.document_id, processed_document)
                 
                 # 返回处理结果和更新后的聊天历史
                 return {
@@ -396,7 +565,7 @@ async def chat_endpoint(chat_request: ChatRequest, request: Request):
             
             # 调用模型处理文档
             print("转为调用大语言模型处理文档...")
-            response = llm.invoke(doc_messages)
+            response = await llm.ainvoke(doc_messages)
             
             # 将用户消息添加到聊天历史
             messages.append({"role": "user", "content": chat_request.message})
@@ -405,9 +574,9 @@ async def chat_endpoint(chat_request: ChatRequest, request: Request):
             fallback_message = "MCP服务暂时不可用，已使用备用方法处理您的文档。处理结果已显示在中间区域。"
             messages.append({"role": "assistant", "content": fallback_message})
             
-            # 保存处理后的文档到全局变量
-            if last_uploaded_document:
-                last_uploaded_document["processed_content"] = response.content
+            # 保存处理后的文档
+            if document:
+                await run_in_threadpool(document_store.set_processed, document.document_id, response.content)
             
             # 返回处理结果和更新后的聊天历史
             return {
@@ -433,7 +602,7 @@ async def chat_endpoint(chat_request: ChatRequest, request: Request):
             
             try:
                 # 调用模型生成回复
-                response = llm.invoke(full_messages)
+                response = await llm.ainvoke(full_messages)
                 
                 # 添加助手回复到历史
                 messages.append({"role": "assistant", "content": response.content})
@@ -455,6 +624,8 @@ async def chat_endpoint(chat_request: ChatRequest, request: Request):
                     "processed_document": None
             }
             
+    except ClientDisconnected:
+        return Response(status_code=499)
     except Exception as e:
         print(f"Chat endpoint error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"处理聊天请求时出错: {str(e)}")
@@ -515,44 +686,36 @@ async def stream_chat(request: Request, message: str, document_content: str = No
             # 准备聊天消息
             messages = history.copy()
             
-            # 检查是否有文档内容，如果没有，尝试从last_uploaded_document获取
-            global last_uploaded_document, forced_correction_mode, file_list
+            # 检查是否有文档内容，如果没有，从文档存储中获取
+            global forced_correction_mode
             has_document = False
             input_text_for_correction = None
+            # 有file_id时按ID查找文档，否则使用当前会话最近上传的文档
+            document = document_store.resolve(get_session_id(request), file_id)
             
             # 优先使用传递的document_content参数
             if document_content and document_content.strip():
                 processed_doc_content = document_content
                 has_document = True
                 print(f"使用传递的document_content，长度: {len(processed_doc_content)}")
-            # 如果有file_id参数，通过ID查找文件
-            elif file_id:
-                print(f"通过file_id查找文档: {file_id}")
-                # 在file_list中查找匹配的文件
-                matching_file = next((f for f in file_list if str(f["id"]) == file_id), None)
-                
-                if matching_file and last_uploaded_document and last_uploaded_document.get("document_id") == file_id:
-                    processed_doc_content = last_uploaded_document.get("content", "")
-                    has_document = processed_doc_content and processed_doc_content.strip() != ""
-                    print(f"通过file_id找到文档，长度: {len(processed_doc_content) if has_document else 0}")
-                else:
-                    print(f"找不到匹配file_id的文档内容: {file_id}")
-                    processed_doc_content = ""
-            # 否则检查全局变量
-            elif last_uploaded_document:
-                processed_doc_content = last_uploaded_document.get("content", "")
-                has_document = processed_doc_content and processed_doc_content.strip() != ""
-                print(f"使用last_uploaded_document中的内容，长度: {len(processed_doc_content) if has_document else 0}")
+            elif document:
+                processed_doc_content = document_store.get_content(document.document_id) or ""
+                has_document = processed_doc_content.strip() != ""
+                print(f"使用文档{document.document_id}的内容，长度: {len(processed_doc_content)}")
             else:
+                if file_id:
+                    print(f"找不到匹配file_id的文档内容: {file_id}")
+                else:
+                    print("没有找到文档内容")
                 processed_doc_content = ""
-                print("没有找到文档内容")
             
             # 获取客户端IP地址作为会话ID
             client_ip = request.client.host
             session_id = f"session_{client_ip}"
             
             # 进行意图分类
-            intent = IntentClassifier.classify(message)
+            analysis = IntentClassifier.analyze(message)
+            intent = analysis.intent
             print(f"聊天意图分类结果: {intent}")
             
             # 检查是否处于强制公文纠错模式
@@ -591,32 +754,11 @@ async def stream_chat(request: Request, message: str, document_content: str = No
             
             # 根据意图处理请求
             if intent in ["correction", "writing", "recorrection", "forced_correction"]:
-                # 检查消息中是否包含需要直接纠错的文本
-                # 检查常见的模式，如"对下面的句子进行公文纠错："、"帮我纠错："等
-                correction_patterns = [
-                    r"对.*句子.*纠错[:：](.+)",
-                    r"纠错[:：](.+)",
-                    r"润色[:：](.+)",
-                    r"修改[:：](.+)",
-                    r"公文纠错[:：](.+)",
-                    r"请.*公文纠错[:：](.+)",  # 添加新模式匹配"请进行公文纠错："
-                    r"进行.*纠错[:：](.+)",     # 添加新模式匹配"进行公文纠错："
-                    r"请.*纠错[:：](.+)"        # 添加新模式匹配"请纠错："
-                ]
-                
-                # 添加详细日志，记录每个模式的匹配结果
-                print(f"尝试匹配文本提取模式，原始消息: '{message}'")
-                extracted_text = None
-                
-                for pattern in correction_patterns:
-                    match = re.search(pattern, message, re.DOTALL)
-                    if match:
-                        extracted_text = match.group(1).strip()
-                        print(f"✓ 成功匹配模式 '{pattern}'，提取文本: '{extracted_text}'")
-                        input_text_for_correction = extracted_text
-                        break
-                    else:
-                        print(f"✗ 模式 '{pattern}' 不匹配")
+                # 检查消息中是否包含需要直接纠错的文本，如"对下面的句子进行公文纠错："、"帮我纠错："等
+                extracted_text = analysis.payload
+                if extracted_text:
+                    print(f"从消息中提取到待纠错文本: '{extracted_text}'")
+                    input_text_for_correction = extracted_text
                 
                 # 如果没有从模式中提取到文本，检查是否应该使用整个消息
                 if not input_text_for_correction and not has_document and len(message) > 15 and "上传" not in message and "文档" not in message:
@@ -632,7 +774,7 @@ async def stream_chat(request: Request, message: str, document_content: str = No
                     # 使用MCP CSC服务处理文本
                     print("调用MCP CSC服务处理文本...")
                     try:
-                        csc_result = mcp_csc(input_text_for_correction)
+                        csc_result = await mcp_csc_async(input_text_for_correction)
                         print(f"MCP CSC服务返回结果: {csc_result.get('status', 'unknown')}")
                         
                         if csc_result["status"] == "success":
@@ -659,16 +801,25 @@ async def stream_chat(request: Request, message: str, document_content: str = No
                         
                         try:
                             print("调用DeepSeek LLM处理文本...")
-                            response = llm.invoke(doc_messages)
-                            corrected_text = response.content
+                            # 边生成边推送，先发送说明文字，再逐段转发模型输出
+                            yield sse_event({'content': "已使用DeepSeek AI大模型处理您的文本。\n\n"})
+                            streamed_chunks = []
+                            async for token, ttft_ms in astream_llm(doc_messages):
+                                streamed_chunks.append(token)
+                                event = {'content': token}
+                                if ttft_ms is not None:
+                                    event['ttft_ms'] = ttft_ms
+                                yield sse_event(event)
+                            corrected_text = "".join(streamed_chunks)
                             print("LLM处理文本成功")
-                            result_message = f"已使用DeepSeek AI大模型处理您的文本。\n\n{corrected_text}"
+                            result_message = None
                         except Exception as llm_error:
                             print(f"LLM调用失败: {str(llm_error)}")
                             corrected_text = input_text_for_correction
                             result_message = f"处理失败: {str(llm_error)}。返回原始文本。"
                     
-                    yield f"data: {json.dumps({'content': result_message})}\n\n"
+                    if result_message:
+                        yield f"data: {json.dumps({'content': result_message})}\n\n"
                     
                 # 情况2: 需要处理上传的文档
                 elif not has_document:
@@ -681,10 +832,21 @@ async def stream_chat(request: Request, message: str, document_content: str = No
                     # 发送处理状态
                     yield f"data: {json.dumps({'content': '正在处理文档...'})}\n\n"
                     
-                    # 使用MCP CSC服务处理文档
+                    # 使用MCP CSC服务分片并发处理文档，每完成一个片段推送一次进度
                     print("调用MCP CSC服务处理文档...")
                     try:
-                        csc_result = mcp_csc(processed_doc_content)
+                        csc_result = None
+                        async for event in iter_document_correction(processed_doc_content):
+                            if event["type"] == "progress":
+                                yield sse_event({'content': '', 'progress': {
+                                    'index': event['index'],
+                                    'completed': event['completed'],
+                                    'total': event['total'],
+                                    'text': event['text'],
+                                    'modified': event['modified'],
+                                }})
+                            else:
+                                csc_result = event["result"]
                         print(f"MCP CSC服务返回结果: {csc_result.get('status', 'unknown')}")
                         
                         if csc_result["status"] == "success":
@@ -713,14 +875,17 @@ async def stream_chat(request: Request, message: str, document_content: str = No
                         
                         try:
                             print("调用DeepSeek LLM处理文档...")
-                            response = llm.invoke(doc_messages)
-                            processed_doc = response.content
+                            # 处理后的文档逐段通过processed_document_chunk推送，结束时再发送完整结果
+                            streamed_chunks = []
+                            async for token, ttft_ms in astream_llm(doc_messages):
+                                streamed_chunks.append(token)
+                                event = {'content': '', 'processed_document_chunk': token}
+                                if ttft_ms is not None:
+                                    event['ttft_ms'] = ttft_ms
+                                yield sse_event(event)
+                            processed_doc = "".join(streamed_chunks)
                             print("LLM处理文档成功")
                             
-                            # 保存处理后的文档内容
-                            if last_uploaded_document:
-                                last_uploaded_document["processed_content"] = processed_doc
-                            
                             # 发送处理结果
                             processing_message = "已使用DeepSeek AI大模型处理您的文档。处理结果已显示在中间区域。"
                         except Exception as llm_error:
@@ -729,8 +894,8 @@ async def stream_chat(request: Request, message: str, document_content: str = No
                             processing_message = f"处理失败: {str(llm_error)}。返回原始文档内容。"
                     
                     # 保存处理后的文档内容
-                    if last_uploaded_document:
-                        last_uploaded_document["processed_content"] = processed_doc
+                    if document:
+                        await run_in_threadpool(document_store.set_processed, document.document_id, processed_doc)
                     
                     # 发送处理结果
                     yield f"data: {json.dumps({'content': processing_message, 'processed_document': processed_doc})}\n\n"
@@ -754,18 +919,16 @@ async def stream_chat(request: Request, message: str, document_content: str = No
                 # 调用模型
                 try:
                     print("调用DeepSeek LLM生成聊天回复...")
-                    response = llm.invoke(full_messages)
-                    assistant_response = response.content
+                    # 模型每生成一段就立即转发给前端，首个事件附带首字延迟ttft_ms
+                    streamed_chunks = []
+                    async for token, ttft_ms in astream_llm(full_messages):
+                        streamed_chunks.append(token)
+                        event = {'content': token}
+                        if ttft_ms is not None:
+                            event['ttft_ms'] = ttft_ms
+                        yield sse_event(event)
+                    assistant_response = "".join(streamed_chunks)
                     print(f"LLM生成回复成功: {assistant_response[:50]}..." if len(assistant_response) > 50 else f"LLM生成回复成功: {assistant_response}")
-                    
-                    # 模拟流式响应，将回复分成多个部分发送
-                    words = assistant_response.split()
-                    chunk_size = max(1, len(words) // 10)  # 分成大约10个部分发送
-                    
-                    for i in range(0, len(words), chunk_size):
-                        chunk = " ".join(words[i:i+chunk_size])
-                        yield f"data: {json.dumps({'content': chunk})}\n\n"
-                        await asyncio.sleep(0.1)  # 轻微延迟模拟打字效果
                 except Exception as e:
                     print(f"调用LLM出错: {str(e)}")
                     error_message = f"处理您的请求时出错: {str(e)}。请稍后再试。"
@@ -785,47 +948,24 @@ async def stream_chat(request: Request, message: str, document_content: str = No
 
 # 添加前端路由适配
 @app.post("/file/upload")
-async def file_upload_adapter(file: UploadFile = File(...)):
+async def file_upload_adapter(request: Request, file: UploadFile = File(...)):
     """适配前端/file/upload请求，存储文件并返回标准格式响应"""
     try:
-        global last_uploaded_document, file_list
-        
         if not file.filename.endswith(('.docx')):
             raise HTTPException(status_code=400, detail="只支持.docx格式文件")
         
-        # 读取文件内容到内存
-        file_content = await file.read()
-        
-        # 使用DocProcessor处理文档
-        content = DocProcessor.load_doc_stream(file_content, file.filename)
-        
-        # 生成唯一文档ID
-        document_id = str(hash(content + file.filename))
+        check_upload_size(file.size)
         
-        # 重要：保存最近上传的文档（用于公文纠错）
-        # 这确保无论通过哪个接口上传，document_content都能被正确设置
-        last_uploaded_document = {
-            "document_id": document_id,
-            "content": content,
-            "original_content": content,
-            "filename": file.filename,
-            "message": "文档上传成功，请在聊天框中输入处理指令"
-        }
-        print(f"文档已上传并保存到last_uploaded_document，长度: {len(content)}")
-        
-        # 创建文件记录并添加到文件列表
-        file_item = {
-            "id": document_id,
-            "filename": file.filename,
-            "fileuuid": document_id,
-            "fileurl": "",
-            "updatetime": datetime.now().isoformat(),
-            "userid": "system"  # 可以从请求中获取，这里简化处理
-        }
+        # 使用DocProcessor在线程池中处理文档，直接读取上传的临时文件，不复制到内存
+        # 重要：保存到当前会话的文档存储（用于公文纠错）
+        # 这确保无论通过哪个接口上传，后续请求都能按file_id或会话找到文档
+        record, content = await run_in_threadpool(
+            ingest_docx, document_store, get_session_id(request), file.filename, file.file
+        )
+        print(f"文档已上传并保存，ID: {record.document_id}，长度: {len(content)}")
         
-        # 将文件添加到文件列表
-        if file_item not in file_list:
-            file_list.append(file_item)
+        # 创建文件记录
+        file_item = record.to_file_item()
         
         # 返回符合前端期望的响应格式
         return {
@@ -833,6 +973,12 @@ async def file_upload_adapter(file: UploadFile = File(...)):
             "data": file_item,
             "msg": "文件上传成功"
         }
+    except UploadTooLarge as e:
+        return JSONResponse(status_code=413, content={
+            "code": 413,
+            "data": None,
+            "msg": str(e)
+        })
     except Exception as e:
         print(f"文件上传处理出错: {str(e)}")
         return {
@@ -845,11 +991,10 @@ async def file_upload_adapter(file: UploadFile = File(...)):
 async def file_list_adapter(request: Request):
     """适配前端/file/list请求，返回文件列表"""
     try:
-        body = await request.json()
-        # 返回文件列表
+        # 返回当前会话上传的文件列表
         return {
             "code": 200,
-            "data": file_list,
+            "data": [record.to_file_item() for record in document_store.list(get_session_id(request))],
             "msg": "获取文件列表成功"
         }
     except Exception as e:
@@ -868,25 +1013,22 @@ async def chat_list_adapter(request: Request):
         try:
             body = await request.json()
             print(f"收到chat/list请求，参数: {body}")
-            # 根据userid过滤聊天列表
-            filtered_chats = chat_list
-            if body and 'userid' in body:
-                userid = body.get('userid')
-                filtered_chats = [chat for chat in chat_list if chat.get('userid') == userid]
         except json.JSONDecodeError:
             # 如果请求体为空或无效JSON，使用空字典
             body = {}
             print(f"收到chat/list请求，无参数")
-            filtered_chats = chat_list
         
-        # 返回过滤后的聊天列表
-        response = {
-            "code": 200,
-            "data": filtered_chats,
-            "msg": "获取聊天列表成功"
-        }
-        print(f"返回聊天列表响应: {response}")
+        # 根据userid过滤聊天列表（使用userid索引），支持limit/cursor/offset分页
+        response = list_response(chat_repo, body, "获取聊天列表成功")
+        print(f"返回聊天列表响应，共 {len(response['data'])} 条记录")
         return response
+    except ValueError as e:
+        # 分页参数无效
+        return {
+            "code": 400,
+            "data": [],
+            "msg": str(e)
+        }
     except Exception as e:
         print(f"获取聊天列表出错: {str(e)}")
         return {
@@ -911,21 +1053,16 @@ async def chat_create_adapter(request: Request):
                 "msg": "请求体格式不正确"
             }
         
-        # 将聊天数据添加到列表中
         chat_id = body.get('id')
-        # 检查是否已存在相同ID的聊天
-        existing_chat_index = next((i for i, chat in enumerate(chat_list) if chat.get('id') == chat_id), -1)
-        if existing_chat_index != -1:
-            # 更新现有聊天
-            chat_list[existing_chat_index] = body
-        else:
-            # 添加新聊天
-            chat_list.append(body)
-        
-        # 保存聊天历史到文件
-        save_chat_history()
+        if not chat_id:
+            return {
+                "code": 400,
+                "data": None,
+                "msg": "缺少必要的聊天ID字段"
+            }
         
-        print(f"当前聊天列表长度: {len(chat_list)}")
+        # 新增聊天，已存在相同ID的聊天则更新
+        await run_in_threadpool(chat_repo.upsert, body)
         
         # 直接返回传入的数据，表示创建成功
         response = {
@@ -965,18 +1102,9 @@ async def chat_update_adapter(request: Request):
         # 更新聊天列表中的数据
         chat_id = body.get('id')
         if chat_id:
-            existing_chat_index = next((i for i, chat in enumerate(chat_list) if chat.get('id') == chat_id), -1)
-            if existing_chat_index != -1:
-                # 更新现有聊天
-                chat_list[existing_chat_index] = body
-                print(f"已更新ID为{chat_id}的聊天")
-            else:
-                # 如果找不到，添加为新聊天
-                chat_list.append(body)
-                print(f"未找到ID为{chat_id}的聊天，已添加为新聊天")
-            
-            # 保存聊天历史到文件
-            save_chat_history()
+            # 更新现有聊天，如果找不到则添加为新聊天
+            await run_in_threadpool(chat_repo.upsert, body)
+            print(f"已更新ID为{chat_id}的聊天")
         
         # 直接返回传入的数据，表示更新成功
         return {
@@ -996,15 +1124,11 @@ async def chat_update_adapter(request: Request):
 async def chat_delete_adapter(id: str):
     """适配前端/chat/delete/{id}请求"""
     try:
-        # 查找并删除指定ID的聊天
-        global chat_list
-        original_length = len(chat_list)
-        chat_list = [chat for chat in chat_list if chat.get('id') != id]
+        # 删除指定ID的聊天
+        deleted = await run_in_threadpool(chat_repo.delete, id)
         
-        if len(chat_list) < original_length:
+        if deleted:
             print(f"已删除ID为{id}的聊天")
-            # 保存聊天历史到文件
-            save_chat_history()
         else:
             print(f"未找到ID为{id}的聊天")
         
@@ -1029,25 +1153,22 @@ async def file_history_adapter(request: Request):
         try:
             body = await request.json()
             print(f"收到file/history请求，参数: {body}")
-            # 根据userid过滤文件历史记录
-            filtered_history = file_history_list
-            if body and 'userid' in body:
-                userid = body.get('userid')
-                filtered_history = [file for file in file_history_list if file.get('userid') == userid]
         except json.JSONDecodeError:
             # 如果请求体为空或无效JSON，使用空字典
             body = {}
             print(f"收到file/history请求，无参数")
-            filtered_history = file_history_list
         
-        # 返回过滤后的文件历史记录
-        response = {
-            "code": 200,
-            "data": filtered_history,
-            "msg": "获取文件历史记录成功"
-        }
-        print(f"返回文件历史记录响应: {response}")
+        # 根据userid过滤文件历史记录（使用userid索引），支持limit/cursor/offset分页
+        response = list_response(file_history_repo, body, "获取文件历史记录成功")
+        print(f"返回文件历史记录响应，共 {len(response['data'])} 条记录")
         return response
+    except ValueError as e:
+        # 分页参数无效
+        return {
+            "code": 400,
+            "data": [],
+            "msg": str(e)
+        }
     except Exception as e:
         print(f"获取文件历史记录出错: {str(e)}")
         return {
@@ -1081,28 +1202,19 @@ async def add_to_history_adapter(request: Request):
                 "msg": "缺少必要的文件ID字段"
             }
         
-        # 查找是否已存在该文件的历史记录
-        global file_history_list
-        existing_index = next((i for i, file in enumerate(file_history_list) if file.get('id') == file_id), -1)
-        
         # 设置访问次数和最近访问时间
         if 'accessCount' not in body:
             body['accessCount'] = 1
         if 'lastAccessed' not in body:
             body['lastAccessed'] = datetime.now().isoformat()
         
-        if existing_index != -1:
-            # 更新现有记录
-            file_history_list[existing_index] = body
+        # 新增记录，已存在相同ID的记录则更新
+        existed = await run_in_threadpool(file_history_repo.upsert, body)
+        if existed:
             print(f"更新ID为{file_id}的文件历史记录")
         else:
-            # 添加新记录
-            file_history_list.append(body)
             print(f"添加ID为{file_id}的文件历史记录")
         
-        # 保存到文件
-        save_file_history()
-        
         # 返回更新后的文件记录
         return {
             "code": 200,
@@ -1121,15 +1233,11 @@ async def add_to_history_adapter(request: Request):
 async def remove_from_history_adapter(id: str):
     """从历史记录中删除文件"""
     try:
-        # 查找并删除指定ID的历史记录
-        global file_history_list
-        original_length = len(file_history_list)
-        file_history_list = [file for file in file_history_list if file.get('id') != id]
+        # 删除指定ID的历史记录
+        deleted = await run_in_threadpool(file_history_repo.delete, id)
         
-        if len(file_history_list) < original_length:
+        if deleted:
             print(f"已从历史记录中删除ID为{id}的文件")
-            # 保存到文件
-            save_file_history()
         else:
             print(f"未找到ID为{id}的文件历史记录")
         
@@ -1173,14 +1281,10 @@ async def clear_history_adapter(request: Request):
             }
         
         # 删除该用户的所有历史记录
-        global file_history_list
-        original_length = len(file_history_list)
-        file_history_list = [file for file in file_history_list if file.get('userid') != userid]
+        removed = await run_in_threadpool(file_history_repo.delete_by_user, userid)
         
-        if len(file_history_list) < original_length:
-            print(f"已清空用户{userid}的历史记录")
-            # 保存到文件
-            save_file_history()
+        if removed:
+            print(f"已清空用户{userid}的{removed}条历史记录")
         else:
             print(f"未找到用户{userid}的历史记录")
         
@@ -1199,9 +1303,10 @@ async def clear_history_adapter(request: Request):
         }
 
 @app.delete("/file/delete/{id}")
-async def file_delete_adapter(id: str):
+async def file_delete_adapter(id: str, request: Request):
     """适配前端文件删除请求"""
-    # 简单返回成功，可根据需要扩展实际删除逻辑
+    # 删除当前会话的文档及其磁盘文件，文档不存在时同样返回成功
+    await run_in_threadpool(document_store.remove, get_session_id(request), id)
     return {
         "code": 200,
         "data": None,
@@ -1209,53 +1314,41 @@ async def file_delete_adapter(id: str):
     }
 
 @app.get("/file/preview")
-async def file_preview_adapter(id: str):
+async def file_preview_adapter(id: str, request: Request, mode: Optional[str] = None):
     """适配前端文件预览请求"""
     try:
-        # 从最近上传的文档内容返回
-        if not last_uploaded_document:
+        # 按文档ID查找当前会话的文档
+        document = document_store.resolve(get_session_id(request), id)
+        if not document:
             raise HTTPException(status_code=404, detail="无法预览文件，找不到内容")
         
-        # 获取处理后的内容，如果存在的话
-        content = last_uploaded_document.get("processed_content", last_uploaded_document["content"])
-        
-        # 将文本内容转换为docx并返回
-        doc_bytes = convert_text_to_docx_bytes(content)
-        
-        return Response(
-            content=doc_bytes,
-            media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-            headers={"Content-Disposition": f"inline; filename=preview_{last_uploaded_document['filename']}"}
-        )
+        # 返回包含处理结果的docx，内容未变化时返回304
+        return await document_docx_response(request, document, f"inline; filename=preview_{document.filename}", mode)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"预览文件出错: {str(e)}")
         raise HTTPException(status_code=500, detail=f"预览文件出错: {str(e)}")
 
 @app.get("/file/download")
-async def file_download_adapter(id: str):
+async def file_download_adapter(id: str, request: Request, mode: Optional[str] = None):
     """适配前端文件下载请求"""
     try:
-        # 从最近上传的文档内容返回
-        if not last_uploaded_document:
+        # 按文档ID查找当前会话的文档
+        document = document_store.resolve(get_session_id(request), id)
+        if not document:
             raise HTTPException(status_code=404, detail="无法下载文件，找不到内容")
         
-        # 获取处理后的内容，如果存在的话
-        content = last_uploaded_document.get("processed_content", last_uploaded_document["content"])
-        
         # 生成时间戳
         timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        filename = last_uploaded_document["filename"]
+        filename = document.filename
         filename_base = filename.rsplit(".", 1)[0]
         download_filename = f"{filename_base}_processed_{timestamp}.docx"
         
-        # 将文本内容转换为docx并返回
-        doc_bytes = convert_text_to_docx_bytes(content)
-        
-        return Response(
-            content=doc_bytes,
-            media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-            headers={"Content-Disposition": f"attachment; filename={download_filename}"}
-        )
+        # 返回包含处理结果的docx，内容未变化时返回304
+        return await document_docx_response(request, document, f"attachment; filename={download_filename}", mode)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"下载文件出错: {str(e)}")
         raise HTTPException(status_code=500, detail=f"下载文件出错: {str(e)}")
@@ -1301,30 +1394,11 @@ async def file_confirm_modify_adapter(request: Request):
 def convert_text_to_docx_bytes(text_content):
     """将文本内容转换为Word文档字节流"""
     try:
-        # 创建一个新的Word文档
-        doc = Document()
-        
-        # 按段落拆分文本并添加到文档中
-        paragraphs = text_content.split('\n')
-        for para in paragraphs:
-            if para.strip():  # 跳过空行
-                doc.add_paragraph(para)
-        
-        # 将文档保存到内存中
-        docx_bytes = BytesIO()
-        doc.save(docx_bytes)
-        docx_bytes.seek(0)
-        
-        # 返回字节内容
-        return docx_bytes.getvalue()
+        return text_to_docx_bytes(text_content)
     except Exception as e:
         logging.error(f"Convert text to DOCX error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to convert text to DOCX: {str(e)}")
 
-# 添加到DocProcessor类
-if not hasattr(DocProcessor, 'convert_text_to_docx_bytes'):
-    DocProcessor.convert_text_to_docx_bytes = staticmethod(convert_text_to_docx_bytes)
-
 # 添加适配格式的聊天API
 @app.post("/chat/send")
 async def chat_send_adapter(request: Request):
@@ -1337,11 +1411,12 @@ async def chat_send_adapter(request: Request):
         # 获取聊天历史
         chat_history = body.get("chat_history", [])
         
-        # 从最近上传的文档获取内容
+        # 按file_id或当前会话最近上传的文档获取内容
         document_content = None
-        if last_uploaded_document:
-            document_content = last_uploaded_document["content"]
-            print(f"已获取文档内容，长度: {len(document_content)}")
+        document = document_store.resolve(get_session_id(request), body.get("file_id"))
+        if document:
+            document_content = document_store.get_content(document.document_id)
+            print(f"已获取文档内容，长度: {len(document_content or '')}")
         else:
             print("无上传文档")
         
@@ -1412,7 +1487,7 @@ async def chat_send_adapter(request: Request):
             # 使用MCP CSC服务处理文档
             try:
                 print("调用MCP CSC服务处理文档中...")
-                csc_result = mcp_csc(document_content)
+                csc_result = await run_unless_disconnected(request, correct_document_async(document_content))
                 print(f"MCP CSC服务返回结果: {csc_result.get('status', 'unknown')}")
                 
                 if csc_result["status"] == "success":
@@ -1426,6 +1501,8 @@ async def chat_send_adapter(request: Request):
                     print("MCP服务处理成功")
                 else:
                     raise Exception(f"MCP服务返回错误: {csc_result.get('message', '未知错误')}")
+            except ClientDisconnected:
+                raise
             except Exception as e:
                 print(f"MCP服务处理失败: {str(e)}，回退到LLM处理")
                 
@@ -1439,14 +1516,10 @@ async def chat_send_adapter(request: Request):
                 
                 try:
                     print("调用DeepSeek LLM处理文档...")
-                    response = llm.invoke(doc_messages)
+                    response = await llm.ainvoke(doc_messages)
                     processed_document = response.content
                     print("LLM处理文档成功")
                     
-                    # 保存处理后的文档内容
-                    if last_uploaded_document:
-                        last_uploaded_document["processed_content"] = processed_document
-                    
                     # 发送处理结果
                     processing_message = "已使用DeepSeek AI大模型处理您的文档。处理结果已显示在中间区域。"
                 except Exception as llm_error:
@@ -1455,8 +1528,8 @@ async def chat_send_adapter(request: Request):
                     processing_message = f"处理失败: {str(llm_error)}。返回原始文档内容。"
             
             # 保存处理后的文档内容
-            if last_uploaded_document:
-                last_uploaded_document["processed_content"] = processed_document
+            if document:
+                await run_in_threadpool(document_store.set_processed, document.document_id, processed_document)
             
             # 向聊天历史添加用户消息和助手回复
             chat_history.append({"role": "user", "content": message})
@@ -1506,7 +1579,7 @@ async def chat_send_adapter(request: Request):
             try:
                 # 记录调用过程
                 print("调用DeepSeek LLM生成回复...")
-                model_response = llm.invoke(full_messages)
+                model_response = await llm.ainvoke(full_messages)
                 assistant_message = model_response.content
                 print(f"LLM生成回复成功: {assistant_message[:50]}..." if len(assistant_message) > 50 else f"LLM生成回复成功: {assistant_message}")
                 
@@ -1539,6 +1612,8 @@ async def chat_send_adapter(request: Request):
                     "msg": "聊天处理失败"
                 }
     
+    except ClientDisconnected:
+        return Response(status_code=499)
     except Exception as e:
         print(f"处理聊天请求出错: {str(e)}")
         import traceback
@@ -1572,6 +1647,11 @@ async def mcp_info():
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+@app.get("/api/mcp/cache-stats")
+async def mcp_cache_stats():
+    """返回纠错结果缓存的命中统计"""
+    return {"status": "success", "data": get_correction_cache().stats()}
+
 @app.post("/api/mcp/correction")
 async def mcp_correction(request: Request):
     """MCP公文纠错接口"""
@@ -1583,7 +1663,7 @@ async def mcp_correction(request: Request):
             return {"status": "error", "message": "文本内容不能为空"}
             
         # 调用agent_tools中的CSC纠错方法
-        result = mcp_csc(text)
+        result = await run_unless_disconnected(request, correct_document_async(text))
         
         # 检查结果状态
         if result["status"] == "success":
@@ -1606,6 +1686,8 @@ async def mcp_correction(request: Request):
                 "message": result.get("message", "纠错处理失败")
             }
             
+    except ClientDisconnected:
+        return Response(status_code=499)
     except Exception as e:
         import traceback
         error_detail = str(e) + "\n" + traceback.format_exc()
@@ -1623,10 +1705,12 @@ async def mcp_invoke_tool(request: Request):
         if not tool:
             return {"status": "error", "message": "工具名称不能为空"}
             
-        # 使用agent_tools中的call_mcp_service方法
-        result = call_mcp_service(tool, params)
+        # 使用agent_tools中的call_mcp_service_async方法
+        result = await run_unless_disconnected(request, call_mcp_service_async(tool, params))
         
         return result
+    except ClientDisconnected:
+        return Response(status_code=499)
     except Exception as e:
         import traceback
         error_detail = str(e) + "\n" + traceback.format_exc()
@@ -1646,39 +1730,23 @@ async def convert_text_to_docx(request: Request):
         if not text_content:
             raise HTTPException(status_code=400, detail="No text content provided")
         
-        # 创建一个新的Word文档
-        doc = Document()
-        
-        # 按段落拆分文本并添加到文档中
-        paragraphs = text_content.split('\n')
-        for para in paragraphs:
-            if para.strip():  # 跳过空行
-                doc.add_paragraph(para)
-        
-        # 将文档保存到内存中
-        docx_bytes = BytesIO()
-        doc.save(docx_bytes)
-        docx_bytes.seek(0)
-        
         # 如果文件名没有.docx后缀，添加它
         if not filename.lower().endswith('.docx'):
             filename = f"{filename}.docx"
         
-        # 返回文档内容
-        return StreamingResponse(
-            docx_bytes,
-            media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
-        )
+        # 返回文档内容，相同内容直接使用缓存
+        return await docx_response(request, text_content, f"attachment; filename={filename}")
         
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Convert text to DOCX error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to convert text to DOCX: {str(e)}")
 
 @app.post("/api/upload")
-async def api_file_upload(file: UploadFile = File(...)):
+async def api_file_upload(request: Request, file: UploadFile = File(...)):
     """处理前端/api/upload请求，转发到file/upload处理程序"""
-    return await file_upload_adapter(file)
+    return await file_upload_adapter(request, file)
 
 @app.post("/api/list")
 async def api_file_list(request: Request):
@@ -1686,9 +1754,9 @@ async def api_file_list(request: Request):
     return await file_list_adapter(request)
 
 @app.get("/api/preview")
-async def api_file_preview(id: str):
+async def api_file_preview(id: str, request: Request, mode: Optional[str] = None):
     """处理前端/api/preview请求，转发到file/preview处理程序"""
-    return await file_preview_adapter(id)
+    return await file_preview_adapter(id, request, mode)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,181 @@
+"""
+记录仓库 - 在SQLiteRecordStore之上维护内存哈希索引
+
+按id和userid建立索引，读取、更新、删除都是O(1)，列表支持偏移分页和基于游标的分页，
+不再需要每次请求都线性扫描全部记录。写操作先写入存储，成功后再更新索引。
+"""
+
+import bisect
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from api.storage import SQLiteRecordStore
+
+# 已删除条目占比超过该值时重建顺序列表
+COMPACT_RATIO = 0.5
+
+
+class _OrderedIndex:
+    """按seq排序的id列表，删除只做标记，列表按需压缩"""
+
+    def __init__(self):
+        self.seqs: List[int] = []
+        self.removed = 0
+
+    def add(self, seq: int) -> None:
+        if not self.seqs or seq > self.seqs[-1]:
+            self.seqs.append(seq)
+            return
+        position = bisect.bisect_left(self.seqs, seq)
+        if position < len(self.seqs) and self.seqs[position] == seq:
+            # 被标记删除的条目重新生效
+            self.removed = max(0, self.removed - 1)
+        else:
+            self.seqs.insert(position, seq)
+
+    def mark_removed(self, live: Dict[int, str]) -> None:
+        self.removed += 1
+        if self.removed > len(self.seqs) * COMPACT_RATIO:
+            self.seqs = [seq for seq in self.seqs if seq in live]
+            self.removed = 0
+
+
+class RecordRepository:
+    """带内存索引的记录仓库，用于聊天记录和文件历史记录"""
+
+    def __init__(self, store: SQLiteRecordStore):
+        self.store = store
+        self._lock = threading.RLock()
+        self.reload()
+
+    def reload(self) -> None:
+        """从存储重新构建全部索引"""
+        with self._lock:
+            self._records: Dict[str, Dict[str, Any]] = {}
+            self._seq_of: Dict[str, int] = {}
+            self._id_of_seq: Dict[int, str] = {}
+            self._all = _OrderedIndex()
+            self._by_user: Dict[Optional[str], Dict[int, str]] = {}
+            self._user_index: Dict[Optional[str], _OrderedIndex] = {}
+            for seq, record in self.store.list_with_seq():
+                self._index(seq, record)
+
+    @staticmethod
+    def _userid_of(record: Dict[str, Any]) -> Optional[str]:
+        userid = record.get("userid")
+        return None if userid is None else str(userid)
+
+    def _index(self, seq: int, record: Dict[str, Any]) -> None:
+        record_id = str(record["id"])
+        userid = self._userid_of(record)
+        self._records[record_id] = record
+        self._seq_of[record_id] = seq
+        self._id_of_seq[seq] = record_id
+        self._all.add(seq)
+        self._by_user.setdefault(userid, {})[seq] = record_id
+        self._user_index.setdefault(userid, _OrderedIndex()).add(seq)
+
+    def _unindex(self, record_id: str) -> None:
+        record = self._records.pop(record_id)
+        seq = self._seq_of.pop(record_id)
+        userid = self._userid_of(record)
+        del self._id_of_seq[seq]
+        self._all.mark_removed(self._id_of_seq)
+        user_records = self._by_user[userid]
+        del user_records[seq]
+        if user_records:
+            self._user_index[userid].mark_removed(user_records)
+        else:
+            del self._by_user[userid]
+            del self._user_index[userid]
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def get(self, record_id: str) -> Optional[Dict[str, Any]]:
+        """按id读取记录"""
+        return self._records.get(str(record_id))
+
+    def upsert(self, record: Dict[str, Any]) -> bool:
+        """新增或更新记录，返回是否为已存在的记录"""
+        record_id = str(record["id"])
+        with self._lock:
+            seq = self.store.upsert(record)
+            existed = record_id in self._records
+            if existed and self._seq_of[record_id] == seq and \
+                    self._userid_of(self._records[record_id]) == self._userid_of(record):
+                # 更新记录不改变其位置，只需替换内容
+                self._records[record_id] = record
+                return True
+            if existed:
+                self._unindex(record_id)
+            self._index(seq, record)
+            return existed
+
+    def delete(self, record_id: str) -> bool:
+        """删除记录，返回记录是否存在"""
+        record_id = str(record_id)
+        with self._lock:
+            if record_id not in self._records:
+                return False
+            self.store.delete(record_id)
+            self._unindex(record_id)
+            return True
+
+    def delete_by_user(self, userid: str) -> int:
+        """删除某个用户的全部记录，返回删除数量"""
+        userid = str(userid)
+        with self._lock:
+            record_ids = list(self._by_user.get(userid, {}).values())
+            if not record_ids:
+                return 0
+            self.store.delete_by_user(userid)
+            for record_id in record_ids:
+                self._unindex(record_id)
+            return len(record_ids)
+
+    def list(self, userid: Optional[str] = None, limit: Optional[int] = None,
+             cursor: Optional[str] = None, offset: int = 0) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """按写入顺序列出记录
+
+        Args:
+            userid: 只列出该用户的记录
+            limit: 每页数量，None表示返回全部
+            cursor: 上一页返回的next_cursor，从其后开始列出
+            offset: 跳过的记录数（在cursor之后计算）
+
+        Returns:
+            (记录列表, next_cursor)，没有更多记录时next_cursor为None
+
+        Raises:
+            ValueError: limit小于1，或cursor不是list返回的next_cursor
+        """
+        if limit is not None and limit < 1:
+            raise ValueError("limit必须大于0")
+        if cursor and not (cursor.isascii() and cursor.isdigit()):
+            raise ValueError(f"无效的cursor: {cursor}")
+        with self._lock:
+            if userid is None:
+                index, live = self._all, self._id_of_seq
+            else:
+                userid = str(userid)
+                if userid not in self._by_user:
+                    return [], None
+                index, live = self._user_index[userid], self._by_user[userid]
+
+            start = bisect.bisect_right(index.seqs, int(cursor)) if cursor else 0
+            items: List[Dict[str, Any]] = []
+            last_seq = None
+            skipped = 0
+            for position in range(start, len(index.seqs)):
+                seq = index.seqs[position]
+                if seq not in live:
+                    continue
+                if skipped < offset:
+                    skipped += 1
+                    continue
+                if limit is not None and len(items) >= limit:
+                    return items, str(last_seq)
+                items.append(self._records[live[seq]])
+                last_seq = seq
+            return items, None
@@ -0,0 +1,59 @@
+"""
+会话标识 - 上传的文档按会话隔离
+
+客户端可以通过请求头 X-Session-Id 指定会话；两者都没有时由服务端生成随机的会话ID，
+通过Cookie返回给浏览器，之后的请求自动带上。不按客户端IP区分会话：
+同一NAT或代理后面的用户IP相同，会共用同一个"当前文档"。
+"""
+
+import os
+import secrets
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import Request, cookie_parser
+
+# 会话ID请求头
+SESSION_HEADER = "X-Session-Id"
+# 服务端生成的会话ID所在的Cookie
+SESSION_COOKIE = "session_id"
+# 会话Cookie的有效期（秒）
+SESSION_COOKIE_MAX_AGE = int(os.getenv("SESSION_COOKIE_MAX_AGE", str(30 * 24 * 3600)))
+
+
+def new_session_id() -> str:
+    return secrets.token_urlsafe(24)
+
+
+def session_id_of(request: Request) -> Optional[str]:
+    """请求所属的会话ID：请求头、Cookie、本次请求新生成的ID依次优先，都没有时返回None"""
+    return (request.headers.get(SESSION_HEADER) or request.cookies.get(SESSION_COOKIE)
+            or getattr(request.state, "session_id", None))
+
+
+class SessionCookieMiddleware:
+    """请求既没有会话请求头也没有会话Cookie时生成会话ID，并在响应中设置Cookie"""
+
+    def __init__(self, app, max_age: int = SESSION_COOKIE_MAX_AGE):
+        self.app = app
+        self.max_age = max_age
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        if headers.get(SESSION_HEADER) or cookie_parser(headers.get("cookie", "")).get(SESSION_COOKIE):
+            await self.app(scope, receive, send)
+            return
+
+        session_id = new_session_id()
+        scope.setdefault("state", {})["session_id"] = session_id
+        cookie = f"{SESSION_COOKIE}={session_id}; Max-Age={self.max_age}; Path=/; HttpOnly; SameSite=Lax"
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append("set-cookie", cookie)
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
@@ -0,0 +1,179 @@
+"""
+基于SQLite的记录存储 - 用于持久化聊天记录等以id为主键的JSON记录
+
+每次新增、更新、删除只写入一行，并在独立事务中提交，避免每次请求都重写整个JSON文件。
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger("storage")
+
+
+class SQLiteRecordStore:
+    """以id为主键、按userid建立索引的JSON记录存储
+
+    记录按首次写入的顺序排列，更新已有记录不会改变它的位置。
+    """
+
+    def __init__(self, db_path: str, table: str):
+        if not table.isidentifier():
+            raise ValueError(f"非法的表名: {table}")
+        self.db_path = str(db_path)
+        self.table = table
+        self._lock = threading.Lock()
+
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._transaction():
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "id TEXT NOT NULL UNIQUE, "
+                "userid TEXT, "
+                "body TEXT NOT NULL, "
+                "updated REAL NOT NULL)"
+            )
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_userid ON {table} (userid, seq)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS migrations ("
+                "source TEXT NOT NULL, target TEXT NOT NULL, count INTEGER NOT NULL, migrated_at REAL NOT NULL, "
+                "PRIMARY KEY (source, target))"
+            )
+
+    @contextmanager
+    def _transaction(self):
+        """在一个事务中执行，出错时整体回滚"""
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    @staticmethod
+    def _userid_of(record: Dict[str, Any]) -> Optional[str]:
+        userid = record.get("userid")
+        return None if userid is None else str(userid)
+
+    def upsert(self, record: Dict[str, Any]) -> int:
+        """新增或更新一条记录，返回记录的顺序号seq"""
+        record_id = record.get("id")
+        if record_id is None:
+            raise ValueError("记录缺少id字段")
+        with self._lock, self._transaction():
+            self._conn.execute(
+                f"INSERT INTO {self.table} (id, userid, body, updated) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET userid = excluded.userid, body = excluded.body, "
+                "updated = excluded.updated",
+                (str(record_id), self._userid_of(record), json.dumps(record, ensure_ascii=False), time.time())
+            )
+            return self._conn.execute(
+                f"SELECT seq FROM {self.table} WHERE id = ?", (str(record_id),)
+            ).fetchone()[0]
+
+    def upsert_many(self, records: Iterable[Dict[str, Any]]) -> int:
+        """在一个事务中批量写入记录，返回写入数量"""
+        rows = [
+            (str(record["id"]), self._userid_of(record), json.dumps(record, ensure_ascii=False), time.time())
+            for record in records if record.get("id") is not None
+        ]
+        with self._lock, self._transaction():
+            self._conn.executemany(
+                f"INSERT INTO {self.table} (id, userid, body, updated) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET userid = excluded.userid, body = excluded.body, "
+                "updated = excluded.updated",
+                rows
+            )
+        return len(rows)
+
+    def delete(self, record_id: str) -> bool:
+        """删除一条记录，返回是否存在该记录"""
+        with self._lock, self._transaction():
+            cursor = self._conn.execute(f"DELETE FROM {self.table} WHERE id = ?", (str(record_id),))
+        return cursor.rowcount > 0
+
+    def delete_by_user(self, userid: str) -> int:
+        """删除某个用户的全部记录，返回删除数量"""
+        with self._lock, self._transaction():
+            cursor = self._conn.execute(f"DELETE FROM {self.table} WHERE userid = ?", (str(userid),))
+        return cursor.rowcount
+
+    def get(self, record_id: str) -> Optional[Dict[str, Any]]:
+        """按id读取一条记录"""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT body FROM {self.table} WHERE id = ?", (str(record_id),)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def list(self, userid: Optional[str] = None) -> List[Dict[str, Any]]:
+        """按写入顺序列出记录，可按userid过滤"""
+        with self._lock:
+            if userid is None:
+                rows = self._conn.execute(f"SELECT body FROM {self.table} ORDER BY seq").fetchall()
+            else:
+                rows = self._conn.execute(
+                    f"SELECT body FROM {self.table} WHERE userid = ? ORDER BY seq", (str(userid),)
+                ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def list_with_seq(self) -> List[tuple]:
+        """按写入顺序返回全部 (seq, record)，用于构建内存索引"""
+        with self._lock:
+            rows = self._conn.execute(f"SELECT seq, body FROM {self.table} ORDER BY seq").fetchall()
+        return [(seq, json.loads(body)) for seq, body in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def migrate_from_json(self, json_path: str) -> int:
+        """从旧版整文件JSON导入记录，每个源文件只导入一次
+
+        原JSON文件保持不变，可作为备份保留。返回本次导入的记录数。
+        """
+        source = os.path.abspath(str(json_path))
+        if not os.path.exists(source):
+            return 0
+        with self._lock:
+            done = self._conn.execute(
+                "SELECT count FROM migrations WHERE source = ? AND target = ?", (source, self.table)
+            ).fetchone()
+        if done:
+            return 0
+
+        with open(source, "r", encoding="utf-8") as f:
+            records = json.load(f)
+        if not isinstance(records, list):
+            raise ValueError(f"{source} 不是记录列表")
+
+        rows = [
+            (str(record["id"]), self._userid_of(record), json.dumps(record, ensure_ascii=False), time.time())
+            for record in records if isinstance(record, dict) and record.get("id") is not None
+        ]
+        with self._lock, self._transaction():
+            # 已存在的记录以存储中的版本为准
+            self._conn.executemany(
+                f"INSERT OR IGNORE INTO {self.table} (id, userid, body, updated) VALUES (?, ?, ?, ?)", rows
+            )
+            self._conn.execute(
+                "INSERT INTO migrations (source, target, count, migrated_at) VALUES (?, ?, ?, ?)",
+                (source, self.table, len(rows), time.time())
+            )
+        logger.info(f"已从 {source} 导入 {len(rows)} 条记录到 {self.table}")
+        return len(rows)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,113 @@
+"""
+上传文档接收 - 限制上传大小，流式保存并在线程池中提取文本
+
+Starlette解析multipart请求时已经把文件写入SpooledTemporaryFile（超过1MB转存到磁盘），
+这里不再用 await file.read() 把整个文件读进内存，而是直接把临时文件对象交给python-docx，
+并按块复制到文档存储。
+
+单次上传的内存峰值约为：
+    Starlette的内存缓冲（不超过1MB）+ 复制缓冲（64KB）+ 文本提取
+接收和保存上传文件的部分与文件大小无关（tests/test_upload.py中验证）。
+默认的lxml提取引擎流式解析document.xml，只保留当前段落和提取出的文本；
+DOCX_EXTRACT_ENGINE=python-docx 时会把压缩包中的各个部件（包括图片）解压到内存并构建XML树。
+"""
+
+import json
+import os
+from typing import BinaryIO, Iterable, Optional, Tuple
+
+from api.document_store import DocumentRecord, DocumentStore
+from my_agent.utils.shared.doc_processor import DocProcessor
+
+# 单个上传文件的最大字节数
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+# multipart请求中除文件内容外的边界、表单字段等开销
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    """上传内容超过大小限制"""
+
+
+def too_large_message(max_bytes: int = MAX_UPLOAD_BYTES) -> str:
+    return f"上传文件超过大小限制（{max_bytes // (1024 * 1024)}MB）"
+
+
+class UploadSizeLimitMiddleware:
+    """限制上传接口的请求体大小
+
+    请求头中的Content-Length超过限制时直接返回413；没有Content-Length（分块传输）时，
+    在读取请求体的过程中累计字节数，超过限制立即停止读取并返回413，不会先把整个请求体收下来。
+    """
+
+    def __init__(self, app, paths: Iterable[str], max_bytes: int = MAX_UPLOAD_BYTES):
+        self.app = app
+        self.paths = set(paths)
+        self.max_body_bytes = max_bytes + MULTIPART_OVERHEAD_BYTES
+        self.max_bytes = max_bytes
+
+    async def _send_too_large(self, send) -> None:
+        body = json.dumps({"code": 413, "data": None, "msg": too_large_message(self.max_bytes),
+                           "detail": too_large_message(self.max_bytes)}, ensure_ascii=False).encode("utf-8")
+        await send({"type": "http.response.start", "status": 413,
+                    "headers": [(b"content-type", b"application/json"),
+                                (b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        content_length = headers.get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_body_bytes:
+            await self._send_too_large(send)
+            return
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_bytes:
+                    exceeded = True
+                    raise UploadTooLarge(too_large_message(self.max_bytes))
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            # 超过限制后应用返回的错误响应替换为413
+            if exceeded:
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except UploadTooLarge:
+            pass
+        if exceeded and not response_started:
+            await self._send_too_large(send)
+
+
+def check_upload_size(size: Optional[int], max_bytes: int = MAX_UPLOAD_BYTES) -> None:
+    """检查已接收文件的大小"""
+    if size is not None and size > max_bytes:
+        raise UploadTooLarge(too_large_message(max_bytes))
+
+
+def ingest_docx(store: DocumentStore, session_id: str, filename: str,
+                source: BinaryIO) -> Tuple[DocumentRecord, str]:
+    """提取上传文件的文本并保存到文档存储，在线程池中调用
+
+    source为可seek的文件对象，保存原始文件时按块复制，不会额外生成完整的字节副本。
+    """
+    content = DocProcessor.load_doc_stream(source, filename)
+    record = store.put(session_id, filename, source, content)
+    return record, content
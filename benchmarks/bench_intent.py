@@ -0,0 +1,87 @@
+"""
+意图识别基准测试 - 对比逐条 re.search 与预编译组合正则
+
+生成一批聊天消息（闲聊、纠错请求、带待纠错文本的请求等，部分消息重复出现），
+先校验两种实现的结果完全一致，再统计每条消息的平均耗时：
+
+    python benchmarks/bench_intent.py [--count 10000] [--unique 0.3]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from my_agent.utils.shared.intent_classifier import IntentEngine
+from benchmarks.legacy_intent import legacy_analyze
+
+TEMPLATES = [
+    "你好，今天{}",
+    "请帮我纠错：{}",
+    "对下面的句子进行公文纠错：{}",
+    "重新纠错一下，{}",
+    "帮我润色：{}",
+    "对刚刚那段话进行修改，{}",
+    "写作时要注意什么？{}",
+    "{}",
+]
+SENTENCES = [
+    "各单位要高度重视公文处理工作，切实提高公文质量。",
+    "请于本月底前将有关情况报送办公室。",
+    "会议指出，要坚持问题导向，狠抓工作落实。",
+    "天气不错",
+]
+
+
+def make_messages(count: int, unique_ratio: float, seed: int = 0):
+    rng = random.Random(seed)
+    unique = []
+    for i in range(max(1, int(count * unique_ratio))):
+        body = "".join(rng.choice(SENTENCES) for _ in range(rng.randint(1, 4)))
+        unique.append(rng.choice(TEMPLATES).format(body) + f"#{i}")
+    return [rng.choice(unique) for _ in range(count)]
+
+
+def per_message_us(func, messages) -> float:
+    start = time.perf_counter()
+    for message in messages:
+        func(message)
+    return (time.perf_counter() - start) / len(messages) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="意图识别基准测试")
+    parser.add_argument("--count", type=int, default=10000)
+    parser.add_argument("--unique", type=float, default=0.3, help="不重复消息所占比例")
+    args = parser.parse_args()
+
+    messages = make_messages(args.count, args.unique)
+    engine = IntentEngine()
+    mismatches = 0
+    for message in set(messages):
+        result = engine.analyze(message)
+        if (result.intent, result.history, result.payload) != legacy_analyze(message):
+            mismatches += 1
+            print(f"[不一致] {message!r}")
+    print(f"校验 {len(set(messages))} 条不同的消息，不一致 {mismatches} 条\n")
+
+    no_memo = IntentEngine(memo_size=0)
+    engine = IntentEngine()
+    rows = [
+        ("逐条re.search", per_message_us(legacy_analyze, messages)),
+        ("组合正则", per_message_us(no_memo.analyze, messages)),
+        ("组合正则+LRU", per_message_us(engine.analyze, messages)),
+    ]
+    print(f"{len(messages)} 条消息，每条平均耗时：")
+    for name, us in rows:
+        print(f"  {name:<16}{us:>8.2f} µs")
+    info = engine.cache_info()
+    print(f"\nLRU命中 {info.hits}，未命中 {info.misses}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
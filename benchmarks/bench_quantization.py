@@ -0,0 +1,88 @@
+"""
+向量量化基准测试 - int8量化+float32重排与float32全量检索对比：常驻内存、召回率(Recall@k)和查询延迟
+
+每种方式在新的进程中以只读方式打开同一个库，查询后读取 /proc/self/status 中的RssFile，
+即检索过程中实际映射进内存的文件页（float32向量或int8量化向量）：
+
+    python benchmarks/bench_quantization.py [--size 200000] [--dim 768] [--rerank 4 8 16]
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from my_agent.utils.shared.retriever import CustomVectorDB
+from benchmarks.vector_data import UnusedEmbeddings, make_vectors
+
+
+def rss_file_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("RssFile:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def run_queries(db_path, queries, k, rerank_factor, exact):
+    """在子进程中执行：只读打开库并查询，返回结果、延迟中位数和常驻文件页"""
+    db = CustomVectorDB(UnusedEmbeddings(), db_path, read_only=True)
+    db.rerank_factor = rerank_factor or db.rerank_factor
+    before = rss_file_mb()
+    results = []
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        results.append([doc.metadata["id"] for doc, _ in db.similarity_search_with_score_by_vector(query, k, exact=exact)])
+        timings.append(time.perf_counter() - start)
+    return results, float(np.median(timings)) * 1000, rss_file_mb() - before
+
+
+def measure(db_path, queries, k, rerank_factor=None, exact=False):
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(run_queries, db_path, queries, k, rerank_factor, exact).result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量量化基准测试")
+    parser.add_argument("--size", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--clusters", type=int, default=1000, help="生成数据的簇数")
+    parser.add_argument("--rerank", type=int, nargs="+", default=[2, 4, 8, 16], help="重排候选数为k的倍数")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = make_vectors(args.size, args.dim, args.clusters, rng)
+    queries = vectors[rng.integers(0, args.size, args.queries)] \
+        + rng.standard_normal((args.queries, args.dim), dtype=np.float32) * 0.5
+
+    with tempfile.TemporaryDirectory() as db_path:
+        db = CustomVectorDB(UnusedEmbeddings(), db_path, quantization="int8")
+        db.add_embeddings([""] * args.size, vectors, [{"id": i} for i in range(args.size)])
+        del vectors
+        segment = db._store.segments[0]
+        float_mb = segment.vectors.nbytes / 2 ** 20
+        int8_mb = (segment.codes.nbytes + segment.scales.nbytes) / 2 ** 20
+
+        exact, exact_ms, exact_rss = measure(db_path, queries, args.k, exact=True)
+        print(f"{args.size} 条向量，维度 {args.dim}；float32向量 {float_mb:.0f} MB，int8量化向量 {int8_mb:.0f} MB，"
+              f"{args.queries} 次查询取中位数\n")
+        print(f"{'方式':<16}{'Recall@' + str(args.k):>12}{'延迟ms':>10}{'常驻文件页MB':>16}")
+        print(f"{'float32':<16}{1.0:>12.3f}{exact_ms:>10.2f}{exact_rss:>16.0f}")
+        for factor in args.rerank:
+            results, ms, rss = measure(db_path, queries, args.k, rerank_factor=factor)
+            recall = np.mean([len(set(r) & set(e)) / len(e) for r, e in zip(results, exact)])
+            print(f"{'int8 重排x' + str(factor):<16}{recall:>12.3f}{ms:>10.2f}{rss:>16.0f}")
+
+
+if __name__ == "__main__":
+    main()
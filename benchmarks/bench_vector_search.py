@@ -0,0 +1,156 @@
+"""
+向量检索基准测试 - 对比原实现（float64、每次查询重新计算范数、全量argsort）
+与预归一化float32矩阵 + argpartition
+
+    python benchmarks/bench_vector_search.py [--sizes 100000 1000000] [--dim 384] [--queries 50]
+    python benchmarks/bench_vector_search.py --ingest 200 [--batch 1000]
+    python benchmarks/bench_vector_search.py --multi 64 [--sizes 100000]
+
+原实现每次查询需要额外分配与向量矩阵同样大小的临时数组，矩阵超过 --legacy-max-gb 时跳过原实现。
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from my_agent.utils.shared.retriever import CustomVectorDB
+from benchmarks.vector_data import UnusedEmbeddings
+
+
+def legacy_search(vectors: np.ndarray, query: np.ndarray, k: int) -> np.ndarray:
+    """改动前 similarity_search 的计算过程"""
+    norms = np.linalg.norm(vectors, axis=1)
+    query_norm = np.linalg.norm(query)
+    similarities = np.dot(vectors, query) / (norms * query_norm)
+    return np.argsort(similarities)[-k:][::-1]
+
+
+def timed_ms(func, queries) -> float:
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        func(query)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings)) * 1000
+
+
+def run(size: int, dim: int, query_count: int, k: int, legacy_max_gb: float):
+    rng = np.random.default_rng(size)
+    raw = rng.standard_normal((size, dim), dtype=np.float32)
+    queries = [raw[i] + rng.standard_normal(dim, dtype=np.float32) * 0.1
+               for i in rng.integers(0, size, query_count)]
+
+    with tempfile.TemporaryDirectory() as db_path:
+        db = CustomVectorDB(UnusedEmbeddings(), db_path)
+        db.add_embeddings([""] * size, raw, [{"id": i} for i in range(size)])
+        new_ms = timed_ms(lambda q: db.similarity_search_with_score_by_vector(q, k), queries)
+        new_ids = [[doc.metadata["id"] for doc in db.similarity_search_by_vector(q, k)] for q in queries]
+        row = {"size": size, "new_ms": new_ms, "new_mb": db.vectors.nbytes / 2 ** 20}
+
+    legacy_bytes = size * dim * 8
+    if legacy_bytes / 2 ** 30 <= legacy_max_gb:
+        legacy = raw.astype(np.float64)
+        del raw
+        row["legacy_ms"] = timed_ms(lambda q: legacy_search(legacy, q.astype(np.float64), k), queries)
+        row["legacy_mb"] = legacy.nbytes / 2 ** 20
+        row["same_top_k"] = sum(legacy_search(legacy, q.astype(np.float64), k).tolist() == ids
+                                for q, ids in zip(queries, new_ids))
+    return row
+
+
+def legacy_ingest(db_path: str, batches) -> None:
+    """改动前 add_texts 的写入过程：整体vstack后重写vectors.npy和metadata.json"""
+    vectors = np.empty((0,))
+    metadata = []
+    for batch, batch_metadata in batches:
+        vectors = np.vstack([vectors, batch]) if vectors.size else batch
+        metadata.extend(batch_metadata)
+        np.save(os.path.join(db_path, "vectors.npy"), vectors)
+        with open(os.path.join(db_path, "metadata.json"), "w") as f:
+            json.dump(metadata, f, ensure_ascii=False)
+
+
+def run_ingest(batch_count: int, batch_size: int, dim: int):
+    rng = np.random.default_rng(0)
+    batches = [(rng.standard_normal((batch_size, dim)), [{"id": i * batch_size + j} for j in range(batch_size)])
+               for i in range(batch_count)]
+    with tempfile.TemporaryDirectory() as db_path:
+        start = time.perf_counter()
+        legacy_ingest(db_path, batches)
+        legacy_seconds = time.perf_counter() - start
+    with tempfile.TemporaryDirectory() as db_path:
+        start = time.perf_counter()
+        db = CustomVectorDB(UnusedEmbeddings(), db_path)
+        for batch, batch_metadata in batches:
+            db.add_embeddings([""] * len(batch), batch, batch_metadata)
+        db.save()
+        segment_seconds = time.perf_counter() - start
+        segment_count = len(os.listdir(os.path.join(db_path, "segments"))) // 2
+    print(f"写入 {batch_count} 批 x {batch_size} 条（维度 {dim}）")
+    print(f"  整体重写: {legacy_seconds:.2f} 秒")
+    print(f"  分段追加: {segment_seconds:.2f} 秒（剩余 {segment_count} 个分段）")
+
+
+def run_multi(size: int, dim: int, query_count: int, k: int):
+    """逐条查询与一次批量查询的总耗时"""
+    rng = np.random.default_rng(size)
+    raw = rng.standard_normal((size, dim), dtype=np.float32)
+    queries = raw[rng.integers(0, size, query_count)] + rng.standard_normal((query_count, dim), dtype=np.float32) * 0.1
+    with tempfile.TemporaryDirectory() as db_path:
+        db = CustomVectorDB(UnusedEmbeddings(), db_path)
+        db.add_embeddings([""] * size, raw, [{"id": i} for i in range(size)])
+        start = time.perf_counter()
+        single = [db.similarity_search_with_score_by_vector(q, k) for q in queries]
+        single_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        batch = db.similarity_search_batch_with_score_by_vector(queries, k)
+        batch_seconds = time.perf_counter() - start
+    same = sum([d.metadata["id"] for d, _ in a] == [d.metadata["id"] for d, _ in b] for a, b in zip(single, batch))
+    print(f"{size:>10}{query_count:>8}{single_seconds * 1000:>14.1f}{batch_seconds * 1000:>14.1f}"
+          f"{single_seconds / batch_seconds:>7.1f}x{same:>8}/{query_count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量检索基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--legacy-max-gb", type=float, default=1.5)
+    parser.add_argument("--ingest", type=int, default=0, help="测试写入性能的批次数")
+    parser.add_argument("--batch", type=int, default=1000, help="写入测试每批的向量数")
+    parser.add_argument("--multi", type=int, default=0, help="测试批量查询时的查询条数")
+    args = parser.parse_args()
+
+    if args.multi:
+        print(f"维度 {args.dim}，k={args.k}\n")
+        print(f"{'向量数':>10}{'查询数':>8}{'逐条ms':>14}{'批量ms':>14}{'加速':>8}{'结果一致':>12}")
+        for size in args.sizes:
+            run_multi(size, args.dim, args.multi, args.k)
+        return
+    if args.ingest:
+        run_ingest(args.ingest, args.batch, args.dim)
+        return
+
+    print(f"维度 {args.dim}，k={args.k}，每组 {args.queries} 次查询取中位数\n")
+    print(f"{'向量数':>10}{'原实现ms':>12}{'原实现MB':>12}{'新实现ms':>12}{'新实现MB':>12}{'加速':>8}{'top-k一致':>12}")
+    for size in args.sizes:
+        row = run(size, args.dim, args.queries, args.k, args.legacy_max_gb)
+        if "legacy_ms" in row:
+            print(f"{size:>10}{row['legacy_ms']:>12.2f}{row['legacy_mb']:>12.0f}{row['new_ms']:>12.2f}"
+                  f"{row['new_mb']:>12.0f}{row['legacy_ms'] / row['new_ms']:>7.1f}x"
+                  f"{row['same_top_k']:>9}/{args.queries}")
+        else:
+            print(f"{size:>10}{'跳过':>12}{size * args.dim * 8 / 2 ** 20:>12.0f}{row['new_ms']:>12.2f}"
+                  f"{row['new_mb']:>12.0f}{'-':>8}{'-':>12}")
+
+
+if __name__ == "__main__":
+    main()
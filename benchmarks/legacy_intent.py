@@ -0,0 +1,46 @@
+"""
+改动前的意图识别实现，作为基准测试的对照和测试中校验结果一致的参照
+
+bench_intent.py 用它对比预编译组合正则的耗时，tests/test_intent_classifier.py 用它校验新实现的结果不变。
+"""
+
+import os
+import re
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from my_agent.utils.shared.intent_classifier import (CORRECTION_PATTERNS, HISTORY_CORRECTION_PATTERNS,
+                                                     RECORRECTION_PATTERNS)
+
+# 原来stream_chat中逐个尝试的文本提取模式
+LEGACY_PAYLOAD_PATTERNS = [
+    r"对.*句子.*纠错[:：](.+)",
+    r"纠错[:：](.+)",
+    r"润色[:：](.+)",
+    r"修改[:：](.+)",
+    r"公文纠错[:：](.+)",
+    r"请.*公文纠错[:：](.+)",
+    r"进行.*纠错[:：](.+)",
+    r"请.*纠错[:：](.+)",
+]
+
+
+def legacy_analyze(message):
+    """改动前的意图识别：classify、is_history_correction和stream_chat中的文本提取各自逐条调用 re.search"""
+    if any(re.search(p, message, re.IGNORECASE) for p in RECORRECTION_PATTERNS):
+        intent = "recorrection"
+    elif any(re.search(p, message, re.IGNORECASE) for p in CORRECTION_PATTERNS):
+        intent = "correction"
+    elif re.search(r'写作|润色|改写|优化', message):
+        intent = "writing"
+    else:
+        intent = "chat"
+    history = any(re.search(p, message, re.IGNORECASE) for p in HISTORY_CORRECTION_PATTERNS)
+    payload = None
+    for pattern in LEGACY_PAYLOAD_PATTERNS:
+        match = re.search(pattern, message, re.DOTALL)
+        if match:
+            payload = match.group(1).strip()
+            break
+    return intent, history, payload
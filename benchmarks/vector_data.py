@@ -0,0 +1,38 @@
+"""
+向量基准测试共用的数据生成和结果处理代码，tests/helpers.py 同样从这里导入
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from langchain.embeddings.base import Embeddings
+
+
+class UnusedEmbeddings(Embeddings):
+    """直接写入和检索向量时不需要嵌入模型"""
+
+    def embed_documents(self, texts):
+        raise NotImplementedError
+
+    def embed_query(self, text):
+        raise NotImplementedError
+
+
+def make_vectors(size: int, dim: int, clusters: int, rng) -> np.ndarray:
+    """基准测试用的大规模聚簇向量，分块生成以限制临时数组的大小"""
+    centers = rng.standard_normal((clusters, dim), dtype=np.float32)
+    vectors = np.empty((size, dim), dtype=np.float32)
+    for start in range(0, size, 100000):
+        count = min(100000, size - start)
+        vectors[start:start + count] = (centers[rng.integers(0, clusters, count)]
+                                        + rng.standard_normal((count, dim), dtype=np.float32) * 1.5)
+    return vectors
+
+
+def ids_of(results):
+    """检索结果中各文档元数据的id"""
+    return [doc.metadata["id"] for doc, _ in results]
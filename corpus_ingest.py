@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+"""
+检索语料批量导入工具
+遍历目录下的.docx文件，在进程池中用DocProcessor提取文本并切分片段，分批生成嵌入向量后写入向量库
+
+提取、嵌入、写入三个阶段通过有界队列串联，任一阶段变慢时上游自动等待，内存占用不随语料规模增长。
+进度定期写入检查点，中断后重新运行同一命令会跳过已导入的文件；检查点之后已写入库中的片段
+根据元数据中的source/chunk字段核对，不会重复导入。片段元数据中同时记录文件的大小和修改时间，
+文件在中断后被修改时，已写入的片段不再跳过，全部重新导入。
+每个片段以"相对路径#序号"为文档编号写入，文件修改后重新导入时按编号更新，多出的旧片段会被删除。
+
+用法:
+    python corpus_ingest.py <目录> [--db local_corpus] [--workers 4] [--batch-size 64] [--output report.json]
+
+示例:
+    # 导入公文目录，使用4个进程提取文本
+    python corpus_ingest.py data/公文 --workers 4
+
+    # 忽略检查点，重新导入全部文件
+    python corpus_ingest.py data/公文 --restart
+"""
+
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from my_agent.csc_pipeline import split_text
+from my_agent.utils.shared.doc_processor import DocProcessor
+
+CHECKPOINT_NAME = "ingest_checkpoint.json"
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_CHUNK_CHARS = 500
+# 等待嵌入的片段数上限
+DEFAULT_QUEUE_SIZE = 1024
+# 两次写入检查点之间的最短间隔（秒）
+CHECKPOINT_INTERVAL = 10.0
+
+_DONE = object()
+
+
+def list_docx(root):
+    """目录下全部.docx文件的相对路径（排序后），跳过Word的临时文件"""
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.lower().endswith(".docx") and not filename.startswith("~$"):
+                paths.append(os.path.relpath(os.path.join(dirpath, filename), root).replace(os.sep, "/"))
+    return paths
+
+
+def chunk_id(rel, index):
+    """片段的文档编号，同一文件重新导入时覆盖原来的片段"""
+    return f"{rel}#{index}"
+
+
+def extract_chunks(path, chunk_chars=DEFAULT_CHUNK_CHARS, engine=None):
+    """在工作进程中提取文本并切分为片段"""
+    text = DocProcessor.extract_text(path, engine)
+    return [chunk.text.strip() for chunk in split_text(text, chunk_chars) if chunk.text.strip()]
+
+
+def _file_state(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _chunk_state(item):
+    """片段元数据中记录的文件状态"""
+    return {"size": item.get("size"), "mtime_ns": item.get("mtime_ns")}
+
+
+class Checkpoint:
+    """导入进度：已完成的文件及其大小和修改时间，以及写入检查点时库中的向量数"""
+
+    def __init__(self, path, rows=0, files=None, failed=None):
+        self.path = path
+        self.rows = rows
+        self.files = files or {}
+        self.failed = failed or {}
+        self._lock = threading.Lock()
+        self._saved_at = 0.0
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.exists(path):
+            return cls(path)
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(path, data.get("rows", 0), data.get("files", {}), data.get("failed", {}))
+
+    def is_done(self, rel, state):
+        item = self.files.get(rel)
+        return item is not None and item["size"] == state["size"] and item["mtime_ns"] == state["mtime_ns"]
+
+    def mark_done(self, rel, state, chunks):
+        with self._lock:
+            self.files[rel] = dict(state, chunks=chunks)
+            self.failed.pop(rel, None)
+
+    def mark_failed(self, rel, error):
+        with self._lock:
+            self.failed[rel] = error
+
+    def save(self, rows, force=False):
+        """写入检查点；未到间隔时间时跳过，force为True时总是写入"""
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._saved_at < CHECKPOINT_INTERVAL:
+                return
+            self._saved_at = now
+            self.rows = rows
+            data = json.dumps({"rows": rows, "files": self.files, "failed": self.failed}, ensure_ascii=False)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+
+def reconcile(checkpoint, db, root):
+    """核对检查点之后写入库中的片段
+
+    完整写入且写入后未被修改的文件标记为已完成；其余文件返回
+    {相对路径: (可以跳过的片段序号, 第一个片段的下标, 已写入的片段编号上限)}。
+    文件在写入后被修改时，已写入的片段内容已经过期，不能跳过，导入时全部按编号覆盖。
+    """
+    present = defaultdict(set)
+    first_rows = {}
+    totals = {}
+    written_states = {}
+    metadata = db.metadata
+    for row in range(checkpoint.rows, len(metadata)):
+        # 已删除的行为None
+        item = metadata[row] or {}
+        source = item.get("source")
+        if source is None:
+            continue
+        present[source].add(item.get("chunk"))
+        first_rows.setdefault(source, row)
+        totals[source] = item.get("chunks")
+        state = _chunk_state(item)
+        # 各片段记录的文件状态不一致时，视为无法确认
+        if written_states.setdefault(source, state) != state:
+            written_states[source] = None
+    partial = {}
+    for source, chunks in present.items():
+        path = os.path.join(root, source)
+        unchanged = os.path.exists(path) and written_states[source] == _file_state(path)
+        if unchanged and len(chunks) == totals[source]:
+            checkpoint.mark_done(source, written_states[source], totals[source])
+        else:
+            partial[source] = (chunks if unchanged else set(), first_rows[source], max(chunks) + 1)
+    return partial
+
+
+def _put(q, item, stop):
+    """放入有界队列；下游出错停止时不再等待"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _extracted(paths, root, workers, chunk_chars, engine):
+    """按文件顺序产出 (相对路径, 片段列表或异常)；进程池中同时处理的文件不超过 2*workers 个"""
+    if workers <= 1:
+        for rel in paths:
+            try:
+                yield rel, extract_chunks(os.path.join(root, rel), chunk_chars, engine)
+            except Exception as e:
+                yield rel, e
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        try:
+            for rel in paths:
+                pending.append((rel, pool.submit(extract_chunks, os.path.join(root, rel), chunk_chars, engine)))
+                if len(pending) >= 2 * workers:
+                    rel, future = pending.popleft()
+                    yield rel, future.exception() or future.result()
+            while pending:
+                rel, future = pending.popleft()
+                yield rel, future.exception() or future.result()
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+
+def ingest(root, db, workers=1, batch_size=DEFAULT_BATCH_SIZE, chunk_chars=DEFAULT_CHUNK_CHARS,
+           checkpoint_path=None, restart=False, engine=None, queue_size=DEFAULT_QUEUE_SIZE):
+    """把目录下的.docx文件导入向量库，返回统计报告"""
+    checkpoint_path = checkpoint_path or os.path.join(db.db_path, CHECKPOINT_NAME)
+    checkpoint = Checkpoint(checkpoint_path) if restart else Checkpoint.load(checkpoint_path)
+    if checkpoint.rows > len(db.metadata):
+        print(f"检查点记录的向量数 {checkpoint.rows} 多于库中的 {len(db.metadata)}，忽略检查点重新导入")
+        checkpoint = Checkpoint(checkpoint_path)
+    partial = reconcile(checkpoint, db, root) if not restart else {}
+
+    paths = []
+    skipped = 0
+    # 已修改的文件上次导入的片段数
+    previous = {}
+    for rel in list_docx(root):
+        if checkpoint.is_done(rel, _file_state(os.path.join(root, rel))):
+            skipped += 1
+            continue
+        if rel in checkpoint.files:
+            print(f"文件已修改，重新导入: {rel}")
+            previous[rel] = checkpoint.files[rel]["chunks"]
+        paths.append(rel)
+
+    stop = threading.Event()
+    errors = []
+    chunk_queue = queue.Queue(maxsize=queue_size)
+    write_queue = queue.Queue(maxsize=4)
+    # 正在导入的文件：剩余片段数、文件状态；未完成的文件已写入的第一个片段的下标
+    remaining = {}
+    states = {}
+    first_rows = {rel: row for rel, (_, row, _) in partial.items()}
+    counts = defaultdict(int)
+    seconds = defaultdict(float)
+    lock = threading.Lock()
+
+    def committed_rows():
+        # 检查点之后的片段在恢复时逐条核对，因此记录的下标不能超过未完成文件的第一个片段
+        with lock:
+            return min(first_rows.values(), default=len(db.metadata))
+
+    def embed_stage():
+        batch = []
+
+        def flush():
+            begin = time.perf_counter()
+            vectors = db.embeddings.embed_documents([item[3] for item in batch])
+            seconds["embed"] += time.perf_counter() - begin
+            _put(write_queue, (list(batch), vectors), stop)
+            batch.clear()
+
+        try:
+            while not stop.is_set():
+                try:
+                    item = chunk_queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if item is _DONE:
+                    break
+                batch.append(item)
+                if len(batch) >= batch_size:
+                    flush()
+            if batch and not stop.is_set():
+                flush()
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            # 写入线程出错后仍会继续取出队列中的批次，这里不会一直等待
+            write_queue.put(_DONE)
+
+    def write_stage():
+        # 嵌入阶段出错或中断时，已生成向量的批次仍然写入；写入本身出错后只取出不再写入
+        failed = False
+        while True:
+            item = write_queue.get()
+            if item is _DONE:
+                return
+            if failed:
+                continue
+            batch, vectors = item
+            try:
+                begin = time.perf_counter()
+                # 只有本线程写入，新片段从当前的行数开始依次分配行号
+                start_row = len(db.metadata)
+                db.add_embeddings([text for _, _, _, text in batch], vectors,
+                                  [dict(states[rel], text=text, source=rel, chunk=index, chunks=total)
+                                   for rel, index, total, text in batch],
+                                  ids=[chunk_id(rel, index) for rel, index, _, _ in batch])
+                seconds["write"] += time.perf_counter() - begin
+                with lock:
+                    counts["chunks"] += len(batch)
+                    for row, (rel, _, total, _) in enumerate(batch, start_row):
+                        first_rows.setdefault(rel, row)
+                        remaining[rel] -= 1
+                        if remaining[rel] == 0:
+                            del remaining[rel]
+                            first_rows.pop(rel, None)
+                            checkpoint.mark_done(rel, states.pop(rel), total)
+                            counts["docs"] += 1
+                checkpoint.save(committed_rows())
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+                failed = True
+
+    embedder = threading.Thread(target=embed_stage, name="ingest-embed", daemon=True)
+    writer = threading.Thread(target=write_stage, name="ingest-write", daemon=True)
+    embedder.start()
+    writer.start()
+    start = time.perf_counter()
+    try:
+        for rel, result in _extracted(paths, root, workers, chunk_chars, engine):
+            if stop.is_set():
+                break
+            if isinstance(result, Exception):
+                print(f"提取失败: {rel}: {result}")
+                checkpoint.mark_failed(rel, str(result))
+                counts["failed"] += 1
+                continue
+            done, _, written = partial.get(rel, ((), None, 0))
+            # 文件修改后片段变少时，删除多出的旧片段；其余片段写入时按编号覆盖
+            known = max(previous.get(rel, 0), written)
+            if known > len(result):
+                db.delete([chunk_id(rel, index) for index in range(len(result), known)])
+            todo = [(rel, index, len(result), text) for index, text in enumerate(result) if index not in done]
+            state = _file_state(os.path.join(root, rel))
+            with lock:
+                if not todo:
+                    first_rows.pop(rel, None)
+                    checkpoint.mark_done(rel, state, len(result))
+                    counts["docs"] += 1
+                    continue
+                remaining[rel] = len(todo)
+                states[rel] = state
+            for item in todo:
+                if not _put(chunk_queue, item, stop):
+                    break
+    except BaseException:
+        stop.set()
+        raise
+    finally:
+        _put(chunk_queue, _DONE, stop)
+        embedder.join()
+        writer.join()
+        checkpoint.save(committed_rows(), force=True)
+        db.save()
+    if errors:
+        raise errors[0]
+
+    wall = time.perf_counter() - start
+    return {
+        "docs": counts["docs"],
+        "chunks": counts["chunks"],
+        "failed": counts["failed"],
+        "skipped": skipped,
+        "workers": workers,
+        "wall_seconds": round(wall, 3),
+        "docs_per_second": round(counts["docs"] / wall, 2) if wall else None,
+        "chunks_per_second": round(counts["chunks"] / wall, 2) if wall else None,
+        # 嵌入和写入在各自的线程中与文本提取并行，累计耗时可用于判断瓶颈所在
+        "embed_seconds": round(seconds["embed"], 3),
+        "write_seconds": round(seconds["write"], 3),
+    }
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='批量导入.docx文件到检索语料库')
+    parser.add_argument('root', help='包含.docx文件的目录（递归查找）')
+    parser.add_argument('--db', default='local_corpus', help='向量库目录')
+    parser.add_argument('--workers', type=int, default=1, help='提取文本的进程数')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='每次生成嵌入向量的片段数')
+    parser.add_argument('--chunk-chars', type=int, default=DEFAULT_CHUNK_CHARS, help='单个片段的最大字符数')
+    parser.add_argument('--engine', choices=('lxml', 'python-docx'), help='文本提取引擎')
+    parser.add_argument('--checkpoint', help=f'检查点文件，默认为向量库目录下的{CHECKPOINT_NAME}')
+    parser.add_argument('--restart', action='store_true', help='忽略检查点，重新导入全部文件')
+    parser.add_argument('--output', help='把报告写入JSON文件，默认输出到终端')
+    return parser.parse_args()
+
+
+def print_report(report):
+    print(f"导入 {report['docs']} 个文件、{report['chunks']} 个片段，"
+          f"失败 {report['failed']} 个，跳过已导入的 {report['skipped']} 个")
+    print(f"总耗时 {report['wall_seconds']} 秒，{report['docs_per_second']} 文件/秒，"
+          f"{report['chunks_per_second']} 片段/秒")
+    print(f"嵌入累计 {report['embed_seconds']} 秒，写入累计 {report['write_seconds']} 秒")
+
+
+def main():
+    """主函数"""
+    from my_agent.utils.shared.embedding_cache import cached_embeddings
+    from my_agent.utils.shared.embedding_provider import LazyEmbeddings
+    from my_agent.utils.shared.retriever import CustomVectorDB
+
+    args = parse_args()
+    if not os.path.isdir(args.root):
+        print(f"目录不存在: {args.root}")
+        sys.exit(1)
+    db = CustomVectorDB(cached_embeddings(LazyEmbeddings()), args.db)
+    try:
+        report = ingest(args.root, db, args.workers, args.batch_size, args.chunk_chars,
+                        args.checkpoint, args.restart, args.engine)
+    except KeyboardInterrupt:
+        print("\n已中断，进度已写入检查点，重新运行同一命令即可继续")
+        sys.exit(130)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"报告已写入 {args.output}")
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
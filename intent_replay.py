@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+聊天日志意图回放工具
+逐行读取JSONL日志，批量识别每条消息的意图，输出各意图的条数和识别吞吐量
+
+用法:
+    python intent_replay.py <JSONL文件|-> [--field message] [--workers 4] [--output report.json]
+
+示例:
+    # 识别日志中每行的message字段
+    python intent_replay.py logs/chat.jsonl
+
+    # 把title和body拼接后识别，使用4个进程
+    python intent_replay.py requests.jsonl --field title --field body --workers 4
+"""
+
+import argparse
+import json
+import sys
+import time
+from collections import Counter, defaultdict
+
+from my_agent.utils.shared.intent_classifier import DEFAULT_BATCH_SIZE, classify_many
+
+# 未指定--field时依次尝试的字段
+DEFAULT_FIELDS = ("message", "content", "text", "body")
+
+
+def iter_messages(lines, fields, stats):
+    """从JSONL行中取出消息文本，无法解析或缺少字段的行计入stats['skipped']"""
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            stats["skipped"] += 1
+            continue
+        if not isinstance(record, dict):
+            stats["skipped"] += 1
+            continue
+        if fields:
+            parts = [str(record[field]) for field in fields if record.get(field) is not None]
+        else:
+            parts = [str(record[field]) for field in DEFAULT_FIELDS if record.get(field) is not None][:1]
+        if not parts:
+            stats["skipped"] += 1
+            continue
+        yield "\n".join(parts)
+
+
+def replay(lines, fields=None, workers=1, batch_size=DEFAULT_BATCH_SIZE):
+    """识别全部消息，返回统计报告"""
+    stats = Counter()
+    counts = Counter()
+    seconds = defaultdict(float)
+    start = time.perf_counter()
+    for intent, elapsed in classify_many(iter_messages(lines, fields, stats), workers, batch_size, timed=True):
+        counts[intent] += 1
+        seconds[intent] += elapsed
+    wall = time.perf_counter() - start
+    total = sum(counts.values())
+    return {
+        "total": total,
+        "skipped": stats["skipped"],
+        "workers": workers,
+        "wall_seconds": round(wall, 3),
+        "messages_per_second": round(total / wall, 1) if wall else None,
+        "intents": {
+            intent: {
+                "count": count,
+                "ratio": round(count / total, 4),
+                # 按该意图消息的累计识别耗时计算，不含读取和进程间传输
+                "messages_per_second": round(count / seconds[intent], 1) if seconds[intent] else None,
+                "avg_us": round(seconds[intent] / count * 1e6, 2),
+            }
+            for intent, count in counts.most_common()
+        },
+    }
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='回放聊天日志，统计意图分布和识别吞吐量')
+    parser.add_argument('input', help='JSONL文件路径，-表示标准输入')
+    parser.add_argument('--field', action='append', dest='fields',
+                        help='消息所在字段，可重复指定多个字段并按换行拼接（默认依次尝试message/content/text/body）')
+    parser.add_argument('--workers', type=int, default=1, help='进程数，大于1时使用进程池')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='每个批次的消息条数')
+    parser.add_argument('--output', help='把报告写入JSON文件，默认输出到终端')
+    return parser.parse_args()
+
+
+def print_report(report):
+    print(f"消息 {report['total']} 条，跳过 {report['skipped']} 行，进程数 {report['workers']}")
+    print(f"总耗时 {report['wall_seconds']} 秒，{report['messages_per_second']} 条/秒\n")
+    print(f"{'意图':<16}{'条数':>10}{'占比':>10}{'条/秒':>14}{'平均µs':>10}")
+    for intent, item in report["intents"].items():
+        print(f"{intent:<16}{item['count']:>10}{item['ratio']:>10.2%}"
+              f"{item['messages_per_second'] or 0:>14.1f}{item['avg_us']:>10.2f}")
+
+
+def main():
+    """主函数"""
+    args = parse_args()
+    if args.input == '-':
+        report = replay(sys.stdin, args.fields, args.workers, args.batch_size)
+    else:
+        with open(args.input, encoding='utf-8') as f:
+            report = replay(f, args.fields, args.workers, args.batch_size)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"报告已写入 {args.output}")
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -18,12 +18,12 @@ MCP服务调用命令行工具
 """
 
 import json
-import subprocess
 import sys
-import os
 import argparse
 from pathlib import Path
 
+from my_agent.utils.mcp_pool import get_pool, MCPTimeoutError
+
 def call_mcp(method, params, server_script=None, timeout=15, pretty=True):
     """调用MCP服务
     
@@ -43,78 +43,30 @@ def call_mcp(method, params, server_script=None, timeout=15, pretty=True):
         current_dir = Path(__file__).parent
         server_script = str(current_dir / "simple-csc" / "csc_server.py")
     
-    # 创建JSON-RPC请求
-    request = {
-        "jsonrpc": "2.0",
-        "id": "command-line-call",
-        "method": method,
-        "params": params
-    }
-    
-    # 将请求转换为JSON字符串
-    request_str = json.dumps(request) + "\n"
-    
     if pretty:
         print(f"调用MCP服务: {server_script}")
         print(f"方法: {method}")
         print(f"参数: {json.dumps(params, ensure_ascii=False, indent=2)}")
     
-    # 准备环境变量
-    env = os.environ.copy()
-    env["PYTHONUNBUFFERED"] = "1"  # 确保输出不缓冲
-    
-    # 调用子进程
+    # 通过MCP工作进程池调用
     try:
-        process = subprocess.Popen(
-            [sys.executable, server_script],
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            env=env,
-            text=True  # 使用文本模式
-        )
-        
         if pretty:
             print(f"正在调用MCP服务，超时设置为{timeout}秒...")
         
-        # 发送请求
-        stdout, stderr = process.communicate(input=request_str, timeout=timeout)
+        response = get_pool(server_script, size=1).call(method, params, timeout=timeout)
         
         if pretty:
-            print("\n== 调用结果 ==")
-            if stderr:
-                print(f"标准错误输出:\n{stderr}")
+            print("\n== 响应内容 ==")
+            print(json.dumps(response, indent=2, ensure_ascii=False))
         
-        # 解析响应
-        if stdout and '{' in stdout and '}' in stdout:
-            # 提取JSON部分
-            json_start = stdout.find('{')
-            json_end = stdout.rfind('}') + 1
-            json_str = stdout[json_start:json_end]
-            
-            try:
-                response = json.loads(json_str)
-                
-                if pretty:
-                    print("\n== 响应内容 ==")
-                    print(json.dumps(response, indent=2, ensure_ascii=False))
-                
-                if "error" in response:
-                    error_msg = response["error"].get("message", "未知错误")
-                    return {"status": "error", "message": error_msg}
-                else:
-                    return {"status": "success", "result": response.get("result")}
-            except json.JSONDecodeError as e:
-                if pretty:
-                    print(f"解析响应失败: {e}")
-                return {"status": "error", "message": f"JSON解析错误: {e}"}
+        if "error" in response:
+            error = response["error"]
+            error_msg = error.get("message", "未知错误") if isinstance(error, dict) else str(error)
+            return {"status": "error", "message": error_msg}
         else:
-            if pretty:
-                print("响应中没有找到有效的JSON数据")
-                print(f"原始输出:\n{stdout}")
-            return {"status": "error", "message": "响应中没有找到有效的JSON数据"}
+            return {"status": "success", "result": response.get("result")}
     
-    except subprocess.TimeoutExpired:
+    except MCPTimeoutError:
         if pretty:
             print(f"执行超时（{timeout}秒）")
         return {"status": "error", "message": f"操作超时（{timeout}秒）"}
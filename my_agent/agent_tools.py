@@ -1,10 +1,11 @@
+import asyncio
 import json
-import subprocess
 import logging
-from pathlib import Path
-import os
 import time
 
+from my_agent.utils.mcp_pool import get_pool, get_async_pool, MCPError, MCPTimeoutError
+from my_agent.utils.shared.correction_cache import get_correction_cache
+
 # 设置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -12,119 +13,51 @@ logging.basicConfig(
 )
 logger = logging.getLogger("agent_tools")
 
-def call_mcp_service(method, params):
+# CSC服务的纠错方法名
+CSC_METHOD = "纠错算法"
+
+def _to_service_result(response, start_time):
+    """将JSON-RPC响应转换为call_mcp_service的返回格式"""
+    # 计算耗时
+    elapsed_time = time.time() - start_time
+    
+    # 检查是否有错误
+    if "error" in response:
+        logger.error(f"MCP服务出错: {response['error']}")
+        return {"status": "error", "message": str(response["error"])}
+    
+    # 返回结果
+    return {"status": "success", "result": response.get("result"), "elapsed_time": elapsed_time}
+
+def call_mcp_service(method, params, timeout=None):
     """
-    调用MCP服务的通用函数
+    调用MCP服务的通用函数，请求通过常驻的MCP工作进程池发送
     
     Args:
         method (str): 要调用的方法名
         params (dict): 参数字典
+        timeout (float, optional): 超时时间（秒），默认使用进程池配置
         
     Returns:
         dict: 服务返回的结果
     """
     try:
-        # 创建JSON-RPC请求
-        request = {
-            "jsonrpc": "2.0",
-            "id": str(time.time()),
-            "method": method,
-            "params": params
-        }
-        
-        # 将请求转换为JSON字符串（添加换行符，确保子进程能正确读取）
-        request_str = json.dumps(request) + "\n"
-        
-        # 使用subprocess调用MCP服务
         logger.info(f"调用工具 {method} 参数: {params}")
         start_time = time.time()
         
-        # 调用CSC服务
-        csc_server_script = str(Path(__file__).parent.parent / "simple-csc" / "csc_server.py")
-        simple_csc_dir = str(Path(__file__).parent.parent / "simple-csc")
-        
-        # 使用当前Python解释器
-        import sys
-        python_path = sys.executable
-        
-        # 准备环境变量
-        env = os.environ.copy()
-        # 设置PYTHONUNBUFFERED确保输出不缓冲
-        env["PYTHONUNBUFFERED"] = "1"
-        
-        # 确保PYTHONPATH包含simple-csc目录
-        python_sys_path = env.get("PYTHONPATH", "")
-        if simple_csc_dir not in python_sys_path:
-            env["PYTHONPATH"] = f"{python_sys_path}:{simple_csc_dir}" if python_sys_path else simple_csc_dir
-        
         try:
-            # 使用Popen和communicate更可靠
-            process = subprocess.Popen(
-                [python_path, csc_server_script],
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                env=env,
-                text=True,  # 使用文本模式
-                cwd=simple_csc_dir  # 设置工作目录为simple-csc
-            )
-            
-            # 通过stdin发送请求并从stdout读取响应
-            stdout, stderr = process.communicate(input=request_str, timeout=60)
-            
-            # 检查进程返回码
-            if process.returncode != 0:
-                logger.error(f"MCP子进程返回非零状态码: {process.returncode}")
-                if stderr:
-                    logger.error(f"子进程错误输出: {stderr}")
-                return {
-                    "status": "error", 
-                    "message": f"子进程异常返回: {stderr}"
-                }
-            
-            # 记录输出以便调试
-            logger.info(f"MCP子进程输出: {stdout[:200]}..." if len(stdout) > 200 else f"MCP子进程输出: {stdout}")
-            if stderr:
-                logger.warning(f"MCP子进程错误: {stderr}")
-            
-            # 尝试提取JSON部分
-            if '{' in stdout and '}' in stdout:
-                json_start = stdout.find('{')
-                json_end = stdout.rfind('}') + 1
-                json_str = stdout[json_start:json_end]
-                response = json.loads(json_str)
-            else:
-                # 如果没有JSON，尝试整体解析
-                if stdout.strip():
-                    response = json.loads(stdout.strip())
-                else:
-                    logger.error("MCP子进程没有返回任何输出")
-                    return {"status": "error", "message": "MCP子进程没有返回任何输出"}
-            
-            # 计算耗时
-            elapsed_time = time.time() - start_time
-            
-            # 检查是否有错误
-            if "error" in response:
-                logger.error(f"MCP服务出错: {response['error']}")
-                return {"status": "error", "message": str(response["error"])}
-            
-            # 返回结果
-            return {"status": "success", "result": response["result"], "elapsed_time": elapsed_time}
-            
-        except subprocess.TimeoutExpired:
+            response = get_pool().call(method, params, timeout=timeout)
+        except MCPTimeoutError:
             logger.error(f"调用MCP服务超时")
             return {
                 "status": "error",
                 "message": "调用MCP服务超时，请稍后再试"
             }
-            
-        except json.JSONDecodeError as e:
-            logger.error(f"解析MCP响应JSON出错: {e}, 原始响应: {stdout}")
-            return {
-                "status": "error", 
-                "message": f"JSON解析错误: {str(e)}"
-            }
+        except MCPError as e:
+            logger.error(f"MCP工作进程出错: {e}")
+            return {"status": "error", "message": str(e)}
+        
+        return _to_service_result(response, start_time)
             
     except Exception as e:
         logger.error(f"调用MCP服务过程中出错: {str(e)}")
@@ -132,99 +65,192 @@ def call_mcp_service(method, params):
         logger.error(traceback.format_exc())
         return {"status": "error", "message": str(e)}
 
-def csc(text):
+async def call_mcp_service_async(method, params, timeout=None):
     """
-    使用MCP协议调用CSC服务进行拼写纠错
+    call_mcp_service的异步版本，等待期间不阻塞事件循环
+    
+    调用方被取消（例如HTTP客户端断开连接）时会抛出asyncio.CancelledError，
+    未完成的请求会被放弃。
     
     Args:
-        text (str): 要纠错的文本
+        method (str): 要调用的方法名
+        params (dict): 参数字典
+        timeout (float, optional): 超时时间（秒），默认使用进程池配置
         
     Returns:
-        dict: 纠错结果，包含原文、修正后文本和变更说明
+        dict: 服务返回的结果
     """
     try:
-        # 调用CSC服务 - 使用"纠错算法"作为方法名
-        response = call_mcp_service("纠错算法", {"text": text})
-        
-        if response["status"] == "error":
-            logger.error(f"CSC服务出错: {response['message']}")
-            return {"status": "error", "message": response["message"]}
-        
-        result = response["result"]
-        elapsed_time = response["elapsed_time"]
+        logger.info(f"异步调用工具 {method} 参数: {params}")
+        start_time = time.time()
         
-        # 解析结果格式 - 纠错算法返回的是字符串，需要处理成结构化数据
         try:
-            # 尝试解析结果
-            if isinstance(result, str):
-                if "纠错后的文本:" in result and "主要修改:" in result:
-                    parts = result.split("主要修改:")
-                    corrected_text = parts[0].replace("纠错后的文本:", "").strip()
-                    changes = parts[1].strip()
-                    
-                    # 检查是否有实际修改
-                    is_modified = "未发现明显拼写错误" not in changes and text != corrected_text
-                    
-                    if is_modified:
-                        logger.info(f"CSC纠错成功: {changes}")
-                        return {
-                            "status": "success",
-                            "modified": True,
-                            "original_text": text,
-                            "corrected_text": corrected_text,
-                            "changes": changes,
-                            "elapsed_time": elapsed_time
-                        }
-                    else:
-                        logger.info("CSC未发现需要修改的内容")
-                        return {
-                            "status": "success",
-                            "modified": False,
-                            "original_text": text,
-                            "message": changes,
-                            "elapsed_time": elapsed_time
-                        }
-                else:
-                    # 返回原始结果
-                    return {
-                        "status": "success",
-                        "modified": False,
-                        "original_text": text,
-                        "corrected_text": result,  # 使用完整结果作为纠错文本
-                        "message": "无法解析纠错结果格式",
-                        "elapsed_time": elapsed_time
-                    }
-            else:
-                # 处理现有的结构化结果
-                if "text" in result and result.get("modified", False):
-                    logger.info(f"CSC纠错成功: {result.get('changes', '无详细说明')}")
+            response = await get_async_pool().call(method, params, timeout=timeout)
+        except MCPTimeoutError:
+            logger.error(f"调用MCP服务超时")
+            return {
+                "status": "error",
+                "message": "调用MCP服务超时，请稍后再试"
+            }
+        except MCPError as e:
+            logger.error(f"MCP工作进程出错: {e}")
+            return {"status": "error", "message": str(e)}
+        
+        return _to_service_result(response, start_time)
+            
+    except Exception as e:
+        logger.error(f"调用MCP服务过程中出错: {str(e)}")
+        import traceback
+        logger.error(traceback.format_exc())
+        return {"status": "error", "message": str(e)}
+
+def _build_csc_result(text, response):
+    """将call_mcp_service的返回值解析为结构化的纠错结果"""
+    if response["status"] == "error":
+        logger.error(f"CSC服务出错: {response['message']}")
+        return {"status": "error", "message": response["message"]}
+    
+    result = response["result"]
+    elapsed_time = response["elapsed_time"]
+    
+    # 解析结果格式 - 纠错算法返回的是字符串，需要处理成结构化数据
+    try:
+        # 尝试解析结果
+        if isinstance(result, str):
+            if "纠错后的文本:" in result and "主要修改:" in result:
+                parts = result.split("主要修改:")
+                corrected_text = parts[0].replace("纠错后的文本:", "").strip()
+                changes = parts[1].strip()
+                
+                # 检查是否有实际修改
+                is_modified = "未发现明显拼写错误" not in changes and text != corrected_text
+                
+                if is_modified:
+                    logger.info(f"CSC纠错成功: {changes}")
                     return {
                         "status": "success",
                         "modified": True,
                         "original_text": text,
-                        "corrected_text": result["text"],
-                        "changes": result.get("changes", ""),
+                        "corrected_text": corrected_text,
+                        "changes": changes,
                         "elapsed_time": elapsed_time
                     }
                 else:
                     logger.info("CSC未发现需要修改的内容")
                     return {
-                        "status": "success", 
+                        "status": "success",
                         "modified": False,
                         "original_text": text,
-                        "message": result.get("message", "文本未发现明显拼写错误，无需修改。"),
+                        "message": changes,
                         "elapsed_time": elapsed_time
                     }
-        except Exception as parse_error:
-            logger.error(f"解析CSC结果时出错: {str(parse_error)}")
-            return {
-                "status": "success",
-                "modified": False,
-                "original_text": text,
-                "message": f"解析结果出错，但服务正常: {str(parse_error)}",
-                "corrected_text": str(result),
-                "elapsed_time": elapsed_time
-            }
+            else:
+                # 返回原始结果
+                return {
+                    "status": "success",
+                    "modified": False,
+                    "original_text": text,
+                    "corrected_text": result,  # 使用完整结果作为纠错文本
+                    "message": "无法解析纠错结果格式",
+                    "elapsed_time": elapsed_time
+                }
+        else:
+            # 处理现有的结构化结果
+            if "text" in result and result.get("modified", False):
+                logger.info(f"CSC纠错成功: {result.get('changes', '无详细说明')}")
+                return {
+                    "status": "success",
+                    "modified": True,
+                    "original_text": text,
+                    "corrected_text": result["text"],
+                    "changes": result.get("changes", ""),
+                    "elapsed_time": elapsed_time
+                }
+            else:
+                logger.info("CSC未发现需要修改的内容")
+                return {
+                    "status": "success", 
+                    "modified": False,
+                    "original_text": text,
+                    "message": result.get("message", "文本未发现明显拼写错误，无需修改。"),
+                    "elapsed_time": elapsed_time
+                }
+    except Exception as parse_error:
+        logger.error(f"解析CSC结果时出错: {str(parse_error)}")
+        return {
+            "status": "success",
+            "modified": False,
+            "original_text": text,
+            "message": f"解析结果出错，但服务正常: {str(parse_error)}",
+            "corrected_text": str(result),
+            "elapsed_time": elapsed_time
+        }
+
+def _get_cached_csc_result(text):
+    """查找纠错缓存，命中时返回结果副本"""
+    cached = get_correction_cache().get(text, CSC_METHOD)
+    if cached is None:
+        return None
+    cached.update({"original_text": text, "elapsed_time": 0.0, "cached": True})
+    return cached
+
+def _cache_csc_result(text, result):
+    """缓存成功的纠错结果"""
+    if result["status"] != "success":
+        return
+    # 未修改却带有corrected_text说明结果格式无法解析，不缓存
+    if not result.get("modified", False) and "corrected_text" in result:
+        return
+    entry = {k: v for k, v in result.items() if k not in ("original_text", "elapsed_time")}
+    get_correction_cache().put(text, CSC_METHOD, entry)
+
+def csc(text):
+    """
+    使用MCP协议调用CSC服务进行拼写纠错
+    
+    Args:
+        text (str): 要纠错的文本
+        
+    Returns:
+        dict: 纠错结果，包含原文、修正后文本和变更说明
+    """
+    try:
+        cached = _get_cached_csc_result(text)
+        if cached is not None:
+            logger.info("CSC纠错命中缓存")
+            return cached
+        
+        # 调用CSC服务 - 使用"纠错算法"作为方法名
+        response = call_mcp_service(CSC_METHOD, {"text": text})
+        result = _build_csc_result(text, response)
+        _cache_csc_result(text, result)
+        return result
+    except Exception as e:
+        logger.error(f"CSC纠错过程中出错: {str(e)}")
+        return {"status": "error", "message": str(e)}
+
+async def csc_async(text, timeout=None):
+    """
+    csc的异步版本，供async接口使用，等待纠错结果时不阻塞事件循环
+    
+    Args:
+        text (str): 要纠错的文本
+        timeout (float, optional): 超时时间（秒）
+        
+    Returns:
+        dict: 纠错结果，包含原文、修正后文本和变更说明
+    """
+    try:
+        # 缓存可能读写SQLite，在线程中执行，不阻塞事件循环
+        cached = await asyncio.to_thread(_get_cached_csc_result, text)
+        if cached is not None:
+            logger.info("CSC纠错命中缓存")
+            return cached
+        
+        response = await call_mcp_service_async(CSC_METHOD, {"text": text}, timeout=timeout)
+        result = _build_csc_result(text, response)
+        await asyncio.to_thread(_cache_csc_result, text, result)
+        return result
     except Exception as e:
         logger.error(f"CSC纠错过程中出错: {str(e)}")
         return {"status": "error", "message": str(e)}
@@ -0,0 +1,222 @@
+"""
+长文档纠错流水线 - 按段落/句子切分文档，并发调用CSC服务后按原顺序合并结果
+
+单个片段纠错失败只会保留该片段原文，不会导致整篇文档纠错失败。
+"""
+
+import asyncio
+import logging
+import os
+import re
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from my_agent.agent_tools import csc_async
+from my_agent.utils.mcp_pool import DEFAULT_POOL_SIZE
+
+logger = logging.getLogger("csc_pipeline")
+
+# 单个片段的最大字符数
+DEFAULT_CHUNK_CHARS = int(os.getenv("CSC_CHUNK_CHARS", "500"))
+# 同时进行纠错的片段数量，默认与MCP工作进程数量一致
+DEFAULT_CONCURRENCY = int(os.getenv("CSC_MAX_CONCURRENCY", str(DEFAULT_POOL_SIZE)))
+# 单个片段的纠错超时时间（秒）
+DEFAULT_CHUNK_TIMEOUT = float(os.getenv("CSC_CHUNK_TIMEOUT", "60"))
+# 平均每多少个段落出现一个由内容决定的片段边界
+CHUNK_ANCHOR_INTERVAL = 4
+
+# 句子结束符（保留在句子末尾）
+SENTENCE_END_PATTERN = re.compile(r'[^。！？；!?;]*[。！？；!?;]+[”’」』）)]*|[^。！？；!?;]+$')
+
+
+@dataclass
+class TextChunk:
+    """文档中的一个片段，separator为原文中紧随其后的分隔符"""
+    index: int
+    text: str
+    separator: str = ""
+
+
+def _split_long_paragraph(paragraph: str, max_chars: int) -> List[str]:
+    """按句子切分超长段落，单个句子仍超长时按长度硬切分"""
+    pieces = []
+    current = ""
+    for sentence in SENTENCE_END_PATTERN.findall(paragraph):
+        while len(sentence) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        if current and len(current) + len(sentence) > max_chars:
+            pieces.append(current)
+            current = ""
+        current += sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def _is_anchor_paragraph(paragraph: str) -> bool:
+    """由段落内容决定是否在其后切分片段
+
+    边界只取决于段落本身，修改某个段落后，切分结果会在下一个边界段落处重新对齐，
+    其余片段的内容不变，可以直接命中纠错缓存。
+    """
+    return zlib.crc32(paragraph.encode("utf-8")) % CHUNK_ANCHOR_INTERVAL == 0
+
+
+def split_text(text: str, max_chars: Optional[int] = None) -> List[TextChunk]:
+    """将文档切分为不超过max_chars的片段
+
+    相邻的短段落会合并到同一片段，超长段落按句子切分。
+    "".join(chunk.text + chunk.separator) 与原文完全一致。
+    """
+    max_chars = max_chars or DEFAULT_CHUNK_CHARS
+    chunks: List[TextChunk] = []
+    current: List[str] = []
+    current_len = 0
+
+    def flush(separator: str):
+        nonlocal current, current_len
+        if current:
+            chunks.append(TextChunk(len(chunks), "\n".join(current), separator))
+            current, current_len = [], 0
+
+    for paragraph in text.split("\n"):
+        if len(paragraph) > max_chars:
+            flush("\n")
+            for piece in _split_long_paragraph(paragraph, max_chars):
+                chunks.append(TextChunk(len(chunks), piece, ""))
+            chunks[-1].separator = "\n"
+            continue
+        if current and current_len + 1 + len(paragraph) > max_chars:
+            flush("\n")
+        current_len += len(paragraph) + (1 if current else 0)
+        current.append(paragraph)
+        if _is_anchor_paragraph(paragraph):
+            flush("\n")
+    flush("")
+
+    # 最后一个片段之后没有分隔符
+    if chunks:
+        chunks[-1].separator = ""
+    return chunks
+
+
+def _split_whitespace(text: str):
+    """拆出首尾空白（包括全角空格缩进），CSC返回的文本会去掉首尾空白"""
+    core = text.strip()
+    if not core:
+        return text, "", ""
+    start = text.index(core)
+    return text[:start], core, text[start + len(core):]
+
+
+async def _correct_chunk(chunk: TextChunk, semaphore: asyncio.Semaphore, timeout: float) -> Dict[str, Any]:
+    """纠错单个片段，返回片段结果"""
+    prefix, core, suffix = _split_whitespace(chunk.text)
+    if not core:
+        return {"index": chunk.index, "status": "success", "modified": False, "text": chunk.text}
+
+    async with semaphore:
+        result = await csc_async(core, timeout=timeout)
+
+    if result["status"] != "success":
+        logger.warning(f"片段 {chunk.index} 纠错失败，保留原文: {result.get('message')}")
+        return {"index": chunk.index, "status": "error", "modified": False,
+                "text": chunk.text, "message": result.get("message", "纠错失败")}
+
+    if result.get("modified", False):
+        return {"index": chunk.index, "status": "success", "modified": True,
+                "text": prefix + result["corrected_text"] + suffix,
+                "changes": result.get("changes", "")}
+    return {"index": chunk.index, "status": "success", "modified": False,
+            "text": chunk.text, "message": result.get("message", "")}
+
+
+def merge_chunk_results(text: str, chunks: List[TextChunk], results: List[Dict[str, Any]],
+                        elapsed_time: float) -> Dict[str, Any]:
+    """按原顺序合并片段结果，返回与csc()相同格式的结果"""
+    results = sorted(results, key=lambda r: r["index"])
+    failed = [r for r in results if r["status"] != "success"]
+    if results and len(failed) == len(results):
+        return {"status": "error", "message": failed[0].get("message", "纠错失败")}
+
+    corrected_text = "".join(r["text"] + chunk.separator for r, chunk in zip(results, chunks))
+    modified_results = [r for r in results if r.get("modified")]
+
+    if len(results) == 1:
+        changes = "\n".join(r["changes"] for r in modified_results)
+    else:
+        changes = "\n".join(f"[片段{r['index'] + 1}] {r['changes']}" for r in modified_results)
+
+    merged = {
+        "status": "success",
+        "modified": bool(modified_results) and corrected_text != text,
+        "original_text": text,
+        "elapsed_time": elapsed_time,
+        "chunk_count": len(chunks),
+        "failed_chunks": [r["index"] for r in failed],
+    }
+    if merged["modified"]:
+        merged["corrected_text"] = corrected_text
+        merged["changes"] = changes
+    else:
+        messages = [r.get("message") for r in results if r.get("message")]
+        merged["message"] = messages[0] if len(results) == 1 and messages else "文本未发现明显拼写错误，无需修改。"
+    if failed:
+        note = f"共{len(failed)}个片段纠错失败，已保留原文"
+        merged["message"] = f"{merged['message']}（{note}）" if merged.get("message") else note
+    return merged
+
+
+async def iter_document_correction(text: str, max_chars: Optional[int] = None,
+                                   concurrency: Optional[int] = None,
+                                   chunk_timeout: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+    """分片并发纠错，按完成顺序产出进度事件，最后产出合并结果
+
+    产出的事件:
+        {"type": "progress", "index", "completed", "total", "text", "modified"}
+        {"type": "result", "result": 合并后的纠错结果}
+    """
+    start_time = time.time()
+    chunks = split_text(text, max_chars)
+    semaphore = asyncio.Semaphore(max(1, concurrency or DEFAULT_CONCURRENCY))
+    timeout = chunk_timeout or DEFAULT_CHUNK_TIMEOUT
+    logger.info(f"文档切分为 {len(chunks)} 个片段进行纠错")
+
+    tasks = [asyncio.ensure_future(_correct_chunk(chunk, semaphore, timeout)) for chunk in chunks]
+    results = []
+    try:
+        for completed, next_done in enumerate(asyncio.as_completed(tasks), start=1):
+            result = await next_done
+            results.append(result)
+            yield {
+                "type": "progress",
+                "index": result["index"],
+                "completed": completed,
+                "total": len(chunks),
+                "text": result["text"],
+                "modified": result.get("modified", False),
+            }
+    finally:
+        # 调用方中途退出（例如客户端断开连接）时取消剩余片段
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+    yield {"type": "result", "result": merge_chunk_results(text, chunks, results, time.time() - start_time)}
+
+
+async def correct_document_async(text: str, max_chars: Optional[int] = None,
+                                 concurrency: Optional[int] = None,
+                                 chunk_timeout: Optional[float] = None) -> Dict[str, Any]:
+    """分片并发纠错整篇文档，返回与csc()相同格式的合并结果"""
+    result = None
+    async for event in iter_document_correction(text, max_chars, concurrency, chunk_timeout):
+        if event["type"] == "result":
+            result = event["result"]
+    return result
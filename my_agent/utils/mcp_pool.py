@@ -0,0 +1,528 @@
+"""
+MCP工作进程池 - 维护常驻的 simple-csc/csc_server.py 子进程
+
+每个工作进程通过 stdin/stdout 收发按行分隔的 JSON-RPC 消息，请求按 id 复用同一条管道，
+避免每次调用都重新启动 Python 解释器和加载纠错模型。进程异常退出后会在下一次调用时自动重启。
+
+MCPWorkerPool 供同步代码使用；AsyncMCPWorkerPool 基于 asyncio 子进程实现，
+供 FastAPI 的 async 接口使用，等待纠错结果时不会阻塞事件循环。
+"""
+
+import asyncio
+import atexit
+import itertools
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger("mcp_pool")
+
+# 默认的CSC服务脚本
+DEFAULT_SERVER_SCRIPT = str(Path(__file__).parent.parent.parent / "simple-csc" / "csc_server.py")
+# 工作进程数量，可通过环境变量 MCP_POOL_SIZE 配置
+DEFAULT_POOL_SIZE = int(os.getenv("MCP_POOL_SIZE", "2"))
+# 单次调用的默认超时时间（秒）
+DEFAULT_TIMEOUT = float(os.getenv("MCP_TIMEOUT", "60"))
+# 保留的子进程标准错误输出行数，用于拼接错误信息
+STDERR_TAIL_LINES = 20
+# asyncio子进程单行输出的上限，整篇文档的纠错结果可能远超默认的64KB
+ASYNC_STREAM_LIMIT = 64 * 1024 * 1024
+
+
+class MCPError(Exception):
+    """MCP调用失败"""
+
+
+class MCPTimeoutError(MCPError):
+    """MCP调用超时"""
+
+
+def build_server_command(server_script: str):
+    """构建启动CSC服务所需的命令、环境变量和工作目录"""
+    server_dir = str(Path(server_script).parent)
+
+    env = os.environ.copy()
+    # 设置PYTHONUNBUFFERED确保输出不缓冲
+    env["PYTHONUNBUFFERED"] = "1"
+    env["PYTHONIOENCODING"] = "utf-8"
+    # 确保PYTHONPATH包含服务脚本所在目录
+    python_path = env.get("PYTHONPATH", "")
+    if server_dir not in python_path.split(os.pathsep):
+        env["PYTHONPATH"] = f"{python_path}{os.pathsep}{server_dir}" if python_path else server_dir
+
+    return [sys.executable, server_script], env, server_dir
+
+
+def parse_response_line(line: str) -> Optional[Dict[str, Any]]:
+    """解析一行输出，非JSON-RPC响应（例如日志）返回None"""
+    line = line.strip()
+    if not line or "{" not in line:
+        return None
+    try:
+        response = json.loads(line)
+    except json.JSONDecodeError:
+        # 兼容行首/行尾夹带日志的输出，提取JSON部分
+        try:
+            response = json.loads(line[line.find("{"):line.rfind("}") + 1])
+        except json.JSONDecodeError:
+            return None
+    if not isinstance(response, dict) or "id" not in response:
+        return None
+    return response
+
+
+class MCPWorker:
+    """单个常驻的MCP服务子进程"""
+
+    def __init__(self, server_script: str, worker_id: int):
+        self.server_script = server_script
+        self.worker_id = worker_id
+        self.process: Optional[subprocess.Popen] = None
+        self._pending: Dict[str, Future] = {}
+        self._pending_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+        self._alive = False
+        self._last_progress = time.monotonic()
+
+    def start(self) -> None:
+        """启动子进程以及读取stdout/stderr的后台线程"""
+        cmd, env, cwd = build_server_command(self.server_script)
+        self.process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=env,
+            cwd=cwd,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+            bufsize=1,  # 行缓冲
+        )
+        self._alive = True
+        self._stderr_tail.clear()
+        self._last_progress = time.monotonic()
+        threading.Thread(
+            target=self._read_stdout, args=(self.process,),
+            name=f"mcp-worker-{self.worker_id}-stdout", daemon=True
+        ).start()
+        threading.Thread(
+            target=self._read_stderr, args=(self.process,),
+            name=f"mcp-worker-{self.worker_id}-stderr", daemon=True
+        ).start()
+        logger.info(f"MCP工作进程 #{self.worker_id} 已启动 (pid={self.process.pid})")
+
+    @property
+    def alive(self) -> bool:
+        return self._alive and self.process is not None and self.process.poll() is None
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def stuck(self, timeout: float) -> bool:
+        """没有其他待处理请求，或超过timeout秒没有返回任何响应时，认为进程已卡住"""
+        return not self._pending or time.monotonic() - self._last_progress >= timeout
+
+    def submit(self, request_id: str, request: Dict[str, Any]) -> Future:
+        """发送一条JSON-RPC请求，返回等待响应的Future"""
+        future = Future()
+        with self._pending_lock:
+            self._pending[request_id] = future
+        try:
+            with self._write_lock:
+                self.process.stdin.write(json.dumps(request, ensure_ascii=False) + "\n")
+                self.process.stdin.flush()
+        except (BrokenPipeError, OSError, ValueError) as e:
+            self._alive = False
+            self.discard(request_id)
+            future.set_exception(MCPError(f"向MCP工作进程写入请求失败: {e}{self._stderr_hint()}"))
+        return future
+
+    def discard(self, request_id: str) -> None:
+        """放弃等待某个请求（超时或取消），之后到达的响应会被忽略"""
+        with self._pending_lock:
+            self._pending.pop(request_id, None)
+
+    def stop(self) -> None:
+        """关闭子进程"""
+        self._alive = False
+        process = self.process
+        if process is None:
+            return
+        try:
+            if process.stdin:
+                process.stdin.close()
+        except OSError:
+            pass
+        try:
+            process.terminate()
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        except OSError:
+            pass
+        self._fail_pending(MCPError("MCP工作进程已关闭"))
+
+    def _read_stdout(self, process: subprocess.Popen) -> None:
+        for line in process.stdout:
+            response = parse_response_line(line)
+            if response is None:
+                if line.strip():
+                    logger.debug(f"MCP工作进程 #{self.worker_id} 输出: {line.strip()[:200]}")
+                continue
+            self._last_progress = time.monotonic()
+            with self._pending_lock:
+                future = self._pending.pop(str(response["id"]), None)
+            if future is None:
+                logger.warning(f"收到未知或已超时请求的响应: id={response['id']}")
+            elif not future.done():
+                future.set_result(response)
+
+        # stdout关闭说明进程已退出
+        returncode = process.wait()
+        if process is self.process:
+            self._alive = False
+            if self._pending:
+                logger.error(f"MCP工作进程 #{self.worker_id} 异常退出，返回码: {returncode}")
+            self._fail_pending(MCPError(f"MCP工作进程已退出，返回码: {returncode}{self._stderr_hint()}"))
+
+    def _read_stderr(self, process: subprocess.Popen) -> None:
+        for line in process.stderr:
+            line = line.rstrip()
+            if line:
+                self._stderr_tail.append(line)
+                logger.debug(f"MCP工作进程 #{self.worker_id} stderr: {line}")
+
+    def _fail_pending(self, error: Exception) -> None:
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(error)
+
+    def _stderr_hint(self) -> str:
+        if not self._stderr_tail:
+            return ""
+        return "，子进程错误输出: " + "\n".join(self._stderr_tail)
+
+
+class MCPWorkerPool:
+    """常驻MCP工作进程池，按待处理请求数量把调用分配到最空闲的进程"""
+
+    def __init__(self, server_script: Optional[str] = None, size: Optional[int] = None,
+                 timeout: Optional[float] = None):
+        self.server_script = server_script or DEFAULT_SERVER_SCRIPT
+        self.size = max(1, size or DEFAULT_POOL_SIZE)
+        self.timeout = timeout or DEFAULT_TIMEOUT
+        self._workers = [MCPWorker(self.server_script, i) for i in range(self.size)]
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._closed = False
+
+    def _acquire_worker(self) -> MCPWorker:
+        with self._lock:
+            if self._closed:
+                raise MCPError("MCP工作进程池已关闭")
+            worker = min(self._workers, key=lambda w: (not w.alive, w.pending_count))
+            if not worker.alive:
+                if worker.process is not None:
+                    logger.warning(f"MCP工作进程 #{worker.worker_id} 已退出，正在重启")
+                worker.start()
+            return worker
+
+    def submit(self, method: str, params: Dict[str, Any]):
+        """异步提交请求，返回 (worker, request_id, future)"""
+        request_id = f"{os.getpid()}-{next(self._ids)}"
+        request = {
+            "jsonrpc": "2.0",
+            "id": request_id,
+            "method": method,
+            "params": params,
+        }
+        worker = self._acquire_worker()
+        return worker, request_id, worker.submit(request_id, request)
+
+    def call(self, method: str, params: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """同步调用MCP方法，返回原始JSON-RPC响应
+
+        Raises:
+            MCPTimeoutError: 调用超时，只放弃这一次请求；工作进程卡住时才会被回收
+            MCPError: 工作进程启动失败或异常退出
+        """
+        timeout = timeout or self.timeout
+        worker, request_id, future = self.submit(method, params)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            worker.discard(request_id)
+            # 同一进程上的其他请求仍在正常返回时保留进程，卡住的进程会阻塞后续请求，直接回收，下一次调用时重启
+            if worker.stuck(timeout):
+                logger.error(f"MCP调用 {method} 超时（{timeout}秒），回收工作进程 #{worker.worker_id}")
+                worker.stop()
+            else:
+                logger.error(f"MCP调用 {method} 超时（{timeout}秒），已放弃该请求 (id={request_id})")
+            raise MCPTimeoutError(f"调用MCP服务超时（{timeout}秒）")
+
+    def shutdown(self) -> None:
+        """关闭所有工作进程"""
+        with self._lock:
+            self._closed = True
+            for worker in self._workers:
+                worker.stop()
+
+
+_pools: Dict[str, MCPWorkerPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(server_script: Optional[str] = None, size: Optional[int] = None) -> MCPWorkerPool:
+    """获取（必要时创建）指定服务脚本对应的进程池，同一脚本在进程内共享一个池"""
+    script = str(Path(server_script or DEFAULT_SERVER_SCRIPT).resolve())
+    with _pools_lock:
+        pool = _pools.get(script)
+        if pool is None or pool._closed:
+            pool = MCPWorkerPool(script, size=size)
+            _pools[script] = pool
+        return pool
+
+
+def shutdown_pools() -> None:
+    """关闭进程内所有MCP工作进程池"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown()
+
+
+atexit.register(shutdown_pools)
+
+
+class AsyncMCPWorker:
+    """基于asyncio子进程的常驻MCP服务进程"""
+
+    def __init__(self, server_script: str, worker_id: int):
+        self.server_script = server_script
+        self.worker_id = worker_id
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._write_lock = asyncio.Lock()
+        self._stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+        self._tasks = []
+        self._last_progress = time.monotonic()
+
+    async def start(self) -> None:
+        """启动子进程以及读取stdout/stderr的后台任务"""
+        cmd, env, cwd = build_server_command(self.server_script)
+        self.process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env=env,
+            cwd=cwd,
+            limit=ASYNC_STREAM_LIMIT,
+        )
+        self._stderr_tail.clear()
+        self._last_progress = time.monotonic()
+        self._tasks = [
+            asyncio.ensure_future(self._read_stdout(self.process)),
+            asyncio.ensure_future(self._read_stderr(self.process)),
+        ]
+        logger.info(f"异步MCP工作进程 #{self.worker_id} 已启动 (pid={self.process.pid})")
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def stuck(self, timeout: float) -> bool:
+        """没有其他待处理请求，或超过timeout秒没有返回任何响应时，认为进程已卡住"""
+        return not self._pending or time.monotonic() - self._last_progress >= timeout
+
+    async def submit(self, request_id: str, request: Dict[str, Any]) -> asyncio.Future:
+        """发送一条JSON-RPC请求，返回等待响应的Future"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            async with self._write_lock:
+                self.process.stdin.write((json.dumps(request, ensure_ascii=False) + "\n").encode("utf-8"))
+                await self.process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError, OSError) as e:
+            self.discard(request_id)
+            raise MCPError(f"向MCP工作进程写入请求失败: {e}{self._stderr_hint()}")
+        return future
+
+    def discard(self, request_id: str) -> None:
+        """放弃等待某个请求（超时或取消），之后到达的响应会被忽略"""
+        self._pending.pop(request_id, None)
+
+    async def stop(self) -> None:
+        """关闭子进程"""
+        process = self.process
+        if process is None:
+            return
+        if process.returncode is None:
+            try:
+                process.stdin.close()
+                process.terminate()
+                await asyncio.wait_for(process.wait(), timeout=5)
+            except asyncio.TimeoutError:
+                process.kill()
+            except ProcessLookupError:
+                pass
+        self._fail_pending(MCPError("MCP工作进程已关闭"))
+
+    async def _read_stdout(self, process: asyncio.subprocess.Process) -> None:
+        while True:
+            line = await process.stdout.readline()
+            if not line:
+                break
+            line = line.decode("utf-8", errors="replace")
+            response = parse_response_line(line)
+            if response is None:
+                if line.strip():
+                    logger.debug(f"异步MCP工作进程 #{self.worker_id} 输出: {line.strip()[:200]}")
+                continue
+            self._last_progress = time.monotonic()
+            future = self._pending.pop(str(response["id"]), None)
+            if future is None:
+                logger.warning(f"收到未知或已取消请求的响应: id={response['id']}")
+            elif not future.done():
+                future.set_result(response)
+
+        # stdout关闭说明进程已退出
+        returncode = await process.wait()
+        if process is self.process:
+            if self._pending:
+                logger.error(f"异步MCP工作进程 #{self.worker_id} 异常退出，返回码: {returncode}")
+            self._fail_pending(MCPError(f"MCP工作进程已退出，返回码: {returncode}{self._stderr_hint()}"))
+
+    async def _read_stderr(self, process: asyncio.subprocess.Process) -> None:
+        while True:
+            line = await process.stderr.readline()
+            if not line:
+                break
+            line = line.decode("utf-8", errors="replace").rstrip()
+            if line:
+                self._stderr_tail.append(line)
+                logger.debug(f"异步MCP工作进程 #{self.worker_id} stderr: {line}")
+
+    def _fail_pending(self, error: Exception) -> None:
+        pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(error)
+
+    def _stderr_hint(self) -> str:
+        if not self._stderr_tail:
+            return ""
+        return "，子进程错误输出: " + "\n".join(self._stderr_tail)
+
+
+class AsyncMCPWorkerPool:
+    """asyncio版本的常驻MCP工作进程池，只能在创建它的事件循环中使用"""
+
+    def __init__(self, server_script: Optional[str] = None, size: Optional[int] = None,
+                 timeout: Optional[float] = None):
+        self.server_script = server_script or DEFAULT_SERVER_SCRIPT
+        self.size = max(1, size or DEFAULT_POOL_SIZE)
+        self.timeout = timeout or DEFAULT_TIMEOUT
+        self._workers = [AsyncMCPWorker(self.server_script, i) for i in range(self.size)]
+        self._lock = asyncio.Lock()
+        self._ids = itertools.count(1)
+        self._closed = False
+        self.loop = asyncio.get_running_loop()
+
+    async def _acquire_worker(self) -> AsyncMCPWorker:
+        async with self._lock:
+            if self._closed:
+                raise MCPError("MCP工作进程池已关闭")
+            worker = min(self._workers, key=lambda w: (not w.alive, w.pending_count))
+            if not worker.alive:
+                if worker.process is not None:
+                    logger.warning(f"异步MCP工作进程 #{worker.worker_id} 已退出，正在重启")
+                try:
+                    await worker.start()
+                except OSError as e:
+                    raise MCPError(f"启动MCP工作进程失败: {e}")
+            return worker
+
+    async def call(self, method: str, params: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """调用MCP方法，返回原始JSON-RPC响应
+
+        调用方被取消（例如HTTP客户端断开连接）时，请求会被放弃，迟到的响应直接丢弃。
+
+        Raises:
+            MCPTimeoutError: 调用超时，只放弃这一次请求；工作进程卡住时才会被回收
+            MCPError: 工作进程启动失败或异常退出
+        """
+        timeout = timeout or self.timeout
+        request_id = f"{os.getpid()}-a{next(self._ids)}"
+        request = {
+            "jsonrpc": "2.0",
+            "id": request_id,
+            "method": method,
+            "params": params,
+        }
+        worker = await self._acquire_worker()
+        future = await worker.submit(request_id, request)
+        try:
+            return await asyncio.wait_for(future, timeout=timeout)
+        except asyncio.TimeoutError:
+            worker.discard(request_id)
+            # 同一进程上的其他请求仍在正常返回时保留进程，卡住的进程会阻塞后续请求，直接回收，下一次调用时重启
+            if worker.stuck(timeout):
+                logger.error(f"MCP调用 {method} 超时（{timeout}秒），回收工作进程 #{worker.worker_id}")
+                await worker.stop()
+            else:
+                logger.error(f"MCP调用 {method} 超时（{timeout}秒），已放弃该请求 (id={request_id})")
+            raise MCPTimeoutError(f"调用MCP服务超时（{timeout}秒）")
+        except asyncio.CancelledError:
+            worker.discard(request_id)
+            logger.info(f"MCP调用 {method} 已取消 (id={request_id})")
+            raise
+
+    async def shutdown(self) -> None:
+        """关闭所有工作进程"""
+        async with self._lock:
+            self._closed = True
+            for worker in self._workers:
+                await worker.stop()
+
+
+_async_pools: Dict[str, AsyncMCPWorkerPool] = {}
+
+
+def get_async_pool(server_script: Optional[str] = None, size: Optional[int] = None) -> AsyncMCPWorkerPool:
+    """获取当前事件循环中指定服务脚本对应的异步进程池"""
+    script = str(Path(server_script or DEFAULT_SERVER_SCRIPT).resolve())
+    loop = asyncio.get_running_loop()
+    pool = _async_pools.get(script)
+    if pool is None or pool._closed or pool.loop is not loop:
+        pool = AsyncMCPWorkerPool(script, size=size)
+        _async_pools[script] = pool
+    return pool
+
+
+async def shutdown_async_pools() -> None:
+    """关闭当前事件循环中的异步MCP工作进程池"""
+    loop = asyncio.get_running_loop()
+    pools = [pool for pool in _async_pools.values() if pool.loop is loop]
+    for script in [script for script, pool in _async_pools.items() if pool.loop is loop]:
+        del _async_pools[script]
+    for pool in pools:
+        await pool.shutdown()
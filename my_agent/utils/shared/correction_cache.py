@@ -0,0 +1,204 @@
+"""
+纠错结果缓存 - 以原文、工具名和工具版本的哈希为键
+
+两级缓存：进程内按占用字节数淘汰的LRU，以及可选的SQLite磁盘缓存（重启后仍然有效）。
+磁盘缓存限制条目数，超出时删除最久未使用的条目。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger("correction_cache")
+
+# 纠错服务升级后修改版本号，使旧的缓存结果失效
+CSC_TOOL_VERSION = os.getenv("CSC_TOOL_VERSION", "1.0.0")
+# 内存缓存的最大占用字节数
+DEFAULT_MAX_BYTES = int(os.getenv("CSC_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# 磁盘缓存的最大条目数
+DEFAULT_MAX_DISK_ENTRIES = int(os.getenv("CSC_CACHE_DISK_MAX_ENTRIES", "100000"))
+# 是否启用磁盘缓存
+DISK_CACHE_ENABLED = os.getenv("CSC_CACHE_DISK", "1") not in ("0", "false", "no")
+# 磁盘缓存路径
+DEFAULT_DB_PATH = os.getenv(
+    "CSC_CACHE_DB",
+    str(Path(__file__).resolve().parents[3] / "api" / "data" / "csc_cache.sqlite3")
+)
+
+
+def make_cache_key(text: str, tool: str, version: str = CSC_TOOL_VERSION) -> str:
+    """生成稳定的缓存键
+
+    原文按原样参与哈希，不去除空白也不统一换行符：命中时直接返回缓存的corrected_text，
+    只有原文完全相同时纠错结果才能原样复用。
+    """
+    payload = f"{tool}\0{version}\0{text}".encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+class CorrectionCache:
+    """纠错结果的两级缓存"""
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, db_path: Optional[str] = None,
+                 max_disk_entries: int = DEFAULT_MAX_DISK_ENTRIES):
+        self.max_bytes = max_bytes
+        self.db_path = db_path
+        self.max_disk_entries = max(1, max_disk_entries)
+        # 磁盘缓存的条目数，只在写入时增加，超出上限时重新统计
+        self._disk_entries = 0
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+
+        if db_path:
+            try:
+                Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+                self._conn = sqlite3.connect(db_path, check_same_thread=False)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                # created记录最近一次写入或从磁盘命中的时间，超出条目上限时按它淘汰
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS csc_cache ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+                )
+                self._conn.execute("CREATE INDEX IF NOT EXISTS csc_cache_created ON csc_cache (created)")
+                self._conn.commit()
+                self._disk_entries = self._conn.execute("SELECT COUNT(*) FROM csc_cache").fetchone()[0]
+            except sqlite3.Error as e:
+                logger.error(f"打开磁盘缓存失败，仅使用内存缓存: {e}")
+                self._conn = None
+
+    def get(self, text: str, tool: str) -> Optional[Dict[str, Any]]:
+        """查找缓存，未命中返回None"""
+        key = make_cache_key(text, tool)
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return json.loads(value)
+
+            if self._conn is not None:
+                try:
+                    row = self._conn.execute("SELECT value FROM csc_cache WHERE key = ?", (key,)).fetchone()
+                    if row is not None:
+                        self._conn.execute("UPDATE csc_cache SET created = ? WHERE key = ?", (time.time(), key))
+                        self._conn.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"读取磁盘缓存失败: {e}")
+                    row = None
+                if row is not None:
+                    self.disk_hits += 1
+                    self._put_memory(key, row[0])
+                    return json.loads(row[0])
+
+            self.misses += 1
+            return None
+
+    def put(self, text: str, tool: str, result: Dict[str, Any]) -> None:
+        """写入缓存"""
+        key = make_cache_key(text, tool)
+        value = json.dumps(result, ensure_ascii=False)
+        with self._lock:
+            self._put_memory(key, value)
+            if self._conn is not None:
+                try:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO csc_cache (key, value, created) VALUES (?, ?, ?)",
+                        (key, value, time.time())
+                    )
+                    self._conn.commit()
+                    self._disk_entries += 1
+                    if self._disk_entries > self.max_disk_entries:
+                        self._prune_disk()
+                except sqlite3.Error as e:
+                    logger.warning(f"写入磁盘缓存失败: {e}")
+
+    def _prune_disk(self) -> None:
+        """删除最久未使用的磁盘缓存条目，保留上限的九成，避免每次写入都要删除"""
+        count = self._conn.execute("SELECT COUNT(*) FROM csc_cache").fetchone()[0]
+        if count > self.max_disk_entries:
+            excess = count - self.max_disk_entries * 9 // 10
+            self._conn.execute(
+                "DELETE FROM csc_cache WHERE key IN (SELECT key FROM csc_cache ORDER BY created LIMIT ?)",
+                (excess,)
+            )
+            self._conn.commit()
+            self.disk_evictions += excess
+            count -= excess
+        self._disk_entries = count
+
+    def _put_memory(self, key: str, value: str) -> None:
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old.encode("utf-8"))
+        self._entries[key] = value
+        self._bytes += size
+        # 按占用字节数淘汰最久未使用的条目
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted.encode("utf-8"))
+            self.evictions += 1
+
+    def clear(self) -> None:
+        """清空内存和磁盘缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM csc_cache")
+                self._conn.commit()
+                self._disk_entries = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存命中统计"""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            disk_entries = None
+            if self._conn is not None:
+                try:
+                    disk_entries = self._conn.execute("SELECT COUNT(*) FROM csc_cache").fetchone()[0]
+                except sqlite3.Error:
+                    pass
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_entries": len(self._entries),
+                "memory_bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+                "disk_entries": disk_entries,
+                "max_disk_entries": self.max_disk_entries,
+                "disk_evictions": self.disk_evictions,
+                "version": CSC_TOOL_VERSION,
+            }
+
+
+_cache: Optional[CorrectionCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_correction_cache() -> CorrectionCache:
+    """获取进程内共享的纠错缓存"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = CorrectionCache(db_path=DEFAULT_DB_PATH if DISK_CACHE_ENABLED else None)
+        return _cache
@@ -4,18 +4,36 @@ import io
 import os
 from typing import Optional
 
+from .docx_extractor import extract_text
+from .docx_writer import text_to_docx_bytes
+
+# 文本提取引擎："lxml"直接流式解析document.xml，"python-docx"构建完整的文档对象模型
+DOCX_EXTRACT_ENGINE = os.getenv("DOCX_EXTRACT_ENGINE", "lxml")
+EXTRACT_ENGINES = ("lxml", "python-docx")
 
 
 class DocProcessor:
     @staticmethod
-    def load_doc(file_path):
-        """优化的文档加载方法，直接使用python-docx提高效率"""
+    def extract_text(source, engine: Optional[str] = None) -> str:
+        """按指定引擎提取段落文本，source可以是文件路径或可seek的文件对象"""
+        engine = engine or DOCX_EXTRACT_ENGINE
+        if engine not in EXTRACT_ENGINES:
+            raise ValueError(f"未知的文本提取引擎: {engine}")
+        if engine == "lxml":
+            try:
+                return extract_text(source)
+            except Exception as e:
+                print(f"lxml提取失败，改用python-docx: {e}")
+                if hasattr(source, "seek"):
+                    source.seek(0)
+        doc = Document(source)
+        return '\n'.join([para.text for para in doc.paragraphs if para.text.strip()])
+
+    @staticmethod
+    def load_doc(file_path, engine: Optional[str] = None):
+        """优化的文档加载方法，默认直接流式解析document.xml提高效率"""
         try:
-            # 直接使用python-docx读取文档
-            doc = Document(file_path)
-            
-            # 使用列表推导式快速提取段落内容
-            content = '\n'.join([para.text for para in doc.paragraphs if para.text.strip()])
+            content = DocProcessor.extract_text(file_path, engine)
             
             # 改进错误处理
             if not content:
@@ -29,14 +47,19 @@ class DocProcessor:
             return "加载文档时出现错误，请检查文档格式"
     
     @staticmethod
-    def load_doc_stream(file_stream, filename: Optional[str] = None):
-        """从流中直接读取文档，避免保存临时文件的开销"""
+    def load_doc_stream(file_stream, filename: Optional[str] = None, engine: Optional[str] = None):
+        """从流中直接读取文档，避免保存临时文件的开销
+
+        file_stream可以是字节串，也可以是可seek的文件对象（例如上传时的临时文件），
+        传入文件对象时不会把整个文件复制到内存中。
+        """
         try:
-            # 直接从内存流读取
-            doc = Document(io.BytesIO(file_stream))
-            
-            # 使用列表推导式快速提取段落内容
-            content = '\n'.join([para.text for para in doc.paragraphs if para.text.strip()])
+            if isinstance(file_stream, (bytes, bytearray)):
+                # 直接从内存流读取
+                file_stream = io.BytesIO(file_stream)
+            else:
+                file_stream.seek(0)
+            content = DocProcessor.extract_text(file_stream, engine)
             
             # 改进错误处理
             if not content:
@@ -49,14 +72,16 @@ class DocProcessor:
             print(f"从流加载文档时出现错误: {e}")
             return "加载文档时出现错误，请检查文档格式"
     
+    @staticmethod
+    def convert_text_to_docx_bytes(content: str) -> bytes:
+        """将文本转换为docx字节流，每个非空行一个段落"""
+        return text_to_docx_bytes(content)
+
     @staticmethod
     def save_doc(content: str, output_path: str):
         """保存结果到新文档"""
-        doc = Document()  # 直接使用 Document
-        
-        # 按段落分割并添加到文档中
-        for paragraph in content.split('\n'):
-            if paragraph.strip():
-                doc.add_paragraph(paragraph)
-                
-        doc.save(output_path)
\ No newline at end of file
+        # 使用预加载的模板直接生成，不再逐段构建python-docx对象
+        with open(output_path, "wb") as f:
+            f.write(text_to_docx_bytes(content))
+
+    save_text_to_docx = save_doc
\ No newline at end of file
@@ -0,0 +1,146 @@
+"""
+docx文本快速提取 - 直接解压.docx并用lxml流式解析document.xml
+
+不构建python-docx的对象模型，解析完一个段落就释放它，提取结果与python-docx一致：
+只取body下的顶层段落（表格中的段落不计入，与doc.paragraphs相同），
+段落文本按 w:r 和 w:hyperlink 中的 w:r 拼接，w:tab/w:br/w:cr 等转换规则也相同。
+"""
+
+import posixpath
+import zipfile
+from dataclasses import dataclass
+from typing import BinaryIO, Iterator, List, Tuple, Union
+
+from lxml import etree
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+OFFICE_DOCUMENT_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"
+DEFAULT_DOCUMENT_PART = "word/document.xml"
+
+
+def _w(tag: str) -> str:
+    return f"{{{W_NS}}}{tag}"
+
+
+W_BODY = _w("body")
+W_P = _w("p")
+W_R = _w("r")
+W_HYPERLINK = _w("hyperlink")
+W_T = _w("t")
+W_TAB = _w("tab")
+W_PTAB = _w("ptab")
+W_BR = _w("br")
+W_CR = _w("cr")
+W_NO_BREAK_HYPHEN = _w("noBreakHyphen")
+W_TYPE = _w("type")
+
+
+@dataclass
+class DocxParagraph:
+    """body中的一个顶层段落
+
+    index为段落在body中的序号（包括空段落），与python-docx的doc.paragraphs下标一致；
+    offset为段落在提取出的全文中的起始位置，未计入全文的空白段落为-1。
+    """
+    index: int
+    text: str
+    offset: int = -1
+
+
+def _run_text(run) -> str:
+    parts = []
+    for child in run:
+        tag = child.tag
+        if tag == W_T:
+            parts.append(child.text or "")
+        elif tag == W_TAB or tag == W_PTAB:
+            parts.append("\t")
+        elif tag == W_CR:
+            parts.append("\n")
+        elif tag == W_BR:
+            # 换行符转换为\n，分页符和分栏符不产生文本
+            if child.get(W_TYPE, "textWrapping") == "textWrapping":
+                parts.append("\n")
+        elif tag == W_NO_BREAK_HYPHEN:
+            parts.append("-")
+    return "".join(parts)
+
+
+def paragraph_text(p) -> str:
+    """计算 w:p 元素的文本，与python-docx的 Paragraph.text 相同"""
+    parts = []
+    for child in p:
+        if child.tag == W_R:
+            parts.append(_run_text(child))
+        elif child.tag == W_HYPERLINK:
+            parts.extend(_run_text(run) for run in child if run.tag == W_R)
+    return "".join(parts)
+
+
+def find_document_part(archive: zipfile.ZipFile) -> str:
+    """从包关系中找到主文档部件的路径"""
+    try:
+        rels = etree.fromstring(archive.read("_rels/.rels"))
+    except (KeyError, etree.XMLSyntaxError):
+        return DEFAULT_DOCUMENT_PART
+    for rel in rels.iter(f"{{{REL_NS}}}Relationship"):
+        if rel.get("Type") == OFFICE_DOCUMENT_REL and rel.get("TargetMode") != "External":
+            return posixpath.normpath(rel.get("Target", DEFAULT_DOCUMENT_PART).lstrip("/"))
+    return DEFAULT_DOCUMENT_PART
+
+
+def iter_body_paragraphs(source: Union[str, BinaryIO]) -> Iterator[Tuple[int, str]]:
+    """按顺序产出body中每个顶层段落的 (序号, 文本)"""
+    with zipfile.ZipFile(source) as archive:
+        with archive.open(find_document_part(archive)) as document_xml:
+            # 与python-docx使用相同的解析选项，保证空白文本的处理一致
+            context = etree.iterparse(document_xml, events=("start", "end"),
+                                      remove_blank_text=True, resolve_entities=False)
+            depth = 0
+            in_body = False
+            index = 0
+            for event, element in context:
+                if event == "start":
+                    depth += 1
+                    if depth == 2 and element.tag == W_BODY:
+                        in_body = True
+                    continue
+
+                depth -= 1
+                if in_body and depth == 2:
+                    # body的直接子元素：段落、表格、分节信息等
+                    if element.tag == W_P:
+                        yield index, paragraph_text(element)
+                        index += 1
+                    element.clear()
+                    # 删除已处理的兄弟元素，保持内存占用不随文档增长
+                    parent = element.getparent()
+                    while element.getprevious() is not None:
+                        del parent[0]
+                elif depth == 1 and element.tag == W_BODY:
+                    in_body = False
+            del context
+
+
+def extract_paragraphs(source: Union[str, BinaryIO]) -> Tuple[str, List[DocxParagraph]]:
+    """提取全文和段落信息
+
+    全文与 '\\n'.join(p.text for p in doc.paragraphs if p.text.strip()) 相同。
+    """
+    paragraphs = []
+    kept = []
+    offset = 0
+    for index, text in iter_body_paragraphs(source):
+        if text.strip():
+            paragraphs.append(DocxParagraph(index, text, offset))
+            kept.append(text)
+            offset += len(text) + 1
+        else:
+            paragraphs.append(DocxParagraph(index, text))
+    return "\n".join(kept), paragraphs
+
+
+def extract_text(source: Union[str, BinaryIO]) -> str:
+    """只提取全文"""
+    return "\n".join(text for _, text in iter_body_paragraphs(source) if text.strip())
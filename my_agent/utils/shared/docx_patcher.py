@@ -0,0 +1,183 @@
+"""
+docx原文修补 - 把纠错后的文本写回上传的原始文档
+
+按段落对齐纠错前后的文本，只修改有变化的段落中 w:t 的文字，段落和文字格式保持不变；
+压缩包中除document.xml以外的条目（图片、样式等）原样复制，不解压也不重新压缩。
+无法可靠对齐时抛出DocxPatchError，由调用方改为重新生成文档。
+"""
+
+import difflib
+import zipfile
+from dataclasses import dataclass
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from lxml import etree
+
+from .docx_extractor import (W_BODY, W_BR, W_CR, W_HYPERLINK, W_NO_BREAK_HYPHEN, W_P, W_PTAB, W_R, W_T,
+                             W_TAB, W_TYPE, find_document_part, paragraph_text)
+from .docx_writer import RawZipWriter, read_raw_entries
+
+XML_SPACE = "{http://www.w3.org/XML/1998/namespace}space"
+# 这些字符对应 w:tab、w:br 等元素，不能通过修改 w:t 的文字插入
+STRUCTURAL_CHARS = ("\t", "\n")
+
+
+class DocxPatchError(Exception):
+    """纠错结果无法写回原始文档"""
+
+
+@dataclass
+class PatchResult:
+    changed_paragraphs: int
+    total_paragraphs: int
+
+
+def _char_owners(p) -> List[Tuple[object, bool]]:
+    """段落文本中每个字符对应的元素，以及该元素是否为 w:tab 等特殊元素
+
+    遍历顺序与paragraph_text()一致。
+    """
+    owners = []
+    runs = []
+    for child in p:
+        if child.tag == W_R:
+            runs.append(child)
+        elif child.tag == W_HYPERLINK:
+            runs.extend(run for run in child if run.tag == W_R)
+    for run in runs:
+        for child in run:
+            tag = child.tag
+            if tag == W_T:
+                owners.extend((child, False) for _ in (child.text or ""))
+            elif tag in (W_TAB, W_PTAB, W_CR, W_NO_BREAK_HYPHEN):
+                owners.append((child, True))
+            elif tag == W_BR and child.get(W_TYPE, "textWrapping") == "textWrapping":
+                owners.append((child, True))
+    return owners
+
+
+def _set_text(t, text: str) -> None:
+    t.text = text
+    if text and (text[0].isspace() or text[-1].isspace()):
+        t.set(XML_SPACE, "preserve")
+
+
+def patch_paragraph(p, new_text: str) -> None:
+    """把段落文字改为new_text，尽量保留每段文字原来所在的 w:r 及其格式
+
+    未变化的字符留在原来的元素中；替换和插入的字符放入被替换文字所在的元素，
+    插入时放入前一个字符所在的元素；被删除的 w:tab 等特殊元素直接移除。
+    """
+    old_text = paragraph_text(p)
+    owners = _char_owners(p)
+    if len(owners) != len(old_text):
+        raise DocxPatchError("段落结构无法识别")
+
+    buffers: Dict[object, List[str]] = {}
+    text_elements = []
+    for element, special in owners:
+        if not special and element not in buffers:
+            buffers[element] = []
+            text_elements.append(element)
+    removed = []
+
+    def text_owner_near(index: int):
+        for position in (index, index - 1):
+            if 0 <= position < len(owners) and not owners[position][1]:
+                return owners[position][0]
+        for position in list(range(index - 2, -1, -1)) + list(range(index + 1, len(owners))):
+            if not owners[position][1]:
+                return owners[position][0]
+        return None
+
+    matcher = difflib.SequenceMatcher(None, old_text, new_text, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            for offset in range(i2 - i1):
+                element, special = owners[i1 + offset]
+                if not special:
+                    buffers[element].append(new_text[j1 + offset])
+            continue
+        removed.extend(owners[i][0] for i in range(i1, i2) if owners[i][1])
+        inserted = new_text[j1:j2]
+        if not inserted:
+            continue
+        if any(char in inserted for char in STRUCTURAL_CHARS):
+            raise DocxPatchError("纠错结果中新增了制表符或换行")
+        owner = text_owner_near(i1 if tag == "replace" else i1 - 1)
+        if owner is None:
+            raise DocxPatchError("段落中没有可写入文字的 w:t 元素")
+        buffers[owner].append(inserted)
+
+    for element in text_elements:
+        _set_text(element, "".join(buffers[element]))
+    for element in removed:
+        element.getparent().remove(element)
+    if paragraph_text(p) != new_text:
+        raise DocxPatchError("段落修补结果与纠错文本不一致")
+
+
+def _body_paragraphs(root) -> List[object]:
+    body = root.find(W_BODY)
+    if body is None:
+        raise DocxPatchError("文档缺少 w:body")
+    return [child for child in body if child.tag == W_P]
+
+
+def align_paragraphs(paragraph_texts: List[str], corrected_text: str) -> List[Optional[str]]:
+    """把纠错后的全文按原文的段落切分
+
+    原文全文是非空段落用换行连接而成（段落内部也可能含有换行），纠错后的换行数量必须与原文相同。
+    返回与paragraph_texts一一对应的新文本，空白段落对应None。
+    """
+    kept = [text for text in paragraph_texts if text.strip()]
+    lines = corrected_text.split("\n")
+    expected = sum(text.count("\n") + 1 for text in kept)
+    if len(lines) != expected:
+        raise DocxPatchError(f"纠错后行数({len(lines)})与原文({expected})不一致")
+    aligned = []
+    position = 0
+    for text in paragraph_texts:
+        if not text.strip():
+            aligned.append(None)
+            continue
+        line_count = text.count("\n") + 1
+        aligned.append("\n".join(lines[position:position + line_count]))
+        position += line_count
+    return aligned
+
+
+def patch_docx(source: BinaryIO, corrected_text: str, output: BinaryIO) -> PatchResult:
+    """把纠错后的全文写回原始文档，结果写入output"""
+    try:
+        entries = read_raw_entries(source)
+        with zipfile.ZipFile(source) as archive:
+            document_part = find_document_part(archive)
+            root = etree.fromstring(archive.read(document_part),
+                                    etree.XMLParser(resolve_entities=False, huge_tree=True))
+    except (zipfile.BadZipFile, KeyError, etree.XMLSyntaxError) as e:
+        raise DocxPatchError(f"无法读取原始文档: {e}")
+
+    paragraphs = _body_paragraphs(root)
+    texts = [paragraph_text(p) for p in paragraphs]
+    changed = 0
+    for p, old_text, new_text in zip(paragraphs, texts, align_paragraphs(texts, corrected_text)):
+        if new_text is None or new_text == old_text:
+            continue
+        if not new_text.strip():
+            raise DocxPatchError("纠错结果删除了整个段落")
+        patch_paragraph(p, new_text)
+        changed += 1
+
+    document_xml = None
+    if changed:
+        document_xml = etree.tostring(root, xml_declaration=True, encoding="UTF-8", standalone=True)
+
+    writer = RawZipWriter(output)
+    for entry in entries:
+        if document_xml is not None and entry.name == document_part:
+            writer.write_bytes(entry.name, document_xml, entry.date_time, entry.external_attr)
+        else:
+            writer.copy_raw(entry)
+    writer.close()
+    return PatchResult(changed_paragraphs=changed, total_paragraphs=len(paragraphs))
@@ -0,0 +1,314 @@
+"""
+docx生成 - 预加载模板，直接写出document.xml
+
+python-docx每次 Document() 都要重新解压、解析默认模板，再逐段构建对象并整体序列化。
+这里在首次使用时把模板加载一次：除document.xml以外的部件保留压缩后的原始数据，生成文档时
+原样写入压缩包，只需要拼接并压缩新的document.xml。生成结果按文本内容的哈希缓存。
+"""
+
+import hashlib
+import io
+import os
+import re
+import struct
+import threading
+import zipfile
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import BinaryIO, Iterable, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+# 渲染缓存的最大字节数
+DEFAULT_RENDER_CACHE_BYTES = int(os.getenv("DOCX_RENDER_CACHE_BYTES", str(32 * 1024 * 1024)))
+# 生成规则变化时修改，使旧的缓存和ETag失效
+WRITER_VERSION = "1"
+
+DOCUMENT_PART = "word/document.xml"
+# 新写入条目使用固定时间，相同内容生成完全相同的文件
+FIXED_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+COPY_CHUNK_SIZE = 64 * 1024
+
+_LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+_CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+_END_OF_CENTRAL_DIR = struct.Struct("<IHHHHIIH")
+_ZIP32_LIMIT = 0xFFFFFFFF
+_ZIP_VERSION = 20
+_FLAG_UTF8 = 0x800
+
+# XML 1.0 不允许的控制字符
+_INVALID_XML_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+# 段落内按制表符和换行符切分为 w:t / w:tab / w:br
+_RUN_CONTENT = re.compile(r"[\t\r\n]|[^\t\r\n]+")
+
+
+# ---- 原始压缩数据的读写 ----
+
+@dataclass
+class RawZipEntry:
+    """压缩包中的一个条目，保留压缩后的数据，写出时不需要重新压缩"""
+    name: str
+    compress_type: int
+    crc: int
+    compress_size: int
+    file_size: int
+    date_time: tuple
+    external_attr: int = 0
+    data: Optional[bytes] = None
+    source: Optional[BinaryIO] = None
+    data_offset: int = 0
+
+
+def read_raw_entries(source: BinaryIO, load: bool = False) -> List[RawZipEntry]:
+    """读取压缩包中各条目的位置信息
+
+    load为True时把压缩数据读入内存，否则写出时从source中按块复制。
+    """
+    entries = []
+    with zipfile.ZipFile(source) as archive:
+        infos = archive.infolist()
+    for info in infos:
+        source.seek(info.header_offset)
+        header = source.read(_LOCAL_HEADER.size)
+        fields = _LOCAL_HEADER.unpack(header)
+        if fields[0] != 0x04034B50:
+            raise zipfile.BadZipFile(f"条目 {info.filename} 的本地文件头损坏")
+        data_offset = info.header_offset + _LOCAL_HEADER.size + fields[9] + fields[10]
+        entry = RawZipEntry(info.filename, info.compress_type, info.CRC, info.compress_size,
+                            info.file_size, info.date_time, info.external_attr,
+                            source=source, data_offset=data_offset)
+        if load:
+            source.seek(data_offset)
+            entry.data = source.read(info.compress_size)
+            entry.source = None
+        entries.append(entry)
+    return entries
+
+
+def _dos_date_time(date_time: tuple) -> Tuple[int, int]:
+    year, month, day, hour, minute, second = date_time
+    year = max(year, 1980)
+    return (hour << 11) | (minute << 5) | (second // 2), ((year - 1980) << 9) | (month << 5) | day
+
+
+class RawZipWriter:
+    """直接写出zip结构，支持原样复制已压缩的条目"""
+
+    def __init__(self, fileobj: BinaryIO):
+        self.fileobj = fileobj
+        self._central = []
+        self._offset = 0
+
+    def _write(self, data: bytes) -> None:
+        self.fileobj.write(data)
+        self._offset += len(data)
+
+    def _write_header(self, name: str, compress_type: int, crc: int, compress_size: int,
+                      file_size: int, date_time: tuple, external_attr: int) -> None:
+        if max(compress_size, file_size, self._offset) >= _ZIP32_LIMIT or len(self._central) >= 0xFFFF:
+            raise ValueError("文件过大，不支持写出ZIP64格式")
+        encoded = name.encode("utf-8")
+        flags = 0 if name.isascii() else _FLAG_UTF8
+        dos_time, dos_date = _dos_date_time(date_time)
+        self._central.append((encoded, flags, compress_type, dos_time, dos_date, crc,
+                              compress_size, file_size, external_attr, self._offset))
+        self._write(_LOCAL_HEADER.pack(0x04034B50, _ZIP_VERSION, flags, compress_type, dos_time, dos_date,
+                                       crc, compress_size, file_size, len(encoded), 0))
+        self._write(encoded)
+
+    def write_bytes(self, name: str, data: bytes, date_time: tuple = FIXED_DATE_TIME,
+                    external_attr: int = 0o600 << 16) -> None:
+        """压缩并写入新条目"""
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+        compressed = compressor.compress(data) + compressor.flush()
+        self._write_header(name, zipfile.ZIP_DEFLATED, zlib.crc32(data), len(compressed), len(data),
+                           date_time, external_attr)
+        self._write(compressed)
+
+    def copy_raw(self, entry: RawZipEntry) -> None:
+        """原样写入已压缩的条目，不解压也不重新压缩"""
+        self._write_header(entry.name, entry.compress_type, entry.crc, entry.compress_size,
+                           entry.file_size, entry.date_time, entry.external_attr)
+        if entry.data is not None:
+            self._write(entry.data)
+            return
+        entry.source.seek(entry.data_offset)
+        remaining = entry.compress_size
+        while remaining:
+            block = entry.source.read(min(COPY_CHUNK_SIZE, remaining))
+            if not block:
+                raise zipfile.BadZipFile(f"条目 {entry.name} 数据不完整")
+            self._write(block)
+            remaining -= len(block)
+
+    def close(self) -> None:
+        """写出中央目录"""
+        start = self._offset
+        for encoded, flags, compress_type, dos_time, dos_date, crc, csize, usize, attr, offset in self._central:
+            self._write(_CENTRAL_HEADER.pack(0x02014B50, _ZIP_VERSION, _ZIP_VERSION, flags, compress_type,
+                                             dos_time, dos_date, crc, csize, usize, len(encoded), 0, 0, 0, 0,
+                                             attr, offset))
+            self._write(encoded)
+        self._write(_END_OF_CENTRAL_DIR.pack(0x06054B50, 0, 0, len(self._central), len(self._central),
+                                             self._offset - start, start, 0))
+
+
+# ---- 文档生成 ----
+
+def _run_content_xml(text: str) -> str:
+    """与python-docx的 add_paragraph(text) 生成相同的 w:r 内容"""
+    parts = []
+    for piece in _RUN_CONTENT.findall(text):
+        if piece == "\t":
+            parts.append("<w:tab/>")
+        elif piece in ("\n", "\r"):
+            parts.append("<w:br/>")
+        elif piece[0].isspace() or piece[-1].isspace():
+            parts.append(f'<w:t xml:space="preserve">{escape(piece)}</w:t>')
+        else:
+            parts.append(f"<w:t>{escape(piece)}</w:t>")
+    return "".join(parts)
+
+
+def paragraph_xml(text: str) -> str:
+    """单个段落的XML"""
+    text = _INVALID_XML_CHARS.sub("", text)
+    if not text:
+        return "<w:p/>"
+    return f"<w:p><w:r>{_run_content_xml(text)}</w:r></w:p>"
+
+
+class DocxTemplate:
+    """预加载的空白文档模板"""
+
+    def __init__(self, template_bytes: bytes):
+        entries = read_raw_entries(io.BytesIO(template_bytes), load=True)
+        # 保持模板中的条目顺序，document.xml写在原来的位置
+        self.document_index = next(i for i, entry in enumerate(entries) if entry.name == DOCUMENT_PART)
+        document_entry = entries.pop(self.document_index)
+        self.entries = entries
+        with zipfile.ZipFile(io.BytesIO(template_bytes)) as archive:
+            document_xml = archive.read(DOCUMENT_PART).decode("utf-8")
+        body_start = document_xml.index("<w:body>") + len("<w:body>")
+        # 新段落插入到分节信息之前
+        body_end = document_xml.rfind("<w:sectPr")
+        if body_end < body_start:
+            body_end = document_xml.rindex("</w:body>")
+        self.prefix = document_xml[:body_start].encode("utf-8")
+        self.suffix = document_xml[body_end:].encode("utf-8")
+        self.document_date_time = document_entry.date_time
+        self.document_attr = document_entry.external_attr
+
+    @classmethod
+    def default(cls) -> "DocxTemplate":
+        """python-docx自带的默认模板"""
+        from docx import Document
+        buffer = io.BytesIO()
+        Document().save(buffer)
+        return cls(buffer.getvalue())
+
+    def render(self, paragraphs: Iterable[str]) -> bytes:
+        """按段落生成docx文件"""
+        body = "".join(paragraph_xml(paragraph) for paragraph in paragraphs).encode("utf-8")
+        buffer = io.BytesIO()
+        writer = RawZipWriter(buffer)
+        for entry in self.entries[:self.document_index]:
+            writer.copy_raw(entry)
+        writer.write_bytes(DOCUMENT_PART, self.prefix + body + self.suffix,
+                           self.document_date_time, self.document_attr)
+        for entry in self.entries[self.document_index:]:
+            writer.copy_raw(entry)
+        writer.close()
+        return buffer.getvalue()
+
+
+_template: Optional[DocxTemplate] = None
+_template_lock = threading.Lock()
+
+
+def get_template() -> DocxTemplate:
+    """获取进程内共享的默认模板，首次调用时加载"""
+    global _template
+    with _template_lock:
+        if _template is None:
+            _template = DocxTemplate.default()
+        return _template
+
+
+def split_paragraphs(text: str) -> List[str]:
+    """按行切分文本，跳过空白行"""
+    return [paragraph for paragraph in text.split("\n") if paragraph.strip()]
+
+
+def text_to_docx_bytes(text: str) -> bytes:
+    """把文本转换为docx，每个非空行一个段落"""
+    return get_template().render(split_paragraphs(text))
+
+
+# ---- 渲染缓存 ----
+
+def render_key(text: str) -> str:
+    """文本对应的缓存键，同时用作ETag"""
+    return hashlib.sha256(f"docx-writer-{WRITER_VERSION}\0{text}".encode("utf-8")).hexdigest()
+
+
+class DocxRenderCache:
+    """按内容哈希缓存生成的docx，按占用字节数进行LRU淘汰"""
+
+    def __init__(self, max_bytes: int = DEFAULT_RENDER_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[key] = data
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def render(self, text: str) -> Tuple[str, bytes]:
+        """返回 (内容哈希, docx字节)，命中缓存时不重新生成"""
+        key = render_key(text)
+        data = self.get(key)
+        if data is None:
+            data = text_to_docx_bytes(text)
+            self.put(key, data)
+        return key, data
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses}
+
+
+_render_cache: Optional[DocxRenderCache] = None
+_render_cache_lock = threading.Lock()
+
+
+def get_render_cache() -> DocxRenderCache:
+    """获取进程内共享的渲染缓存"""
+    global _render_cache
+    with _render_cache_lock:
+        if _render_cache is None:
+            _render_cache = DocxRenderCache()
+        return _render_cache
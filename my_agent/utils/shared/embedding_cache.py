@@ -0,0 +1,226 @@
+"""
+嵌入向量缓存 - 以模型名和文本内容的xxhash为键，缓存生成的嵌入向量
+
+与纠错结果缓存相同的两级结构：进程内按占用字节数淘汰的LRU，以及可选的SQLite磁盘缓存，
+向量以float32字节串保存。embed_documents和embed_queries只把未命中的文本分批交给模型计算。
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import xxhash
+from langchain.embeddings.base import Embeddings
+
+logger = logging.getLogger("embedding_cache")
+
+# 内存缓存的最大占用字节数
+DEFAULT_MAX_BYTES = int(os.getenv("EMBED_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# 是否启用磁盘缓存
+DISK_CACHE_ENABLED = os.getenv("EMBED_CACHE_DISK", "1") not in ("0", "false", "no")
+# 磁盘缓存路径
+DEFAULT_DB_PATH = os.getenv(
+    "EMBED_CACHE_DB",
+    str(Path(__file__).resolve().parents[3] / "api" / "data" / "embedding_cache.sqlite3")
+)
+# 每次交给模型计算的文本条数
+DEFAULT_BATCH_SIZE = 64
+# SQLite单条语句的参数个数有上限，批量查询时分组
+SQL_BATCH = 500
+
+
+def model_name_of(embeddings: Embeddings) -> str:
+    """嵌入模型的名称，用于区分不同模型的缓存"""
+    for attribute in ("model_name", "model", "model_id"):
+        value = getattr(embeddings, attribute, None)
+        if isinstance(value, str) and value:
+            return value
+    return type(embeddings).__name__
+
+
+def make_embedding_key(text: str, model: str, kind: str = "document") -> str:
+    """缓存键；查询和文档分开缓存，部分模型对二者使用不同的指令前缀"""
+    return xxhash.xxh3_128_hexdigest(f"{model}\0{kind}\0{text}".encode("utf-8"))
+
+
+def embed_queries(embeddings: Embeddings, texts: List[str]) -> List[List[float]]:
+    """批量生成查询向量
+
+    查询向量不能用embed_documents代替，部分模型对查询使用不同的指令前缀。
+    嵌入模型提供embed_queries时一次计算，否则逐条调用embed_query。
+    """
+    batch = getattr(embeddings, "embed_queries", None)
+    if batch is not None:
+        return batch(texts)
+    return [embeddings.embed_query(text) for text in texts]
+
+
+class CachedEmbeddings(Embeddings):
+    """带缓存的嵌入模型包装器"""
+
+    def __init__(self, embeddings: Embeddings, model_name: Optional[str] = None,
+                 max_bytes: int = DEFAULT_MAX_BYTES, db_path: Optional[str] = None,
+                 batch_size: int = DEFAULT_BATCH_SIZE):
+        self.embeddings = embeddings
+        self.model_name = model_name or model_name_of(embeddings)
+        self.max_bytes = max_bytes
+        self.batch_size = batch_size
+        self.db_path = db_path
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if db_path:
+            try:
+                Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+                self._conn = sqlite3.connect(db_path, check_same_thread=False)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS embedding_cache ("
+                    "key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+                )
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logger.error(f"打开嵌入向量磁盘缓存失败，仅使用内存缓存: {e}")
+                self._conn = None
+
+    def _put_memory(self, key: str, vector: np.ndarray) -> None:
+        if vector.nbytes > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old.nbytes
+        self._entries[key] = vector
+        self._bytes += vector.nbytes
+        # 按占用字节数淘汰最久未使用的条目
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.nbytes
+            self.evictions += 1
+
+    def _lookup(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """先查内存再查磁盘，返回命中的向量"""
+        found = {}
+        with self._lock:
+            for key in keys:
+                vector = self._entries.get(key)
+                if vector is not None:
+                    self._entries.move_to_end(key)
+                    found[key] = vector
+            self.memory_hits += len(found)
+            missing = [key for key in keys if key not in found]
+            if self._conn is not None and missing:
+                try:
+                    for start in range(0, len(missing), SQL_BATCH):
+                        chunk = missing[start:start + SQL_BATCH]
+                        rows = self._conn.execute(
+                            f"SELECT key, vector FROM embedding_cache WHERE key IN ({','.join('?' * len(chunk))})",
+                            chunk
+                        ).fetchall()
+                        for key, blob in rows:
+                            vector = np.frombuffer(blob, dtype=np.float32)
+                            found[key] = vector
+                            self._put_memory(key, vector)
+                            self.disk_hits += 1
+                except sqlite3.Error as e:
+                    logger.warning(f"读取嵌入向量磁盘缓存失败: {e}")
+            self.misses += len(keys) - len(found)
+        return found
+
+    def _store(self, items: Dict[str, np.ndarray]) -> None:
+        with self._lock:
+            for key, vector in items.items():
+                self._put_memory(key, vector)
+            if self._conn is not None:
+                try:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO embedding_cache (key, vector) VALUES (?, ?)",
+                        [(key, vector.tobytes()) for key, vector in items.items()]
+                    )
+                    self._conn.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"写入嵌入向量磁盘缓存失败: {e}")
+
+    def _embed(self, texts: List[str], kind: str,
+               compute: Callable[[List[str]], List[List[float]]]) -> List[List[float]]:
+        """只计算缓存中没有的文本，重复的文本只计算一次"""
+        keys = [make_embedding_key(text, self.model_name, kind) for text in texts]
+        unique = dict(zip(keys, texts))
+        found = self._lookup(list(unique))
+        pending = [(key, text) for key, text in unique.items() if key not in found]
+        for start in range(0, len(pending), self.batch_size):
+            batch = pending[start:start + self.batch_size]
+            vectors = compute([text for _, text in batch])
+            computed = {key: np.asarray(vector, dtype=np.float32) for (key, _), vector in zip(batch, vectors)}
+            self._store(computed)
+            found.update(computed)
+        if texts:
+            logger.info(f"嵌入缓存: {len(texts)} 条文本，计算 {len(pending)} 条，累计命中率 {self.hit_rate():.1%}")
+        return [found[key].tolist() for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """批量生成文档向量"""
+        return self._embed(texts, "document", self.embeddings.embed_documents)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """批量生成查询向量，与embed_query共用查询缓存"""
+        return self._embed(texts, "query", lambda batch: embed_queries(self.embeddings, batch))
+
+    def embed_query(self, text: str) -> List[float]:
+        key = make_embedding_key(text, self.model_name, "query")
+        found = self._lookup([key])
+        if key not in found:
+            found[key] = np.asarray(self.embeddings.embed_query(text), dtype=np.float32)
+            self._store(found)
+        return found[key].tolist()
+
+    def hit_rate(self) -> float:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0
+
+    def clear(self) -> None:
+        """清空内存和磁盘缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM embedding_cache")
+                self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存命中统计"""
+        with self._lock:
+            disk_entries = None
+            if self._conn is not None:
+                try:
+                    disk_entries = self._conn.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+                except sqlite3.Error:
+                    pass
+            return {
+                "model": self.model_name,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hit_rate(),
+                "memory_entries": len(self._entries),
+                "memory_bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+                "disk_entries": disk_entries,
+            }
+
+
+def cached_embeddings(embeddings: Embeddings, **kwargs) -> CachedEmbeddings:
+    """按环境变量配置创建带缓存的嵌入模型"""
+    kwargs.setdefault("db_path", DEFAULT_DB_PATH if DISK_CACHE_ENABLED else None)
+    return CachedEmbeddings(embeddings, **kwargs)
@@ -0,0 +1,152 @@
+"""
+嵌入模型提供者 - 进程内只加载一次，首次使用时加载或在应用启动时后台预热
+
+状态依次为 idle（未加载）→ loading → ready / failed。检索代码持有LazyEmbeddings，
+创建检索工具时不加载模型，第一次计算向量时才等待加载完成。
+设置 EMBEDDING_SERVER 时不在本进程加载模型，而是连接共享嵌入服务（见embedding_server），
+多个uvicorn工作进程共用一份模型内存。
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain.embeddings.base import Embeddings
+
+from .embedding_cache import embed_queries
+
+logger = logging.getLogger("embedding_provider")
+
+# 嵌入模型名称，与HuggingFaceEmbeddings的默认模型相同
+DEFAULT_MODEL_NAME = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-mpnet-base-v2")
+# 共享嵌入服务的Unix套接字路径，为空时在本进程加载模型
+EMBEDDING_SERVER = os.getenv("EMBEDDING_SERVER", "")
+# 是否在应用启动时后台预热
+EMBEDDING_WARMUP = os.getenv("EMBEDDING_WARMUP", "0") not in ("0", "false", "no")
+
+
+def load_local_embeddings(model_name: str = DEFAULT_MODEL_NAME) -> Embeddings:
+    """在本进程加载HuggingFace嵌入模型"""
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name=model_name)
+
+
+def create_embeddings(model_name: str = DEFAULT_MODEL_NAME, server: str = EMBEDDING_SERVER) -> Embeddings:
+    """按配置创建嵌入模型：连接共享服务或在本进程加载"""
+    if server:
+        from .embedding_server import RemoteEmbeddings
+        remote = RemoteEmbeddings(server, model_name=model_name)
+        served_model = remote.ping()
+        if served_model and served_model != model_name:
+            logger.warning(f"共享嵌入服务使用的模型 {served_model} 与配置的 {model_name} 不一致")
+        return remote
+    return load_local_embeddings(model_name)
+
+
+class EmbeddingProvider:
+    """延迟加载、进程内共享的嵌入模型"""
+
+    def __init__(self, factory: Optional[Callable[[], Embeddings]] = None, model_name: str = DEFAULT_MODEL_NAME):
+        self.model_name = model_name
+        self._factory = factory or (lambda: create_embeddings(model_name))
+        self._embeddings: Optional[Embeddings] = None
+        self._state = "idle"
+        self._error: Optional[str] = None
+        self._load_seconds: Optional[float] = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def is_ready(self) -> bool:
+        return self._state == "ready"
+
+    def _load(self) -> None:
+        start = time.perf_counter()
+        try:
+            embeddings = self._factory()
+        except Exception as e:
+            logger.error(f"加载嵌入模型失败: {e}")
+            with self._lock:
+                self._state = "failed"
+                self._error = str(e)
+        else:
+            with self._lock:
+                self._embeddings = embeddings
+                self._state = "ready"
+                self._load_seconds = time.perf_counter() - start
+            logger.info(f"嵌入模型 {self.model_name} 已就绪，耗时 {self._load_seconds:.1f} 秒")
+        finally:
+            self._done.set()
+
+    def _start(self) -> bool:
+        """idle或failed时切换到loading，返回是否由调用方负责加载"""
+        with self._lock:
+            if self._state in ("idle", "failed"):
+                self._state = "loading"
+                self._error = None
+                self._done.clear()
+                return True
+            return False
+
+    def warmup(self) -> None:
+        """在后台线程中加载模型，不阻塞调用方"""
+        if self._start():
+            threading.Thread(target=self._load, name="embedding-warmup", daemon=True).start()
+
+    def get(self, timeout: Optional[float] = None) -> Embeddings:
+        """获取嵌入模型，未加载时在当前线程加载，正在加载时等待完成"""
+        if self._state == "ready":
+            return self._embeddings
+        if self._start():
+            self._load()
+        elif not self._done.wait(timeout):
+            raise TimeoutError("等待嵌入模型加载超时")
+        if self._state != "ready":
+            raise RuntimeError(f"嵌入模型不可用: {self._error}")
+        return self._embeddings
+
+    def status(self) -> Dict[str, Any]:
+        """就绪状态，供健康检查使用"""
+        with self._lock:
+            return {
+                "state": self._state,
+                "model": self.model_name,
+                "mode": "remote" if EMBEDDING_SERVER else "local",
+                "load_seconds": self._load_seconds,
+                "error": self._error,
+            }
+
+
+class LazyEmbeddings(Embeddings):
+    """代理到EmbeddingProvider的嵌入模型，第一次计算时才加载"""
+
+    def __init__(self, provider: Optional["EmbeddingProvider"] = None):
+        self.provider = provider or get_embedding_provider()
+        self.model_name = self.provider.model_name
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.provider.get().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.provider.get().embed_query(text)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return embed_queries(self.provider.get(), texts)
+
+
+_provider: Optional[EmbeddingProvider] = None
+_provider_lock = threading.Lock()
+
+
+def get_embedding_provider() -> EmbeddingProvider:
+    """获取进程内共享的嵌入模型提供者"""
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            _provider = EmbeddingProvider()
+        return _provider
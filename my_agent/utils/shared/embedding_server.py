@@ -0,0 +1,237 @@
+"""
+共享嵌入模型服务 - 一个常驻进程加载模型，其他uvicorn工作进程通过本地套接字调用
+
+多个工作进程各自加载嵌入模型时内存随进程数成倍增加。启动一个服务进程：
+
+    python -m my_agent.utils.shared.embedding_server --socket /tmp/embedding.sock
+
+再为API进程设置 EMBEDDING_SERVER=/tmp/embedding.sock，检索时即改用RemoteEmbeddings。
+通信使用 multiprocessing.connection（Unix套接字 + authkey认证），
+请求为 (方法名, 参数)，响应为 ("ok", 结果) 或 ("error", 错误信息)，向量以float32数组传输。
+
+连接上传输的是pickle数据，authkey必须保密：优先使用环境变量 EMBEDDING_SERVER_AUTHKEY，
+未设置时服务进程生成随机密钥写入套接字旁的 <套接字路径>.key（权限0600），同一用户的客户端从中读取。
+"""
+
+import argparse
+import logging
+import os
+import queue
+import secrets
+import stat
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+from typing import Any, List, Optional
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+
+from .embedding_cache import embed_queries
+
+logger = logging.getLogger("embedding_server")
+
+# 客户端与服务进程共用的认证密钥，为空时使用套接字旁的密钥文件
+DEFAULT_AUTHKEY = os.getenv("EMBEDDING_SERVER_AUTHKEY", "").encode("utf-8") or None
+# 自动生成的密钥长度（字节）
+AUTHKEY_BYTES = 32
+# 单次调用的超时时间（秒），包括服务进程排队等待模型的时间
+DEFAULT_TIMEOUT = float(os.getenv("EMBEDDING_SERVER_TIMEOUT", "120"))
+# 每个客户端进程保留的空闲连接数
+MAX_IDLE_CONNECTIONS = 4
+
+
+class EmbeddingServerError(Exception):
+    """共享嵌入服务调用失败"""
+
+
+def authkey_path(address: str) -> str:
+    """未设置EMBEDDING_SERVER_AUTHKEY时使用的密钥文件"""
+    return f"{address}.key"
+
+
+def load_authkey(address: str, create: bool = False) -> bytes:
+    """读取套接字对应的密钥文件；create为True且文件不存在时生成随机密钥
+
+    Raises:
+        EmbeddingServerError: 密钥文件不存在，或其他用户可以读写
+    """
+    path = authkey_path(address)
+    if create:
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            pass
+        else:
+            with os.fdopen(fd, "wb") as f:
+                f.write(secrets.token_bytes(AUTHKEY_BYTES))
+    try:
+        with open(path, "rb") as f:
+            if stat.S_IMODE(os.fstat(f.fileno()).st_mode) & 0o077:
+                raise EmbeddingServerError(f"嵌入服务密钥文件 {path} 的权限过宽，应为0600")
+            authkey = f.read()
+    except FileNotFoundError:
+        raise EmbeddingServerError(f"未设置EMBEDDING_SERVER_AUTHKEY，且找不到嵌入服务的密钥文件 {path}")
+    if not authkey:
+        raise EmbeddingServerError(f"嵌入服务密钥文件 {path} 为空")
+    return authkey
+
+
+class EmbeddingServer:
+    """在一个进程中加载模型，为多个客户端连接提供嵌入计算"""
+
+    def __init__(self, embeddings: Embeddings, address: str, authkey: Optional[bytes] = DEFAULT_AUTHKEY,
+                 model_name: Optional[str] = None):
+        self.embeddings = embeddings
+        self.address = address
+        self.authkey = authkey or load_authkey(address, create=True)
+        self.model_name = model_name
+        # 模型推理串行执行，避免多个请求同时占用内存和CPU
+        self._model_lock = threading.Lock()
+        self._listener: Optional[Listener] = None
+        self._stopped = threading.Event()
+
+    def _call(self, method: str, payload: Any):
+        if method == "ping":
+            return self.model_name
+        with self._model_lock:
+            if method == "embed_documents":
+                return np.asarray(self.embeddings.embed_documents(list(payload)), dtype=np.float32)
+            if method == "embed_query":
+                return np.asarray(self.embeddings.embed_query(payload), dtype=np.float32)
+            if method == "embed_queries":
+                return np.asarray(embed_queries(self.embeddings, list(payload)), dtype=np.float32)
+        raise ValueError(f"未知的方法: {method}")
+
+    def _serve_connection(self, conn) -> None:
+        with conn:
+            while not self._stopped.is_set():
+                try:
+                    method, payload = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    response = ("ok", self._call(method, payload))
+                except Exception as e:
+                    logger.error(f"嵌入计算失败: {e}")
+                    response = ("error", str(e))
+                try:
+                    conn.send(response)
+                except OSError:
+                    return
+
+    def serve_forever(self, ready: Optional[threading.Event] = None) -> None:
+        if os.path.exists(self.address):
+            os.remove(self.address)
+        # 套接字文件在bind时按umask创建，创建后再chmod会留下其他用户可以连接的窗口
+        umask = os.umask(0o177)
+        try:
+            self._listener = Listener(self.address, family="AF_UNIX", authkey=self.authkey)
+        finally:
+            os.umask(umask)
+        logger.info(f"嵌入服务已启动: {self.address}")
+        if ready is not None:
+            ready.set()
+        while not self._stopped.is_set():
+            try:
+                conn = self._listener.accept()
+            except AuthenticationError:
+                logger.warning("拒绝了认证失败的连接")
+                continue
+            except OSError:
+                if self._stopped.is_set():
+                    break
+                logger.warning("接受连接失败", exc_info=True)
+                continue
+            threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+    def close(self) -> None:
+        self._stopped.set()
+        if self._listener is not None:
+            self._listener.close()
+        if os.path.exists(self.address):
+            os.remove(self.address)
+
+
+class RemoteEmbeddings(Embeddings):
+    """通过共享嵌入服务计算向量的客户端，可在多个线程中使用"""
+
+    def __init__(self, address: str, authkey: Optional[bytes] = DEFAULT_AUTHKEY, timeout: float = DEFAULT_TIMEOUT,
+                 model_name: Optional[str] = None):
+        self.address = address
+        self.authkey = authkey or load_authkey(address)
+        self.timeout = timeout
+        self.model_name = model_name
+        self._idle: "queue.LifoQueue" = queue.LifoQueue(MAX_IDLE_CONNECTIONS)
+
+    def _request(self, method: str, payload: Any):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+        # 复用的空闲连接可能已被服务端关闭，失败后换新连接重试一次
+        for attempt in range(2):
+            if conn is None:
+                try:
+                    conn = Client(self.address, family="AF_UNIX", authkey=self.authkey)
+                except (OSError, EOFError, AuthenticationError) as e:
+                    raise EmbeddingServerError(f"无法连接嵌入服务 {self.address}: {e}")
+            try:
+                conn.send((method, payload))
+                if not conn.poll(self.timeout):
+                    conn.close()
+                    raise EmbeddingServerError(f"嵌入服务响应超时（{self.timeout}秒）")
+                status, result = conn.recv()
+            except (OSError, EOFError) as e:
+                conn.close()
+                conn = None
+                if attempt:
+                    raise EmbeddingServerError(f"嵌入服务连接中断: {e}")
+                continue
+            try:
+                self._idle.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+            if status != "ok":
+                raise EmbeddingServerError(result)
+            return result
+
+    def ping(self) -> Optional[str]:
+        """检查服务是否可用，返回服务端的模型名称"""
+        return self._request("ping", None)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return self._request("embed_documents", list(texts)).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._request("embed_query", text).tolist()
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return self._request("embed_queries", list(texts)).tolist()
+
+
+def main():
+    from .embedding_provider import DEFAULT_MODEL_NAME, load_local_embeddings
+
+    parser = argparse.ArgumentParser(description="共享嵌入模型服务")
+    parser.add_argument("--socket", default=os.getenv("EMBEDDING_SERVER", "/tmp/embedding.sock"),
+                        help="Unix套接字路径")
+    parser.add_argument("--model", default=DEFAULT_MODEL_NAME, help="嵌入模型名称")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    server = EmbeddingServer(load_local_embeddings(args.model), args.socket, model_name=args.model)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
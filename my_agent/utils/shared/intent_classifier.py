@@ -1,70 +1,221 @@
+"""
+意图识别 - 所有规则预先编译为一个组合正则，一次匹配得到意图和待纠错文本
+
+原来每条消息按顺序调用十余次 re.search（stream_chat中还要再试八个文本提取模式）。
+这里把各组规则放进锚定在开头的零宽断言中：
+    \\A (重新纠错|纠错|写作|聊天) (历史消息纠错)? (待纠错文本)?
+每个断言内部的匹配方式与单独调用 re.search 相同，分组按原来的优先级排列，
+因此结果与逐条匹配完全一致，但只需要一次 match 调用。结果按消息内容做LRU缓存。
+"""
+
+import os
 import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional
+
+# 意图识别结果的缓存条数
+DEFAULT_MEMO_SIZE = int(os.getenv("INTENT_MEMO_SIZE", "4096"))
+# 超过该长度的消息（通常是整段待纠错文本）不缓存
+MEMO_MAX_CHARS = 1024
+# 批量识别时每个任务包含的消息条数
+DEFAULT_BATCH_SIZE = 2048
+
+# 重新纠错命令
+RECORRECTION_PATTERNS = [
+    r'(再次|重新|再|重做|重试).*(纠错|修正|修改)',
+    r'(不满意|不够好|不行|不好).*(结果|纠错|修正)',
+    r'(改进|优化|提高).*(纠错|修正|修改|结果)',
+    r'这个(纠错|修正|修改|结果).*(不满意|不够好|不行|不好)',
+]
+
+# 要求纠错历史消息
+HISTORY_CORRECTION_PATTERNS = [
+    r'(对|把|将)(刚刚|上一句|前面|之前).*(纠错|修正|修改|检查错误)',
+    r'(纠错|修正|修改|检查错误).*(刚刚|上一句|前面|之前)',
+]
+
+# 明确的纠错请求
+CORRECTION_PATTERNS = [
+    r'(请|帮我|帮忙|需要|想要|可以).*(纠错|修正|修改|检查错误)',
+    r'(纠错|修正|修改|检查错误).*(这|以下|如下|我的)',
+    r'公文纠错',
+] + HISTORY_CORRECTION_PATTERNS
+
+WRITING_PATTERNS = [r'写作|润色|改写|优化']
+
+# 从消息中提取待纠错的文本，如"对下面的句子进行公文纠错：……"、"帮我纠错：……"
+# "公文纠错：""请纠错：""进行公文纠错："等写法都能由"纠错："匹配到同样的文本
+PAYLOAD_PATTERNS = [
+    r"对.*句子.*纠错[:：](.+)",
+    r"纠错[:：](.+)",
+    r"润色[:：](.+)",
+    r"修改[:：](.+)",
+]
+
+INTENTS = ("recorrection", "correction", "writing")
+
+
+@dataclass(frozen=True)
+class IntentResult:
+    """一条消息的识别结果
+
+    intent为 recorrection / correction / writing / chat；
+    payload为消息中"纠错：""润色："等后面的文本，没有时为None。
+    """
+    intent: str
+    history: bool = False
+    payload: Optional[str] = None
+
+
+def _anywhere(patterns: List[str], flags: str = "") -> str:
+    """与 re.search 等价的零宽断言：[\\s\\S]*? 从左到右尝试每个起点，规则内的 . 仍不匹配换行"""
+    body = "|".join(f"(?:{pattern})" for pattern in patterns)
+    if flags:
+        body = f"(?{flags}:{body})"
+    return rf"(?=[\s\S]*?(?:{body}))"
+
+
+def _strip_groups(pattern: str) -> str:
+    """把规则中的捕获分组改为非捕获分组，避免与组合正则的分组编号冲突"""
+    return re.sub(r"(?<!\\)\((?!\?)", "(?:", pattern)
+
+
+def build_intent_pattern() -> "re.Pattern":
+    """编译组合正则"""
+    intent_branches = [
+        _anywhere([_strip_groups(p) for p in RECORRECTION_PATTERNS], "i") + "(?P<recorrection>)",
+        _anywhere([_strip_groups(p) for p in CORRECTION_PATTERNS], "i") + "(?P<correction>)",
+        _anywhere([_strip_groups(p) for p in WRITING_PATTERNS]) + "(?P<writing>)",
+        "",
+    ]
+    history = _anywhere([_strip_groups(p) for p in HISTORY_CORRECTION_PATTERNS], "i") + "(?P<history>)"
+    payload_branches = []
+    for index, pattern in enumerate(PAYLOAD_PATTERNS):
+        # 每个提取模式只保留一个捕获分组，改为命名分组
+        named = _strip_groups(pattern.replace("(.+)", "\0")).replace("\0", f"(?P<payload{index}>.+)")
+        payload_branches.append(f"(?=[\\s\\S]*?(?s:{named}))")
+    return re.compile(
+        r"\A(?:" + "|".join(intent_branches) + ")"
+        + f"(?:{history})?"
+        + "(?:" + "|".join(payload_branches) + ")?"
+    )
+
+
+class IntentEngine:
+    """预编译的意图识别器，按消息内容缓存结果"""
+
+    def __init__(self, memo_size: int = DEFAULT_MEMO_SIZE):
+        self.pattern = build_intent_pattern()
+        self._payload_groups = [f"payload{i}" for i in range(len(PAYLOAD_PATTERNS))]
+        self._memo = lru_cache(maxsize=memo_size)(self._analyze)
+
+    def _analyze(self, message: str) -> IntentResult:
+        groups = self.pattern.match(message).groupdict()
+        intent = next((name for name in INTENTS if groups[name] is not None), "chat")
+        payload = next((groups[name] for name in self._payload_groups if groups[name] is not None), None)
+        return IntentResult(intent, groups["history"] is not None,
+                            payload.strip() if payload is not None else None)
+
+    def analyze(self, message: str) -> IntentResult:
+        """识别意图并提取待纠错文本"""
+        if len(message) > MEMO_MAX_CHARS:
+            return self._analyze(message)
+        return self._memo(message)
+
+    def cache_info(self):
+        return self._memo.cache_info()
+
+    def cache_clear(self) -> None:
+        self._memo.cache_clear()
+
+
+_engine: Optional[IntentEngine] = None
+
+
+def get_intent_engine() -> IntentEngine:
+    """获取进程内共享的意图识别器"""
+    global _engine
+    if _engine is None:
+        _engine = IntentEngine()
+    return _engine
+
+
+def _chunks(messages: Iterable[str], size: int) -> Iterator[List[str]]:
+    iterator = iter(messages)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _classify_chunk(chunk: List[str], timed: bool = False) -> list:
+    """识别一批消息，在进程池中执行时使用子进程自己的识别器和缓存"""
+    analyze = get_intent_engine().analyze
+    if not timed:
+        return [analyze(message).intent for message in chunk]
+    results = []
+    for message in chunk:
+        start = time.perf_counter()
+        intent = analyze(message).intent
+        results.append((intent, time.perf_counter() - start))
+    return results
+
+
+def classify_many(messages: Iterable[str], workers: int = 1, batch_size: int = DEFAULT_BATCH_SIZE,
+                  timed: bool = False) -> Iterator:
+    """按输入顺序逐条产出意图，不需要把全部消息读入内存
+
+    workers大于1时按batch_size分批交给进程池，同时在途的批次不超过进程数的两倍；
+    timed为True时产出 (意图, 识别耗时秒数)。
+    """
+    chunks = _chunks(messages, batch_size)
+    if workers <= 1:
+        for chunk in chunks:
+            yield from _classify_chunk(chunk, timed)
+        return
+
+    executor = ProcessPoolExecutor(max_workers=workers)
+    pending = deque()
+    try:
+        for chunk in chunks:
+            pending.append(executor.submit(_classify_chunk, chunk, timed))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        # 调用方提前停止迭代时取消尚未开始的批次
+        executor.shutdown(cancel_futures=True)
+
 
 class IntentClassifier:
+    @staticmethod
+    def analyze(user_input: str) -> IntentResult:
+        """一次匹配得到意图、是否纠错历史消息以及待纠错文本"""
+        return get_intent_engine().analyze(user_input)
+
     @staticmethod
     def classify(user_input: str) -> str:
-        # 识别重新纠错命令
-        recorrection_patterns = [
-            r'(再次|重新|再|重做|重试).*(纠错|修正|修改)',
-            r'(不满意|不够好|不行|不好).*(结果|纠错|修正)',
-            r'(改进|优化|提高).*(纠错|修正|修改|结果)',
-            r'这个(纠错|修正|修改|结果).*(不满意|不够好|不行|不好)',
-        ]
-        
-        # 先检查是否是重新纠错请求
-        for pattern in recorrection_patterns:
-            if re.search(pattern, user_input, re.IGNORECASE):
-                return "recorrection"
-        
-        # 更精确的纠错关键词匹配，确保是明确的纠错请求
-        correction_patterns = [
-            r'(请|帮我|帮忙|需要|想要|可以).*(纠错|修正|修改|检查错误)',
-            r'(纠错|修正|修改|检查错误).*(这|以下|如下|我的)',
-            r'公文纠错',
-            r'(对|把|将)(刚刚|上一句|前面|之前).*(纠错|修正|修改|检查错误)',
-            r'(纠错|修正|修改|检查错误).*(刚刚|上一句|前面|之前)'
-        ]
-        
-        writing_keywords = r'写作|润色|改写|优化'
-        
-        # 检查是否匹配任何纠错模式
-        for pattern in correction_patterns:
-            if re.search(pattern, user_input, re.IGNORECASE):
-                return "correction"
-                
-        # 检查是否匹配写作关键词
-        if re.search(writing_keywords, user_input):
-            return "writing"
-            
-        # 默认为聊天意图
-        return "chat"
-        
+        return get_intent_engine().analyze(user_input).intent
+
+    @staticmethod
+    def classify_many(user_inputs: Iterable[str], workers: int = 1,
+                      batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[str]:
+        """批量识别意图，用于回放聊天日志等离线分析"""
+        return classify_many(user_inputs, workers, batch_size)
+
     @staticmethod
     def is_history_correction(user_input: str) -> bool:
         """检查是否是要求纠错历史消息的请求"""
-        history_correction_patterns = [
-            r'(对|把|将)(刚刚|上一句|前面|之前).*(纠错|修正|修改|检查错误)',
-            r'(纠错|修正|修改|检查错误).*(刚刚|上一句|前面|之前)'
-        ]
-        
-        for pattern in history_correction_patterns:
-            if re.search(pattern, user_input, re.IGNORECASE):
-                return True
-                
-        return False
-        
+        return get_intent_engine().analyze(user_input).history
+
     @staticmethod
     def is_recorrection(user_input: str) -> bool:
         """检查是否是要求重新纠错的请求"""
-        recorrection_patterns = [
-            r'(再次|重新|再|重做|重试).*(纠错|修正|修改)',
-            r'(不满意|不够好|不行|不好).*(结果|纠错|修正)',
-            r'(改进|优化|提高).*(纠错|修正|修改|结果)',
-            r'这个(纠错|修正|修改|结果).*(不满意|不够好|不行|不好)',
-        ]
-        
-        for pattern in recorrection_patterns:
-            if re.search(pattern, user_input, re.IGNORECASE):
-                return True
-                
-        return False
\ No newline at end of file
+        return get_intent_engine().analyze(user_input).intent == "recorrection"
\ No newline at end of file
@@ -0,0 +1,135 @@
+"""
+元数据过滤索引 - 每个 (字段, 取值) 对应一个升序的文档下标列表，写入时建立
+
+除text外，取值为字符串、数字、布尔值（或由它们组成的列表）的字段都会建立索引，
+例如部门、文种、年份。过滤条件 {"department": "办公厅", "year": [2022, 2023]} 表示各字段之间为“且”，
+列表中的多个取值为“或”；查询只需对下标列表求交集和并集，检索时只计算命中的行。
+存储结构与词法索引相同：CSR数组加上次保存之后追加的列表，文件为库目录下的 filter_index.npz。
+"""
+
+import json
+import os
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+FILTER_INDEX_FILE = "filter_index.npz"
+# 不建立索引的字段
+EXCLUDED_FIELDS = frozenset({"text"})
+# 超过该长度的字符串取值不建立索引
+MAX_VALUE_CHARS = 256
+
+
+def make_filter_key(field: str, value: Any) -> str:
+    """字段和取值的索引键；保留取值类型，2023与"2023"是不同的键"""
+    return json.dumps([field, value], ensure_ascii=False)
+
+
+def filter_keys(metadata: dict) -> List[str]:
+    """一条元数据的全部索引键"""
+    keys = []
+    for field, value in metadata.items():
+        if field in EXCLUDED_FIELDS:
+            continue
+        for item in (value if isinstance(value, list) else [value]):
+            if isinstance(item, str) and len(item) > MAX_VALUE_CHARS:
+                continue
+            if isinstance(item, (str, int, float, bool)):
+                keys.append(make_filter_key(field, item))
+    return keys
+
+
+class MetadataIndex:
+    """元数据倒排索引"""
+
+    def __init__(self, keys: Iterable[str] = (), offsets=None, doc_ids=None, indexed_count: int = 0):
+        self._keys: Dict[str, int] = {key: i for i, key in enumerate(keys)}
+        self._offsets = offsets if offsets is not None else np.zeros(1, dtype=np.int64)
+        self._doc_ids = doc_ids if doc_ids is not None else np.empty(0, dtype=np.int32)
+        # 上次保存之后追加的下标列表，保存时合并进CSR数组
+        self._extra: Dict[str, List[np.ndarray]] = defaultdict(list)
+        self.indexed_count = indexed_count
+        self.dirty = False
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self.indexed_count
+
+    def add(self, metadatas: List[dict], start: int) -> None:
+        """把下标从start开始的一批元数据加入索引"""
+        postings = defaultdict(list)
+        for offset, metadata in enumerate(metadatas):
+            # 列表取值中可能有重复，每个键只记录一次
+            for key in dict.fromkeys(filter_keys(metadata)):
+                postings[key].append(start + offset)
+        with self._lock:
+            if start != self.indexed_count:
+                raise ValueError(f"过滤索引已有 {self.indexed_count} 条文档，不能从下标 {start} 追加")
+            for key, ids in postings.items():
+                self._extra[key].append(np.array(ids, dtype=np.int32))
+            self.indexed_count += len(metadatas)
+            self.dirty = True
+
+    def _postings(self, key: str) -> np.ndarray:
+        parts = []
+        key_id = self._keys.get(key)
+        if key_id is not None:
+            parts.append(self._doc_ids[self._offsets[key_id]:self._offsets[key_id + 1]])
+        parts.extend(self._extra.get(key, ()))
+        if not parts:
+            return np.empty(0, dtype=np.int32)
+        # 追加的下标都大于已有下标，拼接后仍为升序
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def match(self, filter: Dict[str, Any]) -> np.ndarray:
+        """满足过滤条件的文档下标（升序）"""
+        result: Optional[np.ndarray] = None
+        with self._lock:
+            for field, expected in filter.items():
+                values = expected if isinstance(expected, (list, tuple, set)) else [expected]
+                parts = [self._postings(make_filter_key(field, value)) for value in values]
+                if not parts:
+                    ids = np.empty(0, dtype=np.int32)
+                elif len(parts) == 1:
+                    ids = parts[0]
+                else:
+                    ids = np.unique(np.concatenate(parts))
+                result = ids if result is None else np.intersect1d(result, ids, assume_unique=True)
+                if not result.size:
+                    break
+        if result is None:
+            return np.arange(self.indexed_count, dtype=np.int64)
+        return result.astype(np.int64)
+
+    def save(self, path: str) -> None:
+        """把追加的下标列表合并进CSR数组，写入临时文件后整体替换"""
+        with self._lock:
+            keys = list(self._keys)
+            keys.extend(key for key in self._extra if key not in self._keys)
+            parts = [self._postings(key) for key in keys]
+            offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+            np.cumsum(np.array([part.size for part in parts], dtype=np.int64), out=offsets[1:])
+            doc_ids = np.concatenate(parts) if parts else np.empty(0, dtype=np.int32)
+            self._keys = {key: i for i, key in enumerate(keys)}
+            self._offsets, self._doc_ids = offsets, doc_ids
+            self._extra = defaultdict(list)
+            indexed_count = self.indexed_count
+            self.dirty = False
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            # 索引键是不含换行符的JSON，按行拼接后以字节保存，避免定长字符串数组按最长的键分配空间
+            np.savez(f, keys=np.frombuffer("\n".join(keys).encode("utf-8"), dtype=np.uint8),
+                     offsets=offsets, doc_ids=doc_ids,
+                     indexed_count=np.int64(indexed_count))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "MetadataIndex":
+        with np.load(path) as data:
+            blob = data["keys"].tobytes().decode("utf-8")
+            return cls(blob.split("\n") if blob else [], data["offsets"], data["doc_ids"],
+                       int(data["indexed_count"]))
@@ -1,89 +1,559 @@
 import os
 import json
 import numpy as np
-from typing import List, Tuple, Optional
+from typing import List, Sequence, Tuple, Optional
 from langchain.schema import Document
 from langchain.embeddings.base import Embeddings
 from langchain.vectorstores.base import VectorStore
-from langchain.embeddings import HuggingFaceEmbeddings
+
+from .embedding_cache import cached_embeddings, embed_queries
+from .embedding_provider import LazyEmbeddings
+from .lexical_index import LEXICAL_INDEX_FILE, LexicalIndex
+from .metadata_index import FILTER_INDEX_FILE, MetadataIndex
+from .vector_ivf import DEFAULT_NPROBE, INDEX_FILE, TRAIN_POINTS_PER_LIST, IVFIndex, default_nlist
+from .vector_segments import SegmentSnapshot, SegmentStore
+
+
+def normalize_vectors(vectors) -> np.ndarray:
+    """转换为连续的float32矩阵并按行归一化，零向量保持为零"""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+# 批量查询时每次与查询矩阵相乘的向量行数，限制分数矩阵的大小
+QUERY_BLOCK_ROWS = 65536
+# 倒数排名融合（RRF）的平滑常数
+RRF_K = 60
+# 向量量化方式：空表示只用float32，int8表示扫描量化向量后用float32向量重排
+VECTOR_DB_QUANTIZATION = os.getenv("VECTOR_DB_QUANTIZATION", "") or None
+# 量化检索时每个查询重排的候选数为 k 的多少倍
+DEFAULT_RERANK_FACTOR = int(os.getenv("VECTOR_DB_RERANK_FACTOR", "8"))
+# 扫描量化向量时每次转换为float32的行数，限制临时数组的大小
+QUANT_BLOCK_ROWS = 8192
+# RetrievalTool的检索方式：dense（向量）、lexical（BM25）或hybrid（二者融合）
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "dense")
+# 混合检索时只对BM25分数最高的若干条计算向量相似度，0表示不预筛选
+RETRIEVAL_PREFILTER_K = int(os.getenv("RETRIEVAL_PREFILTER_K", "0"))
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """分数最高的k个下标，按分数从高到低排列
+
+    argpartition只需线性时间选出前k个，再对这k个排序，不必对全部分数排序。
+    """
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < scores.shape[0]:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(scores.shape[0])
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def top_k_rows(scores: np.ndarray, k: int) -> np.ndarray:
+    """分数矩阵每一行分数最高的k个列下标，按分数从高到低排列"""
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    if k < scores.shape[1]:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(scores.shape[1]), scores.shape).copy()
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=1)
 
 
 class CustomVectorDB(VectorStore):
-    """自定义本地向量数据库，支持高效相似度检索"""
+    """自定义本地向量数据库，支持高效相似度检索
+
+    向量在写入时归一化为float32，余弦相似度即为矩阵-向量乘积。数据按批次保存为只追加的分段文件，
+    查询时以内存映射方式读取（见vector_segments）；read_only=True 时不写入也不合并，
+    适合多个工作进程共享同一个库。
+    调用build_index()后查询改用IVF近似索引（见vector_ivf），通过nprobe在召回率和速度之间取舍。
+    写入时同时维护BM25词法索引（见lexical_index），供按法规名称、文号等精确词检索和混合检索使用，
+    以及元数据过滤索引（见metadata_index），检索时可用filter限定部门、文种、年份等，只计算满足条件的行。
+    quantization="int8" 时另存每行量化的int8向量，检索扫描量化向量选出 k*rerank_factor 个候选，
+    再用磁盘上的float32向量重排；exact=True时不使用量化向量。
+    每个文档有稳定的文档编号（默认为写入时的行号，也可由ids指定）：add_texts传入已有的编号即更新，
+    delete按编号删除；删除只写入墓碑，空间由后台合并回收。每次检索使用同一个快照，
+    不受同时进行的写入、删除和合并影响。
+    """
     
-    def __init__(self, embeddings: Embeddings, db_path: str):
+    def __init__(self, embeddings: Embeddings, db_path: str, read_only: bool = False,
+                 quantization: Optional[str] = VECTOR_DB_QUANTIZATION):
         # 确保存储路径存在
         os.makedirs(db_path, exist_ok=True)
         
-        self.embeddings = embeddings
+        # VectorStore.embeddings是只读属性，保存在_embeddings中
+        self._embeddings = embeddings
         self.db_path = db_path
-        self.vectors = np.empty((0,))  # 使用numpy数组提升性能
-        self.metadata = []
+        self.read_only = read_only
+        self.index: Optional[IVFIndex] = None
+        self.nprobe = DEFAULT_NPROBE
+        self.rerank_factor = DEFAULT_RERANK_FACTOR
+        self._index_version = None
+        self.lexical = LexicalIndex()
+        self._lexical_version = None
+        self.filters = MetadataIndex()
+        self._filters_version = None
         
         # 自动加载已有数据
         try:
             self.load()
         except FileNotFoundError:
             print("Initialize new vector database")
+        if quantization is not None and not read_only and self._store.quantization != quantization:
+            self.set_quantization(quantization)
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embeddings
+
+    @property
+    def metadata(self) -> Sequence[dict]:
+        """按行号读取的元数据视图，读取时才解析；已删除的行为None"""
+        return self._store.metadata
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """全部未删除的向量合并后的矩阵（复制一份，仅用于调试和导出）"""
+        segments = self._store.segments
+        if not segments:
+            return np.empty((0, self._store.dim or 0), dtype=np.float32)
+        return np.concatenate([segment.vectors if segment.deleted is None else segment.vectors[~segment.deleted]
+                               for segment in segments])
+
+    def add_embeddings(self, texts: List[str], embeddings, metadatas: Optional[List[dict]] = None,
+                       ids: Optional[List[Optional[str]]] = None) -> List[str]:
+        """添加已计算好的嵌入向量，写入一个新的分段，返回文档编号
+
+        ids中已存在的编号会替换原来的文档；不指定或为None的使用默认编号（行号）。
+        十进制整数形式的编号保留给默认编号，只能用于更新已有的文档。
+        """
+        metadatas = metadatas or [{}] * len(texts)
+        if len(texts) != len(metadatas) or len(texts) != len(embeddings):
+            raise ValueError("Texts, embeddings and metadatas must have the same length")
+        if ids is not None and len(ids) != len(texts):
+            raise ValueError("Texts and ids must have the same length")
+        if not texts:
+            return []
+
+        vectors = normalize_vectors(embeddings)
+        start = self._store.append(vectors, list(metadatas), list(ids) if ids is not None else None)
+        if self.index is not None:
+            self.index.add(vectors, start)
+        self.lexical.add([metadata.get("text", "") for metadata in metadatas], start)
+        self.filters.add(list(metadatas), start)
+        if ids is None:
+            return [str(i) for i in range(start, start + len(texts))]
+        return [str(start + i) if doc_id is None else doc_id for i, doc_id in enumerate(ids)]
 
-    def add_texts(self, texts: List[str], metadatas: Optional[List[dict]] = None) -> List[str]:
-        """添加文本并生成嵌入向量"""
+    def add_texts(self, texts: List[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[Optional[str]]] = None, **kwargs) -> List[str]:
+        """添加文本并生成嵌入向量；ids为文档编号，已存在的编号按更新处理"""
         # 参数校验
         metadatas = metadatas or [{}] * len(texts)
         if len(texts) != len(metadatas):
             raise ValueError("Texts and metadatas must have the same length")
         
         # 批量生成嵌入向量
-        embeds = self.embeddings.embed_documents(texts)
-        embeds_np = np.array(embeds)
-        
-        # 更新存储
-        self.vectors = np.vstack([self.vectors, embeds_np]) if self.vectors.size else embeds_np
-        self.metadata.extend(metadatas)
-        
-        self.save()
-        return [str(i) for i in range(len(self.metadata)-len(texts), len(self.metadata))]
+        return self.add_embeddings(texts, self.embeddings.embed_documents(texts), metadatas, ids)
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs) -> Optional[bool]:
+        """按文档编号删除，返回是否删除了文档
+
+        删除只写入墓碑，之后的检索立即不再返回这些文档；磁盘空间在后台合并重写分段时回收。
+        """
+        if not ids:
+            return False
+        return self._store.delete(list(ids)) > 0
+
+    def get_by_ids(self, ids: Sequence[str], /) -> List[Document]:
+        """按文档编号取出文档，不存在或已删除的编号跳过"""
+        snapshot = self._store.snapshot
+        rows = snapshot.find(list(ids))
+        return [self._to_document(snapshot, int(row)) for row in rows if row >= 0]
+
+    def _to_document(self, snapshot: SegmentSnapshot, idx: int) -> Document:
+        metadata = snapshot.record(idx)
+        return Document(
+            id=snapshot.document_id(idx),
+            page_content=metadata.get("text", ""),  # 假设metadata存储原始文本
+            metadata=metadata
+        )
+
+    def _filtered_candidates(self, snapshot: SegmentSnapshot, queries: np.ndarray, k: int, filter: dict,
+                             nprobe: Optional[int] = None, exact: bool = False) -> np.ndarray:
+        """满足过滤条件且未删除的候选行号（升序）
+
+        命中的行不多于IVF索引预计扫描的行数时全部计算；否则只取与nprobe个倒排列表的交集，
+        交集不足k条时仍计算全部命中的行。
+        """
+        allowed = self.filters.match(filter)
+        allowed = allowed[snapshot.live(allowed)]
+        if self.index is None or exact or not allowed.size:
+            return allowed
+        nprobe = nprobe or self.nprobe
+        if allowed.size * self.index.nlist <= len(snapshot) * nprobe:
+            return allowed
+        probed = np.intersect1d(self.index.candidates_batch(queries, nprobe), allowed, assume_unique=True)
+        return probed if probed.size >= k else allowed
+
+    def _use_quantized(self, snapshot: SegmentSnapshot, k: int, exact: bool,
+                       candidates: Optional[np.ndarray]) -> bool:
+        """候选数明显多于需要重排的数量时才值得先用量化向量筛选"""
+        return (snapshot.quantized and not exact
+                and (candidates is None or candidates.size > k * self.rerank_factor))
+
+    def _rerank(self, snapshot: SegmentSnapshot, queries: np.ndarray, candidate_ids: np.ndarray,
+                approx_scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """用float32向量计算每个查询候选的精确余弦相似度，取前k个"""
+        union = np.unique(candidate_ids)
+        exact_scores = queries @ snapshot.read_rows(union).T
+        scores = np.take_along_axis(exact_scores, np.searchsorted(union, candidate_ids), axis=1)
+        # 已删除的行在粗排时分数为-inf，重排后仍然排除
+        scores[np.isneginf(approx_scores)] = -np.inf
+        best = top_k_rows(scores, k)
+        return np.take_along_axis(candidate_ids, best, axis=1), np.take_along_axis(scores, best, axis=1)
+
+    def _quantized_search(self, snapshot: SegmentSnapshot, queries: np.ndarray, k: int,
+                          candidates: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """按int8向量的近似分数为每个查询选出 k*rerank_factor 个候选，再重排"""
+        fetch = k * self.rerank_factor
+        if candidates is not None:
+            codes, scales = snapshot.take_codes(candidates)
+            approx = (queries @ codes.astype(np.float32).T) * scales
+            best = top_k_rows(approx, fetch)
+            return self._rerank(snapshot, queries, candidates[best], np.take_along_axis(approx, best, axis=1), k)
+        id_parts = []
+        score_parts = []
+        for ids, codes, scales, deleted in snapshot.iter_code_blocks(rows=QUANT_BLOCK_ROWS):
+            approx = (queries @ codes.astype(np.float32).T) * scales
+            if deleted is not None:
+                approx[:, deleted] = -np.inf
+            local = top_k_rows(approx, fetch)
+            id_parts.append(ids[local])
+            score_parts.append(np.take_along_axis(approx, local, axis=1))
+        ids = np.concatenate(id_parts, axis=1)
+        scores = np.concatenate(score_parts, axis=1)
+        best = top_k_rows(scores, fetch)
+        return self._rerank(snapshot, queries, np.take_along_axis(ids, best, axis=1),
+                            np.take_along_axis(scores, best, axis=1), k)
+
+    def _search_by_vector(self, snapshot: SegmentSnapshot, query: np.ndarray, k: int, nprobe: Optional[int] = None,
+                          exact: bool = False, candidates: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """已归一化的查询向量的前k个行号和余弦相似度；candidates为升序行号时只在其中计算"""
+        if candidates is None and self.index is not None and not exact:
+            candidates = self.index.candidates(query, nprobe or self.nprobe)
+        if candidates is not None:
+            candidates = candidates[snapshot.live(candidates)]
+        if self._use_quantized(snapshot, k, exact, candidates):
+            ids, scores = self._quantized_search(snapshot, query[None, :], k, candidates)
+            ids, scores = ids[0], scores[0]
+        elif candidates is not None:
+            scores = snapshot.take(candidates) @ query
+            best = top_k(scores, k)
+            ids, scores = candidates[best], scores[best]
+        else:
+            # 每个分段先取各自的前k个，再合并排序；已删除的行分数为-inf
+            candidate_ids = []
+            candidate_scores = []
+            for segment in snapshot.segments:
+                scores = segment.vectors @ query
+                if segment.deleted is not None:
+                    scores[segment.deleted] = -np.inf
+                local = top_k(scores, k)
+                candidate_ids.append(segment.rows_at(local))
+                candidate_scores.append(scores[local])
+            ids = np.concatenate(candidate_ids)
+            scores = np.concatenate(candidate_scores)
+            best = top_k(scores, k)
+            ids, scores = ids[best], scores[best]
+        # 未删除的行不足k条时去掉以-inf补足的结果
+        live = scores > -np.inf
+        return ids[live], scores[live]
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4,
+                                                nprobe: Optional[int] = None, exact: bool = False,
+                                                filter: Optional[dict] = None) -> List[Tuple[Document, float]]:
+        """按查询向量检索，返回文档和余弦相似度
+
+        建立了索引时只计算nprobe个倒排列表中的向量；exact=True时强制全量计算。
+        filter为元数据过滤条件，例如 {"department": "办公厅", "year": [2022, 2023]}。
+        """
+        snapshot = self._store.snapshot
+        if not snapshot.segments:
+            return []
+        query = normalize_vectors(embedding)[0]
+        candidates = None
+        if filter:
+            candidates = self._filtered_candidates(snapshot, query[None, :], k, filter, nprobe, exact)
+        ids, scores = self._search_by_vector(snapshot, query, k, nprobe, exact, candidates)
+        return [(self._to_document(snapshot, int(idx)), float(score)) for idx, score in zip(ids, scores)]
+
+    def _exact_search_batch(self, snapshot: SegmentSnapshot, queries: np.ndarray,
+                            k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """按块把向量与整个查询矩阵相乘，每块先取各行的前k个再合并"""
+        id_parts = []
+        score_parts = []
+        for ids, block, deleted in snapshot.iter_blocks(rows=QUERY_BLOCK_ROWS):
+            scores = queries @ block.T
+            if deleted is not None:
+                scores[:, deleted] = -np.inf
+            local = top_k_rows(scores, k)
+            id_parts.append(ids[local])
+            score_parts.append(np.take_along_axis(scores, local, axis=1))
+        ids = np.concatenate(id_parts, axis=1)
+        scores = np.concatenate(score_parts, axis=1)
+        best = top_k_rows(scores, k)
+        return np.take_along_axis(ids, best, axis=1), np.take_along_axis(scores, best, axis=1)
+
+    def similarity_search_batch_with_score_by_vector(self, embeddings, k: int = 4, nprobe: Optional[int] = None,
+                                                     exact: bool = False,
+                                                     filter: Optional[dict] = None) -> List[List[Tuple[Document, float]]]:
+        """多个查询向量一起检索，每个查询返回文档和余弦相似度
 
-    def similarity_search(self, query: str, k: int = 4) -> List[Document]:
+        建立了索引时对所有查询要扫描的倒排列表取并集，只取一次候选向量并做一次矩阵乘法，
+        每个查询的候选集不小于单独查询时的候选集；并集超过向量总数一半时改为全量计算。
+        filter对所有查询生效。
+        """
+        if len(embeddings) == 0:
+            return []
+        snapshot = self._store.snapshot
+        if not snapshot.segments:
+            return [[] for _ in range(len(embeddings))]
+        queries = normalize_vectors(embeddings)
+        candidates = None
+        if filter:
+            candidates = self._filtered_candidates(snapshot, queries, k, filter, nprobe, exact)
+        elif self.index is not None and not exact:
+            union = self.index.candidates_batch(queries, nprobe or self.nprobe)
+            if union.size * 2 <= len(snapshot):
+                candidates = union[snapshot.live(union)]
+        if self._use_quantized(snapshot, k, exact, candidates):
+            ids, scores = self._quantized_search(snapshot, queries, k, candidates)
+        elif candidates is not None:
+            scores = queries @ snapshot.take(candidates).T
+            best = top_k_rows(scores, k)
+            ids, scores = candidates[best], np.take_along_axis(scores, best, axis=1)
+        else:
+            ids, scores = self._exact_search_batch(snapshot, queries, k)
+        return [[(self._to_document(snapshot, int(idx)), float(score))
+                 for idx, score in zip(row_ids, row_scores) if score > -np.inf]
+                for row_ids, row_scores in zip(ids, scores)]
+
+    def similarity_search_batch_with_score(self, queries: List[str], k: int = 4,
+                                           **kwargs) -> List[List[Tuple[Document, float]]]:
+        """多个查询一起检索；查询文本按查询语义批量生成嵌入向量"""
+        if not queries:
+            return []
+        if not self._store.segments:
+            return [[] for _ in queries]
+        return self.similarity_search_batch_with_score_by_vector(embed_queries(self.embeddings, queries), k, **kwargs)
+
+    def similarity_search_batch(self, queries: List[str], k: int = 4, **kwargs) -> List[List[Document]]:
+        """多个查询一起检索，返回每个查询的文档列表"""
+        return [[doc for doc, _ in results] for results in self.similarity_search_batch_with_score(queries, k, **kwargs)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4,
+                                     filter: Optional[dict] = None) -> List[Tuple[Document, float]]:
+        """相似度搜索，返回文档和余弦相似度（从高到低）"""
+        if not self._store.segments:
+            return []
+        return self.similarity_search_with_score_by_vector(self.embeddings.embed_query(query), k, filter=filter)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4,
+                                    filter: Optional[dict] = None) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, filter=filter)]
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[dict] = None) -> List[Document]:
         """相似度搜索优化实现"""
-        query_embed = np.array(self.embeddings.embed_query(query))
-        
-        # 批量计算余弦相似度
-        if self.vectors.size == 0:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter=filter)]
+
+    # ---- 词法检索与混合检索 ----
+
+    def _lexical_scores(self, snapshot: SegmentSnapshot, query: str,
+                        filter: Optional[dict] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """命中查询词且未删除的行号及BM25分数；已删除的行在合并前仍计入文档频率等统计量"""
+        ids, scores = self.lexical.score(query)
+        keep = snapshot.live(ids)
+        if filter and ids.size:
+            keep &= np.isin(ids, self.filters.match(filter), assume_unique=True)
+        return ids[keep], scores[keep]
+
+    def lexical_search_with_score(self, query: str, k: int = 4,
+                                  filter: Optional[dict] = None) -> List[Tuple[Document, float]]:
+        """BM25检索，返回文档和BM25分数（从高到低），不需要计算嵌入向量"""
+        snapshot = self._store.snapshot
+        ids, scores = self._lexical_scores(snapshot, query, filter)
+        return [(self._to_document(snapshot, int(ids[i])), float(scores[i])) for i in top_k(scores, k)]
+
+    def hybrid_search_with_score(self, query: str, k: int = 4, fetch_k: Optional[int] = None,
+                                 prefilter_k: int = 0, rrf_k: int = RRF_K, filter: Optional[dict] = None,
+                                 **kwargs) -> List[Tuple[Document, float]]:
+        """向量检索与BM25检索按倒数排名融合（RRF），返回文档和融合分数
+
+        两路各取前fetch_k条，文档的融合分数为其在每一路中 1/(rrf_k+名次) 之和。
+        prefilter_k大于0且有文档命中查询词时，只对BM25分数最高的prefilter_k条计算向量相似度，
+        不再扫描整个向量库；没有命中时仍做全量向量检索。
+        """
+        snapshot = self._store.snapshot
+        if not snapshot.segments:
             return []
-            
-        norms = np.linalg.norm(self.vectors, axis=1)
-        query_norm = np.linalg.norm(query_embed)
-        similarities = np.dot(self.vectors, query_embed) / (norms * query_norm)
-        
-        # 获取Top K索引
-        top_k_idx = np.argsort(similarities)[-k:][::-1]
-        
-        # 构建返回结果
-        return [
-            Document(
-                page_content=self.metadata[idx].get("text", ""),  # 假设metadata存储原始文本
-                metadata=self.metadata[idx]
-            ) for idx in top_k_idx
-        ]
+        fetch_k = fetch_k or max(4 * k, 20)
+        lexical_ids, lexical_scores = self._lexical_scores(snapshot, query, filter)
+        query_vector = normalize_vectors(self.embeddings.embed_query(query))[0]
+        candidates = None
+        if prefilter_k > 0 and lexical_ids.size:
+            candidates = np.sort(lexical_ids[top_k(lexical_scores, prefilter_k)])
+        elif filter:
+            candidates = self._filtered_candidates(snapshot, query_vector[None, :], fetch_k, filter, **kwargs)
+        dense_ids, _ = self._search_by_vector(snapshot, query_vector, fetch_k, candidates=candidates, **kwargs)
+
+        fused = {}
+        for ranked in (dense_ids, lexical_ids[top_k(lexical_scores, fetch_k)]):
+            for rank, idx in enumerate(ranked.tolist(), start=1):
+                fused[idx] = fused.get(idx, 0.0) + 1.0 / (rrf_k + rank)
+        best = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self._to_document(snapshot, idx), score) for idx, score in best]
+
+    def hybrid_search(self, query: str, k: int = 4, **kwargs) -> List[Document]:
+        return [doc for doc, _ in self.hybrid_search_with_score(query, k, **kwargs)]
 
     def save(self) -> None:
-        """保存数据时自动创建目录"""
-        np.save(os.path.join(self.db_path, "vectors.npy"), self.vectors)
-        with open(os.path.join(self.db_path, "metadata.json"), "w") as f:
-            json.dump(self.metadata, f, ensure_ascii=False)
+        """数据在每次添加时已写入分段文件，这里等待后台合并完成并保存索引"""
+        self._store.wait()
+        if self.read_only:
+            return
+        if self.index is not None and self.index.dirty:
+            self.index.save(self._index_path())
+            self._index_version = self._stat_index()
+        if self.lexical.dirty:
+            self.lexical.save(self._lexical_path())
+            self._lexical_version = self._stat_file(self._lexical_path())
+        if self.filters.dirty:
+            self.filters.save(self._filters_path())
+            self._filters_version = self._stat_file(self._filters_path())
+
+    # ---- 近似索引 ----
+
+    def _index_path(self) -> str:
+        return os.path.join(self.db_path, INDEX_FILE)
+
+    def _lexical_path(self) -> str:
+        return os.path.join(self.db_path, LEXICAL_INDEX_FILE)
+
+    def _filters_path(self) -> str:
+        return os.path.join(self.db_path, FILTER_INDEX_FILE)
+
+    @staticmethod
+    def _stat_file(path: str):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _stat_index(self):
+        return self._stat_file(self._index_path())
+
+    def _load_index(self) -> None:
+        """索引文件有变化时重新加载，并补入索引之后新增的向量"""
+        version = self._stat_index()
+        if version is not None and version != self._index_version:
+            self.index = IVFIndex.load(self._index_path())
+            self._index_version = version
+        if self.index is not None:
+            for ids, block, _ in self._store.snapshot.iter_blocks(self.index.indexed_count):
+                self.index.add(block, ids)
+
+    def _load_metadata_indexes(self) -> None:
+        """词法索引和过滤索引文件有变化时重新加载，并从元数据补入索引之后新增的文档"""
+        version = self._stat_file(self._lexical_path())
+        if version is not None and version != self._lexical_version:
+            self.lexical = LexicalIndex.load(self._lexical_path())
+            self._lexical_version = version
+        version = self._stat_file(self._filters_path())
+        if version is not None and version != self._filters_version:
+            self.filters = MetadataIndex.load(self._filters_path())
+            self._filters_version = version
+        metadata = self._store.metadata
+        start = min(len(self.lexical), len(self.filters))
+        if start >= len(metadata):
+            return
+        # 已删除的行以空文档占位，各索引的下标与行号保持一致
+        pending = [item or {} for item in metadata[start:]]
+        if len(self.lexical) < len(metadata):
+            self.lexical.add([item.get("text", "") for item in pending[len(self.lexical) - start:]], len(self.lexical))
+        if len(self.filters) < len(metadata):
+            self.filters.add(pending[len(self.filters) - start:], len(self.filters))
+
+    def build_index(self, nlist: Optional[int] = None) -> None:
+        """在已有向量上训练并保存IVF索引，之后新增的向量自动加入索引"""
+        if self.read_only:
+            raise PermissionError("向量库以只读方式打开")
+        snapshot = self._store.snapshot
+        live = snapshot.live_ids()
+        if live.size == 0:
+            raise ValueError("向量库为空，无法建立索引")
+        nlist = nlist or default_nlist(live.size)
+        rng = np.random.default_rng(0)
+        sample_ids = np.sort(rng.choice(live, min(live.size, nlist * TRAIN_POINTS_PER_LIST), replace=False))
+        self.index = IVFIndex.build(snapshot.iter_blocks(), snapshot.next_row, snapshot.take(sample_ids), nlist)
+        self.save()
+
+    def drop_index(self) -> None:
+        """删除索引，查询恢复为全量计算"""
+        self.index = None
+        self._index_version = None
+        if not self.read_only and os.path.exists(self._index_path()):
+            os.remove(self._index_path())
+
+    def set_quantization(self, mode: Optional[str]) -> None:
+        """启用（"int8"）或关闭（None）量化存储，启用时为已有向量补建量化向量"""
+        self._store.set_quantization(mode)
+
+    def compact(self, background: bool = False) -> None:
+        """把全部分段合并为一个并清除已删除的行；行号和文档编号不变，合并期间检索不受影响"""
+        self._store.compact(background=background, full=True)
+
+    def refresh(self) -> bool:
+        """重新读取清单和索引，只读进程用来看到新写入的数据"""
+        changed = self._store.refresh()
+        self._load_index()
+        self._load_metadata_indexes()
+        return changed
 
     def load(self) -> None:
-        """加载数据增加异常处理"""
+        """打开分段存储，旧格式的 vectors.npy + metadata.json 在首次打开时导入为一个分段"""
+        self._store = SegmentStore(self.db_path, read_only=self.read_only)
+        if self._store.exists():
+            self._load_index()
+            self._load_metadata_indexes()
+            return
+
         vectors_path = os.path.join(self.db_path, "vectors.npy")
         metadata_path = os.path.join(self.db_path, "metadata.json")
         
         if not os.path.exists(vectors_path) or not os.path.exists(metadata_path):
             raise FileNotFoundError("Database files not found")
             
-        self.vectors = np.load(vectors_path)
+        if self.read_only:
+            print("旧格式的向量库需要先以读写方式打开一次，导入为分段后才能只读共享")
+            return
+        vectors = np.load(vectors_path)
         with open(metadata_path, "r") as f:
-            self.metadata = json.load(f)
+            metadata = json.load(f)
+        if not vectors.size:
+            return
+        # 旧文件保留不删除，导入后不再读取
+        self._store.append(normalize_vectors(vectors), metadata)
+        self._load_metadata_indexes()
 
     @classmethod
     def from_texts(
@@ -103,14 +573,35 @@ class CustomVectorDB(VectorStore):
 class RetrievalTool:
     """增强版检索工具"""
     
-    def __init__(self, corpus_path: str = "local_corpus"):
-        self.embeddings = HuggingFaceEmbeddings()
+    def __init__(self, corpus_path: str = "local_corpus", mode: str = RETRIEVAL_MODE,
+                 prefilter_k: int = RETRIEVAL_PREFILTER_K):
+        if mode not in ("dense", "lexical", "hybrid"):
+            raise ValueError(f"未知的检索方式: {mode}")
+        self.mode = mode
+        self.prefilter_k = prefilter_k
+        # 模型由进程内共享的提供者在第一次计算时加载（或在启动时预热）；
+        # 重复导入同一语料或重复查询时直接使用缓存的向量
+        self.embeddings = cached_embeddings(LazyEmbeddings())
         self.db = CustomVectorDB(
             embeddings=self.embeddings,
             db_path=corpus_path
         )
     
-    def retrieve(self, text: str, k=3) -> List[str]:
-        """执行检索并返回文本内容"""
-        docs = self.db.similarity_search(text, k=k)
-        return [doc.page_content for doc in docs]
\ No newline at end of file
+    def _search(self, text: str, k: int, filter: Optional[dict] = None) -> List[Document]:
+        if self.mode == "lexical":
+            return [doc for doc, _ in self.db.lexical_search_with_score(text, k, filter=filter)]
+        if self.mode == "hybrid":
+            return self.db.hybrid_search(text, k, prefilter_k=self.prefilter_k, filter=filter)
+        return self.db.similarity_search(text, k=k, filter=filter)
+
+    def retrieve(self, text: str, k=3, filter: Optional[dict] = None) -> List[str]:
+        """执行检索并返回文本内容；filter按元数据限定范围，例如 {"doc_type": "通知"}"""
+        docs = self._search(text, k, filter)
+        return [doc.page_content for doc in docs]
+
+    def retrieve_many(self, texts: List[str], k=3, filter: Optional[dict] = None) -> List[List[str]]:
+        """批量检索，例如为文档的每个段落检索参考内容，返回与texts一一对应的结果"""
+        if self.mode != "dense":
+            return [self.retrieve(text, k, filter) for text in texts]
+        return [[doc.page_content for doc in docs]
+                for docs in self.db.similarity_search_batch(texts, k=k, filter=filter)]
\ No newline at end of file
@@ -0,0 +1,162 @@
+"""
+IVF近似最近邻索引 - 用k-means把向量划分到nlist个倒排列表，查询时只扫描最近的nprobe个列表
+
+聚类中心由球面k-means（余弦相似度）在抽样向量上训练得到；倒排列表只保存向量的行号，
+查询时从分段存储中取出候选向量计算精确的余弦相似度。nprobe越大召回率越高、查询越慢。
+训练后新增的向量直接分配到最近的聚类中心，不需要重新训练。
+索引保存在库目录下的 ivf_index.npz 中，打开库时把索引之后新增的向量补入索引。
+"""
+
+import os
+import threading
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+# 查询时扫描的倒排列表数
+DEFAULT_NPROBE = int(os.getenv("VECTOR_DB_NPROBE", "16"))
+INDEX_FILE = "ivf_index.npz"
+# 训练时每个聚类中心使用的抽样向量数
+TRAIN_POINTS_PER_LIST = 64
+KMEANS_ITERATIONS = 10
+# 分配聚类中心时每批计算的向量数
+ASSIGN_BATCH = 65536
+
+
+def default_nlist(count: int) -> int:
+    """倒排列表数，约为向量数平方根的4倍"""
+    return max(1, min(count, int(4 * np.sqrt(count))))
+
+
+def assign_lists(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """每个向量所属的聚类中心（余弦相似度最大）"""
+    assignments = np.empty(vectors.shape[0], dtype=np.int32)
+    for start in range(0, vectors.shape[0], ASSIGN_BATCH):
+        block = np.asarray(vectors[start:start + ASSIGN_BATCH], dtype=np.float32)
+        assignments[start:start + block.shape[0]] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+
+def train_centroids(sample: np.ndarray, nlist: int, iterations: int = KMEANS_ITERATIONS,
+                    seed: int = 0) -> np.ndarray:
+    """在已归一化的抽样向量上训练球面k-means聚类中心"""
+    rng = np.random.default_rng(seed)
+    nlist = min(nlist, sample.shape[0])
+    centroids = sample[rng.choice(sample.shape[0], nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = assign_lists(sample, centroids)
+        order = np.argsort(assignments, kind="stable")
+        sorted_assignments = assignments[order]
+        present, first = np.unique(sorted_assignments, return_index=True)
+        sums = np.add.reduceat(sample[order], first, axis=0)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids[present] = sums / norms
+        # 没有分到向量的聚类中心重新随机选取
+        empty = np.setdiff1d(np.arange(nlist), present)
+        if empty.size:
+            centroids[empty] = sample[rng.choice(sample.shape[0], empty.size, replace=False)]
+    return np.ascontiguousarray(centroids, dtype=np.float32)
+
+
+def csr_lists(assignments: np.ndarray, ids: np.ndarray, nlist: int) -> Tuple[np.ndarray, np.ndarray]:
+    """按列表排列的下标和每个列表的起始位置"""
+    order = np.argsort(assignments, kind="stable")
+    offsets = np.zeros(nlist + 1, dtype=np.int64)
+    np.cumsum(np.bincount(assignments, minlength=nlist), out=offsets[1:])
+    return ids[order].astype(np.int64), offsets
+
+
+class IVFIndex:
+    """倒排文件索引；向量本身不在索引中保存，由调用方按下标提供"""
+
+    def __init__(self, centroids: np.ndarray, ids: np.ndarray, offsets: np.ndarray, indexed_count: int):
+        self.centroids = centroids
+        self.nlist = centroids.shape[0]
+        self._ids = ids
+        self._offsets = offsets
+        # 训练或上次保存之后追加的下标，保存时合并进CSR数组
+        self._extra: List[List[np.ndarray]] = [[] for _ in range(self.nlist)]
+        self.indexed_count = indexed_count
+        self.dirty = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, vectors_iter, count: int, sample: np.ndarray, nlist: Optional[int] = None) -> "IVFIndex":
+        """训练聚类中心并为全部向量建立倒排列表
+
+        vectors_iter按下标顺序产出 (下标数组, 向量块, 已删除的行的掩码或None)，count为下标上限；
+        已删除和不存在的下标不进入任何列表。
+        """
+        centroids = train_centroids(sample, nlist or default_nlist(count))
+        assignments = np.full(count, -1, dtype=np.int32)
+        for ids, block, deleted in vectors_iter:
+            if deleted is not None:
+                ids, block = ids[~deleted], block[~deleted]
+            assignments[ids] = assign_lists(block, centroids)
+        stored = np.flatnonzero(assignments >= 0)
+        ids, offsets = csr_lists(assignments[stored], stored, centroids.shape[0])
+        index = cls(centroids, ids, offsets, count)
+        index.dirty = True
+        return index
+
+    def add(self, vectors: np.ndarray, start) -> None:
+        """把一批向量加入索引；start为第一条向量的下标，或每条向量的下标数组"""
+        if not vectors.shape[0]:
+            return
+        assignments = assign_lists(vectors, self.centroids)
+        if np.isscalar(start):
+            ids = np.arange(start, start + vectors.shape[0], dtype=np.int64)
+        else:
+            ids = np.asarray(start, dtype=np.int64)
+        order = np.argsort(assignments, kind="stable")
+        lists, first = np.unique(assignments[order], return_index=True)
+        with self._lock:
+            for list_id, group in zip(lists, np.split(ids[order], first[1:])):
+                self._extra[list_id].append(group)
+            self.indexed_count = max(self.indexed_count, int(ids[-1]) + 1)
+            self.dirty = True
+
+    def _gather(self, probe) -> np.ndarray:
+        parts = [self._ids[self._offsets[p]:self._offsets[p + 1]] for p in probe]
+        for p in probe:
+            parts.extend(self._extra[p])
+        ids = np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+        ids.sort()
+        return ids
+
+    def candidates(self, query: np.ndarray, nprobe: int = DEFAULT_NPROBE) -> np.ndarray:
+        """与查询最接近的nprobe个列表中的全部下标（升序）"""
+        nprobe = min(max(1, nprobe), self.nlist)
+        return self._gather(np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe])
+
+    def candidates_batch(self, queries: np.ndarray, nprobe: int = DEFAULT_NPROBE) -> np.ndarray:
+        """每个查询各自最接近的nprobe个列表合在一起后的全部下标（升序）"""
+        nprobe = min(max(1, nprobe), self.nlist)
+        probe = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        return self._gather(np.unique(probe))
+
+    def save(self, path: str) -> None:
+        """把追加的下标合并进CSR数组，写入临时文件后整体替换"""
+        with self._lock:
+            sizes = np.diff(self._offsets) + np.array([sum(group.size for group in groups) for groups in self._extra],
+                                                      dtype=np.int64)
+            offsets = np.zeros(self.nlist + 1, dtype=np.int64)
+            np.cumsum(sizes, out=offsets[1:])
+            ids = np.concatenate([np.concatenate([self._ids[self._offsets[i]:self._offsets[i + 1]]] + self._extra[i])
+                                  for i in range(self.nlist)])
+            self._ids, self._offsets = ids, offsets
+            self._extra = [[] for _ in range(self.nlist)]
+            indexed_count = self.indexed_count
+            self.dirty = False
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, centroids=self.centroids, ids=ids, offsets=offsets, indexed_count=np.int64(indexed_count))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        with np.load(path) as data:
+            return cls(data["centroids"], data["ids"], data["offsets"], int(data["indexed_count"]))
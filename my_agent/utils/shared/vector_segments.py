@@ -0,0 +1,858 @@
+"""
+向量分段存储 - 只追加写入的分段文件 + 清单，读取时使用内存映射
+
+目录结构：
+    manifest.json              当前有效的分段列表，整体替换写入
+    segments/seg-000001.npy    一批已归一化的float32向量
+    segments/seg-000001.jsonl  对应的元数据，每行一条
+    segments/seg-000001.q8.npy / .q8scale.npy   启用int8量化时的量化向量和每行的缩放系数
+    segments/seg-000001.ids.jsonl / .keys.npy   写入时指定了文档编号的分段：每行的文档编号及其64位键
+    segments/seg-000001.rows.npy                合并时清除了已删除的行、行号不再连续的分段：每行的行号
+    segments/seg-000001.del-000007.npy          分段中已删除（墓碑）的行，每次删除写入新文件
+
+每条向量有一个写入时分配、之后不再改变的行号，IVF、词法和过滤索引都以行号为下标。
+文档编号默认为行号的字符串；更新文档时写入新行，并在同一次清单替换中把旧行标记为删除，文档编号不变。
+每次写入只新建一个分段再替换清单，不再重写已有数据；向量和元数据文件都以内存映射方式打开，
+多个工作进程以只读方式打开同一个库时通过操作系统的页缓存共享数据。
+元数据只在打开时记录每行的起始位置，按下标读取时才解析对应的一行JSON。
+分段数量超过上限、或某个分段中已删除的行超过一定比例时，在后台线程中合并重写分段并清除已删除的行；
+行号保持不变，各索引不需要重建。
+读取通过快照进行：快照是某一时刻的分段元组，写入、删除和合并都只替换 store.snapshot，
+已取得的快照不受影响，其中的文件在合并后删除也仍可读取，一次检索从头到尾看到同一组数据。
+启用int8量化后，检索时只需扫描约四分之一大小的量化向量，float32向量仅在重排少量候选时读取。
+同一个库只能有一个写入进程。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import weakref
+from collections.abc import Sequence
+from dataclasses import dataclass, replace
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("vector_segments")
+
+# 分段数量超过该值时触发后台合并
+DEFAULT_MAX_SEGMENTS = int(os.getenv("VECTOR_DB_MAX_SEGMENTS", "8"))
+# 分段中已删除的行达到该比例时在后台重写该分段
+DEFAULT_PURGE_RATIO = float(os.getenv("VECTOR_DB_PURGE_RATIO", "0.2"))
+MANIFEST_NAME = "manifest.json"
+SEGMENT_DIR = "segments"
+FORMAT_VERSION = 2
+# 合并时每次复制的向量行数
+COPY_ROWS = 65536
+# 扫描元数据换行位置时每次读取的字节数
+SCAN_BYTES = 64 * 1024 * 1024
+QUANTIZATION_MODES = ("int8",)
+# 非数字文档编号的键取哈希后置最高位，与数字编号的键不会重复
+HASHED_KEY_BIT = 1 << 63
+
+
+def document_key(doc_id: str) -> int:
+    """文档编号的64位键
+
+    规范写法的十进制整数（与默认的文档编号即行号一致）取其数值，其余字符串取哈希；
+    哈希相同的编号在查找时再比较原字符串。
+    """
+    if doc_id.isascii() and doc_id.isdigit() and len(doc_id) < 19 and (doc_id == "0" or doc_id[0] != "0"):
+        return int(doc_id)
+    digest = hashlib.blake2b(doc_id.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") | HASHED_KEY_BIT
+
+
+class _RowReader:
+    """float32向量文件的描述符，重排时用pread读取单行，不把float32向量映射进内存
+
+    同一分段的各个版本共用一个对象，全部回收后关闭；合并后删除的文件在关闭前仍可读取。
+    """
+
+    def __init__(self, path: str, offset: int, row_bytes: int):
+        self.fd = os.open(path, os.O_RDONLY)
+        self.offset = offset
+        self.row_bytes = row_bytes
+        weakref.finalize(self, os.close, self.fd)
+
+    def read(self, index: int) -> bytes:
+        return os.pread(self.fd, self.row_bytes, self.offset + index * self.row_bytes)
+
+
+@dataclass(eq=False)
+class Segment:
+    """一个分段；vectors和records等为只读的内存映射，分段对象创建后不再修改
+
+    start为第一行的行号；rows为None时各行的行号连续，否则为每行的行号（升序）。
+    records是元数据文件的字节内容，第i条元数据位于 records[offsets[i]:offsets[i + 1]]。
+    keys为None时文档编号就是行号，否则为每行文档编号的键，key_index为按键排序的 (下标, 键)，
+    文档编号字符串保存在id_records中。
+    deleted为已删除的行的布尔掩码，删除时生成新的分段对象替换。
+    启用量化时 codes * scales[:, None] 近似等于vectors。
+    """
+    name: str
+    start: int
+    vectors: np.ndarray
+    records: np.ndarray
+    offsets: np.ndarray
+    rows: Optional[np.ndarray] = None
+    keys: Optional[np.ndarray] = None
+    key_index: Optional[Tuple[np.ndarray, np.ndarray]] = None
+    id_records: Optional[np.ndarray] = None
+    id_offsets: Optional[np.ndarray] = None
+    deleted: Optional[np.ndarray] = None
+    deleted_file: Optional[str] = None
+    deleted_count: int = 0
+    codes: Optional[np.ndarray] = None
+    scales: Optional[np.ndarray] = None
+    reader: Optional[_RowReader] = None
+
+    @property
+    def count(self) -> int:
+        return self.vectors.shape[0]
+
+    @property
+    def end(self) -> int:
+        """最后一行的行号加一"""
+        if self.rows is None:
+            return self.start + self.count
+        return int(self.rows[-1]) + 1
+
+    def row_ids(self, lo: int = 0, hi: Optional[int] = None) -> np.ndarray:
+        """第lo到hi行的行号"""
+        hi = self.count if hi is None else hi
+        if self.rows is None:
+            return np.arange(self.start + lo, self.start + hi, dtype=np.int64)
+        return np.asarray(self.rows[lo:hi], dtype=np.int64)
+
+    def row_id(self, index: int) -> int:
+        return self.start + index if self.rows is None else int(self.rows[index])
+
+    def rows_at(self, local: np.ndarray) -> np.ndarray:
+        """分段内下标对应的行号"""
+        return local + self.start if self.rows is None else np.asarray(self.rows[local], dtype=np.int64)
+
+    def locate(self, rows: np.ndarray) -> np.ndarray:
+        """行号在本分段中的下标，不在本分段中的为-1"""
+        if self.rows is None:
+            local = rows - self.start
+            found = (local >= 0) & (local < self.count)
+        else:
+            local = np.searchsorted(self.rows, rows)
+            found = local < self.count
+            found[found] = self.rows[local[found]] == rows[found]
+        return np.where(found, local, -1)
+
+    def first_index(self, row: int) -> int:
+        """行号不小于row的第一行的下标"""
+        if self.rows is None:
+            return min(max(row - self.start, 0), self.count)
+        return int(np.searchsorted(self.rows, row))
+
+    def record(self, index: int) -> dict:
+        return json.loads(self.records[self.offsets[index]:self.offsets[index + 1]].tobytes())
+
+    def document_id(self, index: int) -> str:
+        if self.keys is None:
+            return str(self.row_id(index))
+        return json.loads(self.id_records[self.id_offsets[index]:self.id_offsets[index + 1]].tobytes())
+
+    def find(self, keys: np.ndarray, doc_ids: List[str]) -> np.ndarray:
+        """文档编号在本分段中未删除的行的下标，没有的为-1"""
+        local = np.full(len(doc_ids), -1, dtype=np.int64)
+        if self.keys is None:
+            numeric = keys < HASHED_KEY_BIT
+            local[numeric] = self.locate(keys[numeric].astype(np.int64))
+        else:
+            order, sorted_keys = self.key_index
+            lo = np.searchsorted(sorted_keys, keys, side="left")
+            hi = np.searchsorted(sorted_keys, keys, side="right")
+            for i in np.flatnonzero(hi > lo):
+                # 同一编号的旧版本已删除，哈希相同的不同编号按原字符串区分
+                for index in order[lo[i]:hi[i]]:
+                    if (self.deleted is None or not self.deleted[index]) and self.document_id(index) == doc_ids[i]:
+                        local[i] = index
+                        break
+        if self.deleted is not None:
+            found = local >= 0
+            found[found] = self.deleted[local[found]]
+            local[found] = -1
+        return local
+
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """按行对称量化为int8：每行的最大绝对值映射到127，返回量化向量和每行的缩放系数"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def _save_array(path: str, array: np.ndarray) -> None:
+    with open(f"{path}.tmp", "wb") as f:
+        np.save(f, array)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(f"{path}.tmp", path)
+
+
+def _map_records(path: str) -> Tuple[np.ndarray, np.ndarray]:
+    """以内存映射方式打开JSONL文件，返回文件内容和每行的起始位置（最后一项为文件长度）"""
+    if os.path.getsize(path) == 0:
+        return np.empty(0, dtype=np.uint8), np.zeros(1, dtype=np.int64)
+    records = np.memmap(path, dtype=np.uint8, mode="r")
+    ends = [np.zeros(1, dtype=np.int64)]
+    # 分块查找换行符，避免一次生成与文件同样大小的临时数组
+    for start in range(0, records.shape[0], SCAN_BYTES):
+        ends.append(np.flatnonzero(records[start:start + SCAN_BYTES] == 0x0A) + (start + 1))
+    return records, np.concatenate(ends).astype(np.int64)
+
+
+def _copy_lines(out, records: np.ndarray, offsets: np.ndarray, keep: Optional[np.ndarray]) -> None:
+    """把JSONL内容写入out；keep不为None时只写入保留的行"""
+    if keep is None:
+        for start in range(0, records.shape[0], SCAN_BYTES):
+            out.write(records[start:start + SCAN_BYTES].tobytes())
+        return
+    for index in np.flatnonzero(keep):
+        out.write(records[offsets[index]:offsets[index + 1]].tobytes())
+
+
+class SegmentSnapshot:
+    """某一时刻全部分段的只读视图，按行号读取
+
+    行号由take等方法的调用方按升序给出；已删除但尚未清除的行仍可读取向量，由检索方按live()排除。
+    """
+
+    def __init__(self, segments: Tuple[Segment, ...] = (), next_row: int = 0):
+        self.segments = segments
+        self.next_row = next_row
+        self._starts = np.array([segment.start for segment in segments], dtype=np.int64)
+
+    def __len__(self) -> int:
+        """未删除的行数"""
+        return sum(segment.count - segment.deleted_count for segment in self.segments)
+
+    @property
+    def quantized(self) -> bool:
+        return bool(self.segments) and all(segment.codes is not None for segment in self.segments)
+
+    @property
+    def metadata(self) -> "SegmentMetadata":
+        return SegmentMetadata(self)
+
+    def _split(self, rows: np.ndarray):
+        """把升序的行号按分段分组，产出 (分段序号, 起, 止, 分段, 分段内下标)"""
+        bounds = np.append(np.searchsorted(rows, self._starts), rows.shape[0])
+        for i, segment in enumerate(self.segments):
+            lo, hi = bounds[i], bounds[i + 1]
+            if lo < hi:
+                yield i, lo, hi, segment, segment.locate(rows[lo:hi])
+
+    def _find_row(self, row: int) -> Tuple[Optional[Segment], int]:
+        i = int(np.searchsorted(self._starts, row, side="right")) - 1
+        if i < 0:
+            return None, -1
+        segment = self.segments[i]
+        index = int(segment.locate(np.array([row], dtype=np.int64))[0])
+        return (segment, index) if index >= 0 else (None, -1)
+
+    def live(self, rows: np.ndarray) -> np.ndarray:
+        """升序行号中未删除的行的掩码"""
+        mask = np.zeros(rows.shape[0], dtype=bool)
+        for _, lo, hi, segment, local in self._split(rows):
+            found = local >= 0
+            if segment.deleted is not None:
+                found[found] = ~segment.deleted[local[found]]
+            mask[lo:hi] = found
+        return mask
+
+    def live_ids(self) -> np.ndarray:
+        """全部未删除的行的行号（升序）"""
+        parts = [segment.row_ids() if segment.deleted is None else segment.row_ids()[~segment.deleted]
+                 for segment in self.segments]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    def record(self, row: int) -> Optional[dict]:
+        """行号对应的元数据，已删除的行为None"""
+        segment, index = self._find_row(row)
+        if segment is None or (segment.deleted is not None and segment.deleted[index]):
+            return None
+        return segment.record(index)
+
+    def document_id(self, row: int) -> Optional[str]:
+        segment, index = self._find_row(row)
+        return None if segment is None else segment.document_id(index)
+
+    def find(self, doc_ids: List[str]) -> np.ndarray:
+        """文档编号对应的未删除的行号，不存在的为-1"""
+        keys = np.array([document_key(doc_id) for doc_id in doc_ids], dtype=np.uint64)
+        rows = np.full(len(doc_ids), -1, dtype=np.int64)
+        for segment in reversed(self.segments):
+            missing = rows < 0
+            if not missing.any():
+                break
+            local = segment.find(keys, doc_ids)
+            hit = missing & (local >= 0)
+            rows[hit] = segment.rows_at(local[hit])
+        return rows
+
+    def iter_blocks(self, start: int = 0, rows: int = COPY_ROWS):
+        """按行号顺序产出 (行号, 向量块, 已删除的行的掩码或None)，只包括行号不小于start的行"""
+        for segment in self.segments:
+            if segment.end <= start:
+                continue
+            for lo in range(segment.first_index(start), segment.count, rows):
+                hi = min(lo + rows, segment.count)
+                deleted = None if segment.deleted is None else segment.deleted[lo:hi]
+                yield segment.row_ids(lo, hi), segment.vectors[lo:hi], deleted
+
+    def iter_code_blocks(self, rows: int = COPY_ROWS):
+        """按行号顺序产出 (行号, 量化向量块, 缩放系数块, 已删除的行的掩码或None)"""
+        for segment in self.segments:
+            for lo in range(0, segment.count, rows):
+                hi = min(lo + rows, segment.count)
+                deleted = None if segment.deleted is None else segment.deleted[lo:hi]
+                yield segment.row_ids(lo, hi), segment.codes[lo:hi], segment.scales[lo:hi], deleted
+
+    def _take(self, rows: np.ndarray, field: str, out: np.ndarray) -> np.ndarray:
+        for _, lo, hi, segment, local in self._split(rows):
+            out[lo:hi] = getattr(segment, field)[local]
+        return out
+
+    def _dim(self) -> int:
+        return self.segments[0].vectors.shape[1] if self.segments else 0
+
+    def take(self, rows: np.ndarray) -> np.ndarray:
+        """按升序排列的行号取出向量"""
+        return self._take(rows, "vectors", np.empty((rows.shape[0], self._dim()), dtype=np.float32))
+
+    def read_rows(self, rows: np.ndarray) -> np.ndarray:
+        """按升序排列的行号用pread读取float32向量，用于启用量化后重排少量候选"""
+        result = np.empty((rows.shape[0], self._dim()), dtype=np.float32)
+        for _, lo, hi, segment, local in self._split(rows):
+            if segment.reader is None:
+                result[lo:hi] = segment.vectors[local]
+                continue
+            for i, index in enumerate(local.tolist(), start=lo):
+                result[i] = np.frombuffer(segment.reader.read(index), dtype=np.float32)
+        return result
+
+    def take_codes(self, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """按升序排列的行号取出量化向量和缩放系数"""
+        return (self._take(rows, "codes", np.empty((rows.shape[0], self._dim()), dtype=np.int8)),
+                self._take(rows, "scales", np.empty(rows.shape[0], dtype=np.float32)))
+
+
+class SegmentMetadata(Sequence):
+    """快照中元数据的只读视图，按行号读取；长度为已分配的行号数，已删除的行为None"""
+
+    def __init__(self, snapshot: SegmentSnapshot):
+        self._snapshot = snapshot
+        self._count = snapshot.next_row
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("元数据下标超出范围")
+        return self._snapshot.record(index)
+
+    def __iter__(self):
+        row = 0
+        for segment in self._snapshot.segments:
+            for i in range(segment.count):
+                row_id = segment.row_id(i)
+                while row < row_id:
+                    yield None
+                    row += 1
+                yield None if segment.deleted is not None and segment.deleted[i] else segment.record(i)
+                row += 1
+        while row < self._count:
+            yield None
+            row += 1
+
+
+def _fsync_write(path: str, data: bytes) -> None:
+    """写入临时文件并落盘后替换目标文件"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class SegmentStore:
+    """分段向量存储"""
+
+    def __init__(self, root_dir: str, read_only: bool = False, max_segments: int = DEFAULT_MAX_SEGMENTS,
+                 purge_ratio: float = DEFAULT_PURGE_RATIO):
+        self.root_dir = root_dir
+        self.segment_dir = os.path.join(root_dir, SEGMENT_DIR)
+        self.manifest_path = os.path.join(root_dir, MANIFEST_NAME)
+        self.read_only = read_only
+        self.max_segments = max_segments
+        self.purge_ratio = purge_ratio
+        self.dim: Optional[int] = None
+        self.quantization: Optional[str] = None
+        # 检索方取一次快照后只读取快照中的分段
+        self.snapshot = SegmentSnapshot()
+        self._next_id = 1
+        self._manifest_version = None
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._compaction: Optional[threading.Thread] = None
+        if not read_only:
+            os.makedirs(self.segment_dir, exist_ok=True)
+        self.refresh()
+
+    def __len__(self) -> int:
+        return len(self.snapshot)
+
+    @property
+    def segments(self) -> Tuple[Segment, ...]:
+        return self.snapshot.segments
+
+    @property
+    def metadata(self) -> SegmentMetadata:
+        """按行号读取元数据"""
+        return self.snapshot.metadata
+
+    def exists(self) -> bool:
+        return os.path.exists(self.manifest_path)
+
+    def _publish(self, segments, next_row: Optional[int] = None) -> None:
+        next_row = self.snapshot.next_row if next_row is None else next_row
+        self.snapshot = SegmentSnapshot(tuple(segments), next_row)
+
+    # ---- 清单与分段文件 ----
+
+    def _paths(self, name: str) -> Tuple[str, str]:
+        base = os.path.join(self.segment_dir, name)
+        return f"{base}.npy", f"{base}.jsonl"
+
+    def _quant_paths(self, name: str) -> Tuple[str, str]:
+        base = os.path.join(self.segment_dir, name)
+        return f"{base}.q8.npy", f"{base}.q8scale.npy"
+
+    def _id_paths(self, name: str) -> Tuple[str, str, str]:
+        base = os.path.join(self.segment_dir, name)
+        return f"{base}.rows.npy", f"{base}.keys.npy", f"{base}.ids.jsonl"
+
+    def _open_segment(self, name: str, start: int, quantized: bool = False, sparse: bool = False,
+                      keyed: bool = False, deleted_file: Optional[str] = None) -> Segment:
+        vectors_path, metadata_path = self._paths(name)
+        vectors = np.load(vectors_path, mmap_mode="r")
+        records, offsets = _map_records(metadata_path)
+        if offsets.shape[0] - 1 != vectors.shape[0]:
+            raise ValueError(f"分段 {name} 的向量数与元数据条数不一致")
+        segment = Segment(name, start, vectors, records, offsets)
+        rows_path, keys_path, ids_path = self._id_paths(name)
+        if sparse:
+            segment.rows = np.load(rows_path, mmap_mode="r")
+        if keyed:
+            segment.keys = np.load(keys_path, mmap_mode="r")
+            order = np.argsort(segment.keys, kind="stable")
+            segment.key_index = (order, segment.keys[order])
+            segment.id_records, segment.id_offsets = _map_records(ids_path)
+        if deleted_file is not None:
+            deleted = np.zeros(segment.count, dtype=bool)
+            deleted[np.load(os.path.join(self.segment_dir, deleted_file))] = True
+            segment.deleted, segment.deleted_file, segment.deleted_count = deleted, deleted_file, int(deleted.sum())
+        return self._with_codes(segment, quantized) if quantized else segment
+
+    def _with_codes(self, segment: Segment, quantized: bool) -> Segment:
+        """挂上或去掉量化向量后的新分段对象"""
+        if not quantized:
+            return replace(segment, codes=None, scales=None, reader=None)
+        codes_path, scales_path = self._quant_paths(segment.name)
+        reader = _RowReader(self._paths(segment.name)[0], segment.vectors.offset, segment.vectors.shape[1] * 4)
+        return replace(segment, codes=np.load(codes_path, mmap_mode="r"), scales=np.load(scales_path), reader=reader)
+
+    def _write_manifest(self) -> None:
+        snapshot = self.snapshot
+        manifest = {
+            "format": FORMAT_VERSION,
+            "dim": self.dim,
+            "quantization": self.quantization,
+            "next_id": self._next_id,
+            "next_row": snapshot.next_row,
+            "segments": [{"name": s.name, "start": s.start, "count": s.count, "sparse": s.rows is not None,
+                          "keyed": s.keys is not None, "deleted": s.deleted_file} for s in snapshot.segments],
+        }
+        _fsync_write(self.manifest_path, json.dumps(manifest, ensure_ascii=False).encode("utf-8"))
+        self._manifest_version = self._stat_manifest()
+
+    def _stat_manifest(self) -> Tuple[int, int]:
+        # 清单每次都替换为新文件，inode可以区分同一时间戳内的两次写入
+        stat = os.stat(self.manifest_path)
+        return stat.st_ino, stat.st_mtime_ns
+
+    def refresh(self) -> bool:
+        """清单有变化时重新打开分段，返回是否重新加载
+
+        只读进程可以定期调用以看到写入进程新增、删除或合并后的分段。
+        """
+        for _ in range(3):
+            try:
+                version = self._stat_manifest()
+            except FileNotFoundError:
+                return False
+            if version == self._manifest_version:
+                return False
+            try:
+                with open(self.manifest_path, "r", encoding="utf-8") as f:
+                    manifest = json.load(f)
+                segments = []
+                # 旧格式的清单没有记录行号，各分段的行号依次连续
+                row = 0
+                quantization = manifest.get("quantization")
+                for item in manifest["segments"]:
+                    segment = self._open_segment(item["name"], item.get("start", row), quantization is not None,
+                                                 item.get("sparse", False), item.get("keyed", False),
+                                                 item.get("deleted"))
+                    row = segment.end
+                    segments.append(segment)
+            except FileNotFoundError:
+                # 读取清单后分段恰好被合并删除，重新读取清单
+                continue
+            with self._lock:
+                self.dim = manifest.get("dim")
+                self.quantization = quantization
+                self._next_id = manifest.get("next_id", len(segments) + 1)
+                self._publish(segments, manifest.get("next_row", row))
+                self._manifest_version = version
+            return True
+        raise RuntimeError("向量库清单在读取过程中持续变化")
+
+    def _new_name(self) -> str:
+        name = f"seg-{self._next_id:06d}"
+        self._next_id += 1
+        return name
+
+    def _write_codes(self, name: str, vectors: np.ndarray) -> None:
+        codes_path, scales_path = self._quant_paths(name)
+        codes = np.lib.format.open_memmap(f"{codes_path}.tmp", mode="w+", dtype=np.int8, shape=vectors.shape)
+        scales = np.empty(vectors.shape[0], dtype=np.float32)
+        for row in range(0, vectors.shape[0], COPY_ROWS):
+            codes[row:row + COPY_ROWS], scales[row:row + COPY_ROWS] = quantize_int8(vectors[row:row + COPY_ROWS])
+        codes.flush()
+        del codes
+        with open(f"{codes_path}.tmp", "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(f"{codes_path}.tmp", codes_path)
+        _save_array(scales_path, scales)
+
+    def _write_ids(self, name: str, doc_ids: List[str]) -> None:
+        _, keys_path, ids_path = self._id_paths(name)
+        _save_array(keys_path, np.array([document_key(doc_id) for doc_id in doc_ids], dtype=np.uint64))
+        lines = "".join(json.dumps(doc_id, ensure_ascii=False) + "\n" for doc_id in doc_ids)
+        _fsync_write(ids_path, lines.encode("utf-8"))
+
+    def _write_segment(self, name: str, vectors: np.ndarray, metadatas: List[dict],
+                       doc_ids: Optional[List[str]] = None) -> None:
+        vectors_path, metadata_path = self._paths(name)
+        _save_array(vectors_path, vectors)
+        if self.quantization is not None:
+            self._write_codes(name, vectors)
+        if doc_ids is not None:
+            self._write_ids(name, doc_ids)
+        lines = "".join(json.dumps(item, ensure_ascii=False) + "\n" for item in metadatas)
+        _fsync_write(metadata_path, lines.encode("utf-8"))
+
+    def _remove_files(self, paths) -> None:
+        # 其他进程已经映射的文件在删除后仍然可读，直到对方关闭映射
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _remove_segment_files(self, segments) -> None:
+        for segment in segments:
+            paths = self._paths(segment.name) + self._quant_paths(segment.name) + self._id_paths(segment.name)
+            if segment.deleted_file is not None:
+                paths += (os.path.join(self.segment_dir, segment.deleted_file),)
+            self._remove_files(paths)
+
+    # ---- 写入与删除 ----
+
+    def append(self, vectors: np.ndarray, metadatas: List[dict], doc_ids: Optional[List[Optional[str]]] = None) -> int:
+        """把一批已归一化的向量写成新分段，返回第一行的行号
+
+        doc_ids为每行的文档编号，None表示使用默认编号（行号）；库中已有相同编号的文档时，
+        旧的行在同一次清单替换中标记为删除，即按编号更新。
+        十进制整数形式的编号保留给默认编号，只能用于更新已有的文档，否则会与之后分配的行号重复。
+        """
+        if self.read_only:
+            raise PermissionError("向量库以只读方式打开")
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self.dim is not None and vectors.shape[1] != self.dim:
+            raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match database dimension {self.dim}")
+        if doc_ids is not None:
+            if len(doc_ids) != vectors.shape[0]:
+                raise ValueError("文档编号数与向量数不一致")
+            explicit = [doc_id for doc_id in doc_ids if doc_id is not None]
+            if len(set(explicit)) != len(explicit):
+                raise ValueError("同一批写入中的文档编号重复")
+        with self._lock:
+            self.dim = vectors.shape[1]
+            snapshot = self.snapshot
+            start = snapshot.next_row
+            replaced = np.empty(0, dtype=np.int64)
+            if doc_ids is not None:
+                explicit = np.array([doc_id is not None for doc_id in doc_ids])
+                doc_ids = [str(start + i) if doc_id is None else doc_id for i, doc_id in enumerate(doc_ids)]
+                replaced = snapshot.find(doc_ids)
+                numeric = np.array([document_key(doc_id) < HASHED_KEY_BIT for doc_id in doc_ids])
+                reserved = explicit & numeric & (replaced < 0)
+                if reserved.any():
+                    raise ValueError(f"数字形式的文档编号只能用于更新已有的文档: {doc_ids[int(np.argmax(reserved))]}")
+                replaced = np.sort(replaced[replaced >= 0])
+            name = self._new_name()
+            self._write_segment(name, vectors, metadatas, doc_ids)
+            segment = self._open_segment(name, start, self.quantization is not None, keyed=doc_ids is not None)
+            segments, stale = self._mark_deleted(snapshot.segments + (segment,), replaced)
+            self._publish(segments, start + segment.count)
+            self._write_manifest()
+        self._remove_files(stale)
+        if self._needs_compaction():
+            self.compact(background=True)
+        return start
+
+    def delete(self, doc_ids: List[str]) -> int:
+        """按文档编号删除（写入墓碑），返回删除的行数
+
+        之后取得的快照不再包含这些行；磁盘空间在合并重写所在分段时回收。
+        """
+        if self.read_only:
+            raise PermissionError("向量库以只读方式打开")
+        with self._lock:
+            snapshot = self.snapshot
+            rows = snapshot.find(list(doc_ids))
+            rows = np.unique(rows[rows >= 0])
+            if not rows.size:
+                return 0
+            segments, stale = self._mark_deleted(snapshot.segments, rows)
+            self._publish(segments)
+            self._write_manifest()
+        self._remove_files(stale)
+        if self._needs_compaction():
+            self.compact(background=True)
+        return int(rows.size)
+
+    def _mark_deleted(self, segments: Tuple[Segment, ...], rows: np.ndarray) -> Tuple[Tuple[Segment, ...], List[str]]:
+        """把升序行号对应的行标记为删除，返回新的分段元组和被替换的墓碑文件"""
+        if not rows.size:
+            return segments, []
+        result = list(segments)
+        stale = []
+        for i, _, _, segment, local in SegmentSnapshot(segments)._split(rows):
+            local = local[local >= 0]
+            if not local.size:
+                continue
+            deleted = np.zeros(segment.count, dtype=bool) if segment.deleted is None else segment.deleted.copy()
+            deleted[local] = True
+            name = f"{segment.name}.del-{self._next_id:06d}.npy"
+            self._next_id += 1
+            _save_array(os.path.join(self.segment_dir, name), np.flatnonzero(deleted))
+            if segment.deleted_file is not None:
+                stale.append(os.path.join(self.segment_dir, segment.deleted_file))
+            result[i] = replace(segment, deleted=deleted, deleted_file=name, deleted_count=int(deleted.sum()))
+        return tuple(result), stale
+
+    # ---- 合并 ----
+
+    def _pick_merge_range(self, segments) -> Tuple[int, int]:
+        """选择末尾需要合并的分段：前一个分段不超过已选分段总量的两倍时一并合并
+
+        新写入的小分段先互相合并，大分段很少被重写，总的重写量约为 O(N log N)。
+        """
+        end = len(segments)
+        start = end - 1
+        total = segments[start].count
+        while start > 0 and segments[start - 1].count <= total * 2:
+            start -= 1
+            total += segments[start].count
+        return min(start, end - 2), end
+
+    def _pick_range(self, segments, limit: int, purge_ratio: float) -> Optional[Tuple[int, int]]:
+        """分段过多时选择末尾的分段合并，否则选择已删除的行达到比例的分段单独重写"""
+        if len(segments) > limit:
+            return self._pick_merge_range(segments)
+        for i, segment in enumerate(segments):
+            if segment.deleted_count and segment.deleted_count >= segment.count * purge_ratio:
+                return i, i + 1
+        return None
+
+    def _needs_compaction(self) -> bool:
+        return self._pick_range(self.segments, self.max_segments, self.purge_ratio) is not None
+
+    def _merge_arrays(self, segments: List[Segment], keeps, field: str, path: str, dtype, total: int) -> None:
+        merged = np.lib.format.open_memmap(f"{path}.tmp", mode="w+", dtype=dtype, shape=(total, self.dim))
+        offset = 0
+        for segment, keep in zip(segments, keeps):
+            source = getattr(segment, field)
+            for row in range(0, segment.count, COPY_ROWS):
+                block = source[row:row + COPY_ROWS]
+                if keep is not None:
+                    block = block[keep[row:row + COPY_ROWS]]
+                merged[offset:offset + block.shape[0]] = block
+                offset += block.shape[0]
+        merged.flush()
+        del merged
+        with open(f"{path}.tmp", "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(f"{path}.tmp", path)
+
+    def _merge(self, segments: List[Segment], name: str, quantized: bool) -> Optional[Segment]:
+        """把分段中未删除的行按行号顺序写成一个新分段并打开；全部已删除时返回None"""
+        keeps = [None if segment.deleted is None else ~segment.deleted for segment in segments]
+        total = sum(segment.count - segment.deleted_count for segment in segments)
+        if total == 0:
+            return None
+
+        def kept(array, keep):
+            return array if keep is None else array[keep]
+
+        vectors_path, metadata_path = self._paths(name)
+        self._merge_arrays(segments, keeps, "vectors", vectors_path, np.float32, total)
+        if quantized:
+            codes_path, scales_path = self._quant_paths(name)
+            self._merge_arrays(segments, keeps, "codes", codes_path, np.int8, total)
+            _save_array(scales_path, np.concatenate([kept(s.scales, keep) for s, keep in zip(segments, keeps)]))
+        rows_path, _, ids_path = self._id_paths(name)
+        rows = np.concatenate([kept(s.row_ids(), keep) for s, keep in zip(segments, keeps)])
+        sparse = int(rows[-1]) - int(rows[0]) + 1 != total
+        if sparse:
+            _save_array(rows_path, rows)
+        keyed = any(segment.keys is not None for segment in segments)
+        if keyed:
+            doc_ids = []
+            for segment, keep in zip(segments, keeps):
+                indices = range(segment.count) if keep is None else np.flatnonzero(keep).tolist()
+                doc_ids.extend(segment.document_id(i) for i in indices)
+            self._write_ids(name, doc_ids)
+        with open(f"{metadata_path}.tmp", "wb") as out:
+            for segment, keep in zip(segments, keeps):
+                _copy_lines(out, segment.records, segment.offsets, keep)
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(f"{metadata_path}.tmp", metadata_path)
+        return self._open_segment(name, int(rows[0]), quantized, sparse, keyed)
+
+    def _compact_once(self, limit: int, purge_ratio: float) -> bool:
+        with self._lock:
+            segments = self.segments
+            picked = self._pick_range(segments, limit, purge_ratio)
+            if picked is None:
+                return False
+            selected = list(segments[picked[0]:picked[1]])
+            name = self._new_name()
+            # 启用量化之前写入、尚未补建量化向量的分段不能与已量化的分段合并为量化分段
+            quantized = all(segment.codes is not None for segment in selected)
+        # 重写期间不持有锁，写入、删除和检索照常进行
+        merged = self._merge(selected, name, quantized)
+        with self._lock:
+            # 合并期间新写入的分段追加在末尾，不受影响；删除会替换分段对象，按名称查找
+            current = self.segments
+            index = next(i for i, segment in enumerate(current) if segment.name == selected[0].name)
+            replaced = current[index:index + len(selected)]
+            stale = []
+            if merged is not None:
+                # 合并期间新删除的行补记到合并后的分段
+                rows = [after.row_ids()[after.deleted & ~before.deleted if before.deleted is not None
+                                        else after.deleted]
+                        for before, after in zip(selected, replaced) if after.deleted is not before.deleted]
+                if rows:
+                    (merged,), stale = self._mark_deleted((merged,), np.sort(np.concatenate(rows)))
+            self._publish(current[:index] + ((merged,) if merged is not None else ()) + current[index + len(selected):])
+            self._write_manifest()
+        self._remove_files(stale)
+        self._remove_segment_files(replaced)
+        purged = sum(segment.deleted_count for segment in selected)
+        logger.info(f"合并 {len(selected)} 个分段为 {name}（{merged.count if merged is not None else 0} 条向量，"
+                    f"清除 {purged} 条已删除的行）")
+        return True
+
+    def _run_compaction(self, full: bool, background: bool) -> None:
+        limit = 1 if full else self.max_segments
+        purge_ratio = 0.0 if full else self.purge_ratio
+        # 同一时间只有一个合并任务，后台合并与手动合并不会选中相同的分段
+        with self._compact_lock:
+            try:
+                while True:
+                    with self._lock:
+                        if self._pick_range(self.segments, limit, purge_ratio) is None:
+                            # 与append在同一把锁下检查并清除标记，之后写入的分段会启动新的合并
+                            if background:
+                                self._compaction = None
+                            return
+                    if not self._compact_once(limit, purge_ratio):
+                        break
+            except Exception as e:
+                logger.error(f"向量库分段合并失败: {e}")
+            if background:
+                with self._lock:
+                    self._compaction = None
+
+    def set_quantization(self, mode: Optional[str]) -> None:
+        """启用（mode="int8"）或关闭向量量化；启用时为已有分段补建量化向量"""
+        if self.read_only:
+            raise PermissionError("向量库以只读方式打开")
+        if mode is not None and mode not in QUANTIZATION_MODES:
+            raise ValueError(f"不支持的量化方式: {mode}")
+        # 补建期间不进行合并，之后写入的分段直接带有量化向量
+        with self._compact_lock:
+            with self._lock:
+                self.quantization = mode
+                segments = self.segments
+            if mode is None:
+                names = {segment.name for segment in segments if segment.codes is not None}
+            else:
+                names = set()
+                for segment in segments:
+                    if segment.codes is None:
+                        self._write_codes(segment.name, segment.vectors)
+                        names.add(segment.name)
+            with self._lock:
+                # 补建期间被删除替换的分段对象按名称对应
+                self._publish(self._with_codes(segment, mode is not None) if segment.name in names else segment
+                              for segment in self.segments)
+                self._write_manifest()
+            if mode is None:
+                for name in names:
+                    self._remove_files(self._quant_paths(name))
+        logger.info(f"向量量化方式: {mode or '无'}")
+
+    def compact(self, background: bool = False, full: bool = False) -> None:
+        """合并分段；full为True时合并为一个分段并清除全部已删除的行，否则合并到不超过max_segments个，
+        并重写已删除的行达到purge_ratio的分段"""
+        if self.read_only:
+            raise PermissionError("向量库以只读方式打开")
+        if not background:
+            self._run_compaction(full, False)
+            return
+        with self._lock:
+            # 正在运行的后台合并会在退出前重新检查分段数量
+            if self._compaction is not None:
+                return
+            self._compaction = threading.Thread(target=self._run_compaction, args=(full, True),
+                                                name="vector-compaction", daemon=True)
+            thread = self._compaction
+        thread.start()
+
+    def wait(self) -> None:
+        """等待后台合并完成"""
+        thread = self._compaction
+        if thread is not None:
+            thread.join()
@@ -0,0 +1,48 @@
+# tests/helpers.py
+"""测试共用的辅助代码"""
+
+import hashlib
+import os
+import sys
+
+import numpy as np
+
+# 将项目根目录添加到 sys.path 中
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from langchain.embeddings.base import Embeddings
+
+# 基准测试也会用到的辅助代码放在benchmarks/vector_data.py中
+from benchmarks.vector_data import UnusedEmbeddings, ids_of
+
+
+class HashEmbeddings(Embeddings):
+    """按文本生成确定的随机向量"""
+
+    def __init__(self, dim=16):
+        self.dim = dim
+
+    def _embed(self, text):
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:4], "little")
+        return np.random.default_rng(seed).normal(size=self.dim).tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+def clustered(count, dim=16, clusters=20, seed=0, scale=0.3):
+    """多个高斯簇加噪声生成的向量"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    return (centers[rng.integers(0, clusters, count)] + rng.normal(scale=scale, size=(count, dim))).astype(np.float32)
+
+
+def make_batch(start, count, dim=16):
+    """从第start行开始的一批向量和元数据，内容只由start决定"""
+    vectors = np.random.default_rng(start).normal(size=(count, dim)).astype(np.float32)
+    metadatas = [{"id": start + i, "text": f"第{start + i}号文件", "year": 2020 + (start + i) % 3}
+                 for i in range(count)]
+    return vectors, metadatas
@@ -0,0 +1,138 @@
+# tests/test_corpus_ingest.py
+
+import os
+import sys
+
+import pytest
+
+# 将项目根目录添加到 sys.path 中
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from langchain.embeddings.base import Embeddings
+
+from corpus_ingest import ingest
+from my_agent.utils.shared.docx_writer import text_to_docx_bytes
+from my_agent.utils.shared.retriever import CustomVectorDB
+
+
+class LengthEmbeddings(Embeddings):
+    """按文本长度生成向量；fail_after批之后抛出异常，模拟导入中断"""
+
+    def __init__(self, fail_after=None):
+        self.fail_after = fail_after
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        if self.fail_after is not None and self.calls > self.fail_after:
+            raise RuntimeError("嵌入服务不可用")
+        return [[float(len(text)), 1.0, 0.5] for text in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)), 1.0, 0.5]
+
+
+def write_docx(path, paragraphs):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(text_to_docx_bytes("\n".join(paragraphs)))
+
+
+def make_corpus(root, count):
+    for i in range(count):
+        paragraphs = [f"第{i}号文件第{j}段，关于做好第{j}项工作的通知。" * 8 for j in range(6)]
+        write_docx(root / f"dept{i % 2}" / f"doc{i}.docx", paragraphs)
+
+
+def sources(db):
+    # 已删除的行为None
+    return sorted((item["source"], item["chunk"]) for item in db.metadata if item is not None)
+
+
+def test_ingest_and_resume_skips_finished_files(tmp_path):
+    corpus = tmp_path / "corpus"
+    make_corpus(corpus, 4)
+    (corpus / "~$doc0.docx").write_bytes(b"lock file")
+    (corpus / "broken.docx").write_bytes(b"not a docx")
+    db = CustomVectorDB(LengthEmbeddings(), str(tmp_path / "db"))
+
+    report = ingest(str(corpus), db, batch_size=5)
+    assert report["docs"] == 4 and report["failed"] == 1 and report["skipped"] == 0
+    assert report["chunks"] == len(db.metadata) > 4
+    assert report["chunks_per_second"] > 0
+    first = sources(db)
+    assert len(set(first)) == len(first)
+
+    # 新增文件后再次运行只导入新文件，失败的文件会重试
+    write_docx(corpus / "dept0" / "doc4.docx", ["第4号文件，关于做好第1项工作的通知。"])
+    report = ingest(str(corpus), db, batch_size=5)
+    assert report["docs"] == 1 and report["skipped"] == 4 and report["failed"] == 1
+    assert len(set(sources(db))) == len(db.metadata)
+    assert {source for source, _ in sources(db)} == {f"dept{i % 2}/doc{i}.docx" for i in range(5)}
+
+
+def test_interrupted_ingest_resumes_without_duplicates(tmp_path):
+    corpus = tmp_path / "corpus"
+    make_corpus(corpus, 6)
+    db_path = str(tmp_path / "db")
+
+    db = CustomVectorDB(LengthEmbeddings(fail_after=3), db_path)
+    with pytest.raises(RuntimeError):
+        ingest(str(corpus), db, batch_size=4)
+    written = len(db.metadata)
+    assert 0 < written
+
+    # 重新打开库后继续导入，已写入的片段（包括只写入了一部分的文件）不会重复
+    db = CustomVectorDB(LengthEmbeddings(), db_path)
+    ingest(str(corpus), db, batch_size=4)
+    complete = CustomVectorDB(LengthEmbeddings(), str(tmp_path / "fresh"))
+    ingest(str(corpus), complete, batch_size=4, workers=2)
+    assert sources(db) == sources(complete)
+    assert len(db.metadata) > written
+
+
+def test_modified_file_replaces_its_old_chunks(tmp_path):
+    corpus = tmp_path / "corpus"
+    make_corpus(corpus, 2)
+    db = CustomVectorDB(LengthEmbeddings(), str(tmp_path / "db"))
+    ingest(str(corpus), db, batch_size=4)
+    old_chunks = [chunk for source, chunk in sources(db) if source == "dept0/doc0.docx"]
+    assert len(old_chunks) > 1
+
+    # 修改后片段变少：原有编号的片段被覆盖，多出的旧片段被删除，其他文件不受影响
+    path = corpus / "dept0" / "doc0.docx"
+    write_docx(path, ["修改后的唯一一段内容。"])
+    os.utime(path, ns=(path.stat().st_atime_ns, path.stat().st_mtime_ns + 10 ** 9))
+    report = ingest(str(corpus), db, batch_size=4)
+    assert report["docs"] == 1 and report["skipped"] == 1
+    assert [chunk for source, chunk in sources(db) if source == "dept0/doc0.docx"] == [0]
+    assert [doc.page_content for doc in db.get_by_ids(["dept0/doc0.docx#0", "dept0/doc0.docx#1"])] == \
+        ["修改后的唯一一段内容。"]
+    assert all(doc.metadata["source"] != "dept0/doc0.docx" or doc.metadata["chunk"] == 0
+               for doc, _ in db.lexical_search_with_score("第0号文件", k=100))
+    assert len([source for source, _ in sources(db) if source == "dept1/doc1.docx"]) > 1
+
+
+def test_file_modified_after_interruption_is_fully_reimported(tmp_path):
+    corpus = tmp_path / "corpus"
+    make_corpus(corpus, 3)
+    db_path = str(tmp_path / "db")
+    # 第一个文件只写入了一部分片段时中断
+    db = CustomVectorDB(LengthEmbeddings(fail_after=1), db_path)
+    with pytest.raises(RuntimeError):
+        ingest(str(corpus), db, batch_size=3)
+    assert [chunk for source, chunk in sources(db)] == [0, 1, 2]
+
+    # 中断后修改文件：已写入的旧片段不能跳过，恢复后库中只有新内容
+    for i in range(3):
+        path = corpus / f"dept{i % 2}" / f"doc{i}.docx"
+        write_docx(path, [f"修改后第{i}号文件第{j}段，关于调整第{j}项工作的通知。" * 8 for j in range(4)])
+        os.utime(path, ns=(path.stat().st_atime_ns, path.stat().st_mtime_ns + 10 ** 9))
+    db = CustomVectorDB(LengthEmbeddings(), db_path)
+    ingest(str(corpus), db, batch_size=3)
+    fresh = CustomVectorDB(LengthEmbeddings(), str(tmp_path / "fresh"))
+    ingest(str(corpus), fresh, batch_size=3)
+
+    def contents(db):
+        return sorted((item["source"], item["chunk"], item["text"]) for item in db.metadata if item is not None)
+
+    assert contents(db) == contents(fresh)
@@ -0,0 +1,71 @@
+# tests/test_correction_cache.py
+
+import os
+import sys
+
+# 将项目根目录添加到 sys.path 中
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from my_agent.utils.shared.correction_cache import CorrectionCache, make_cache_key
+from my_agent.csc_pipeline import split_text
+
+
+def test_cache_key_uses_exact_text_and_includes_tool():
+    # 命中时返回缓存的纠错结果，空白和换行符不同的原文不能共用
+    assert make_cache_key("　　文本\r\n内容 ", "纠错算法") != make_cache_key("文本\n内容", "纠错算法")
+    assert make_cache_key("文本\n内容", "纠错算法") == make_cache_key("文本\n内容", "纠错算法")
+    assert make_cache_key("文本", "纠错算法") != make_cache_key("文本", "echo")
+
+
+def test_memory_tier_evicts_by_size():
+    cache = CorrectionCache(max_bytes=200)
+    for i in range(10):
+        cache.put(f"文本{i}", "纠错算法", {"status": "success", "modified": False, "message": "x" * 30})
+    stats = cache.stats()
+    assert stats["memory_bytes"] <= 200
+    assert stats["evictions"] > 0
+    assert cache.get("文本9", "纠错算法") is not None
+    assert cache.get("文本0", "纠错算法") is None
+    assert cache.stats()["memory_hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    db_path = str(tmp_path / "csc_cache.sqlite3")
+    result = {"status": "success", "modified": True, "corrected_text": "正确", "changes": "错->正"}
+    CorrectionCache(db_path=db_path).put("错确", "纠错算法", result)
+
+    cache = CorrectionCache(db_path=db_path)
+    assert cache.get("错确", "纠错算法") == result
+    assert cache.stats()["disk_hits"] == 1
+    # 第二次从内存命中
+    assert cache.get("错确", "纠错算法") == result
+    assert cache.stats()["memory_hits"] == 1
+
+
+def test_editing_one_paragraph_only_changes_nearby_chunks():
+    paragraphs = [f"第{i}段，关于加强公文处理工作的通知内容。" for i in range(200)]
+    edited = list(paragraphs)
+    edited[50] = edited[50] + "新增了一些补充说明文字。"
+
+    before = {chunk.text for chunk in split_text("\n".join(paragraphs), max_chars=120)}
+    after = [chunk.text for chunk in split_text("\n".join(edited), max_chars=120)]
+    changed = [text for text in after if text not in before]
+    assert 1 <= len(changed) <= 3
+
+
+def test_disk_tier_evicts_least_recently_used(tmp_path):
+    # 内存缓存放不下任何条目，每次都从磁盘读取
+    cache = CorrectionCache(max_bytes=1, db_path=str(tmp_path / "csc_cache.sqlite3"), max_disk_entries=10)
+    result = {"status": "success", "modified": True, "corrected_text": "正确"}
+    cache.put("常用", "纠错算法", result)
+    for i in range(30):
+        # 读取常用条目会更新其最近使用时间，不会被淘汰
+        assert cache.get("常用", "纠错算法") == result
+        cache.put(f"文本{i}", "纠错算法", result)
+
+    stats = cache.stats()
+    assert stats["disk_entries"] <= 10 and stats["disk_evictions"] > 0
+    reopened = CorrectionCache(db_path=str(tmp_path / "csc_cache.sqlite3"), max_disk_entries=10)
+    assert reopened.get("常用", "纠错算法") == result
+    assert reopened.get("文本0", "纠错算法") is None
+    assert reopened.get("文本29", "纠错算法") == result
@@ -0,0 +1,81 @@
+# tests/test_csc_pipeline.py
+
+import asyncio
+import os
+import random
+import sys
+
+# 将项目根目录添加到 sys.path 中
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+import my_agent.csc_pipeline as csc_pipeline
+from my_agent.csc_pipeline import split_text, correct_document_async, iter_document_correction
+
+
+def test_split_text_round_trips_and_respects_limit():
+    random.seed(0)
+    for _ in range(200):
+        paragraphs = [
+            "".join(random.choice("公文纠错测试。！？；ab ”　") for _ in range(random.choice([0, 5, 40, 300])))
+            for _ in range(random.randint(0, 12))
+        ]
+        text = "\n".join(paragraphs)
+        chunks = split_text(text, max_chars=50)
+        assert "".join(chunk.text + chunk.separator for chunk in chunks) == text
+        assert all(len(chunk.text) <= 50 for chunk in chunks)
+
+
+def test_long_paragraph_splits_on_sentence_boundaries():
+    paragraph = "第一句话。" * 10 + "最后一句"
+    chunks = split_text(paragraph, max_chars=12)
+    assert all(chunk.text.endswith("。") for chunk in chunks[:-1])
+
+
+def test_correction_merges_chunks_in_order_and_keeps_failed_chunks(monkeypatch):
+    active = 0
+    max_active = 0
+
+    async def fake_csc_async(text, timeout=None):
+        nonlocal active, max_active
+        active += 1
+        max_active = max(max_active, active)
+        # 打乱完成顺序
+        await asyncio.sleep(random.random() * 0.02)
+        active -= 1
+        if "坏" in text:
+            return {"status": "error", "message": "服务异常"}
+        if "错" in text:
+            return {"status": "success", "modified": True, "corrected_text": text.replace("错", "对"),
+                    "changes": "错->对"}
+        return {"status": "success", "modified": False, "message": "未发现明显拼写错误"}
+
+    monkeypatch.setattr(csc_pipeline, "csc_async", fake_csc_async)
+    paragraphs = [f"　　第{i}段{'错' if i % 3 == 0 else ''}{'坏' if i == 4 else ''}内容。" for i in range(12)]
+    text = "\n".join(paragraphs)
+
+    result = asyncio.run(correct_document_async(text, max_chars=10, concurrency=3))
+
+    assert result["status"] == "success"
+    assert result["modified"] is True
+    assert result["corrected_text"] == text.replace("第0段错", "第0段对").replace("第3段错", "第3段对") \
+        .replace("第6段错", "第6段对").replace("第9段错", "第9段对")
+    # 保留全角缩进
+    assert result["corrected_text"].startswith("　　")
+    assert result["failed_chunks"] == [4]
+    assert result["changes"].splitlines()[0].startswith("[片段1]")
+    assert max_active <= 3
+
+
+def test_progress_events_precede_result(monkeypatch):
+    async def fake_csc_async(text, timeout=None):
+        return {"status": "success", "modified": False, "message": "无需修改"}
+
+    monkeypatch.setattr(csc_pipeline, "csc_async", fake_csc_async)
+
+    async def collect():
+        return [event async for event in iter_document_correction("甲。\n乙。\n丙。", max_chars=2)]
+
+    events = asyncio.run(collect())
+    assert [event["type"] for event in events] == ["progress"] * 3 + ["result"]
+    assert sorted(event["index"] for event in events[:-1]) == [0, 1, 2]
+    assert events[-1]["result"]["modified"] is False
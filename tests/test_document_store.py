@@ -0,0 +1,110 @@
+# tests/test_document_store.py
+
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+# 将项目根目录添加到 sys.path 中
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from api.document_store import DocumentStore
+
+
+def test_sessions_do_not_share_documents(tmp_path):
+    store = DocumentStore(str(tmp_path))
+
+    def upload(i):
+        session = f"session_{i % 4}"
+        return session, store.put(session, f"文档{i}.docx", f"原始{i}".encode("utf-8"), f"内容{i}")
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        uploads = list(executor.map(upload, range(40)))
+
+    for session, record in uploads:
+        assert store.get(record.document_id).session_id == session
+        assert store.get_content(record.document_id) == "内容" + record.filename[2:-5]
+    assert store.latest("session_0").document_id != store.latest("session_1").document_id
+
+    # 相同会话重复上传相同文件得到相同ID，处理结果被重置
+    first = store.put("s", "a.docx", b"same", "原文")
+    store.set_processed(first.document_id, "处理后")
+    assert store.get_latest_text(first.document_id) == "处理后"
+    again = store.put("s", "a.docx", b"same", "原文")
+    assert again.document_id == first.document_id
+    assert store.get_latest_text(first.document_id) == "原文"
+    assert store.put("other", "a.docx", b"same", "原文").document_id != first.document_id
+
+
+def test_quota_memory_bound_and_reload(tmp_path):
+    store = DocumentStore(str(tmp_path), max_memory_bytes=64, session_quota=3)
+    records = [store.put("s", f"{i}.docx", bytes([i]) * 10, f"第{i}篇" * 5) for i in range(5)]
+
+    # 超出配额时删除最早的文档及其磁盘文件
+    assert [r.document_id for r in store.list("s")] == [r.document_id for r in records[2:]]
+    assert store.get(records[0].document_id) is None
+    assert not (tmp_path / records[0].document_id[:2] / records[0].document_id).exists()
+
+    # 内存中只保留不超过上限的文本，其余从磁盘读回
+    assert store.stats()["memory_bytes"] <= 64
+    assert store.get_content(records[2].document_id) == "第2篇" * 5
+    assert store.disk_reads >= 1
+
+    store.set_processed(records[3].document_id, "修改后")
+    reloaded = DocumentStore(str(tmp_path), session_quota=3)
+    assert [r.document_id for r in reloaded.list("s")] == [r.document_id for r in records[2:]]
+    assert reloaded.get_latest_text(records[3].document_id) == "修改后"
+    assert reloaded.original_path(records[4].document_id).read_bytes() == bytes([4]) * 10
+
+
+def test_concurrent_writes_to_one_document(tmp_path):
+    store = DocumentStore(str(tmp_path))
+    record = store.put("s", "a.docx", b"data", "原文")
+
+    def write(i):
+        return store.set_processed(record.document_id, f"处理{i}")
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(write, range(400)))
+
+    # 文档一直存在，每次写入都应成功，且不留下临时文件
+    assert all(results)
+    assert store.get_processed(record.document_id).startswith("处理")
+    assert not list((tmp_path / record.document_id[:2] / record.document_id).glob("*.tmp"))
+
+
+def test_documents_are_scoped_to_their_session(tmp_path):
+    store = DocumentStore(str(tmp_path))
+    record = store.put("a", "a.docx", b"data", "原文")
+
+    # 持有文档ID的其他会话既不能读取也不能删除该文档
+    assert store.resolve("b", record.document_id) is None
+    assert store.remove("b", record.document_id) is False
+    assert store.resolve("a", record.document_id) is record
+    assert store.resolve("a") is record
+
+    assert store.remove("a", record.document_id) is True
+    assert store.resolve("a", record.document_id) is None
+    assert not (tmp_path / record.document_id[:2] / record.document_id).exists()
+
+
+def test_global_limits_evict_least_recently_used_across_sessions(tmp_path):
+    store = DocumentStore(str(tmp_path), session_quota=5, max_documents=3)
+    # 每次都使用新的会话，单个会话的配额不起作用
+    records = [store.put(f"s{i}", f"{i}.docx", bytes([i]) * 10, f"第{i}篇") for i in range(3)]
+    # 最近访问过的文档不会被优先删除
+    assert store.resolve("s0", records[0].document_id) is records[0]
+    fourth = store.put("s3", "3.docx", b"x" * 10, "第3篇")
+
+    assert store.get(records[1].document_id) is None
+    assert store.list("s1") == []
+    assert not (tmp_path / records[1].document_id[:2] / records[1].document_id).exists()
+    assert all(store.get(r.document_id) for r in (records[0], records[2], fourth))
+    assert store.stats()["documents"] == 3
+
+    # 磁盘占用上限同样跨会话生效，刚上传的文档总是保留
+    limit = store.stats()["disk_bytes"]
+    bounded = DocumentStore(str(tmp_path), max_disk_bytes=limit)
+    assert bounded.stats()["documents"] == 3
+    big = bounded.put("s4", "4.docx", b"y" * limit, "大文档")
+    assert bounded.stats()["documents"] == 1 and bounded.get(big.document_id) is big
+    assert bounded.stats()["disk_bytes"] > limit
@@ -0,0 +1,61 @@
+# tests/test_docx_extractor.py
+
+import io
+import os
+import sys
+
+from docx import Document
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls
+
+# 将项目根目录添加到 sys.path 中
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from my_agent.utils.shared.doc_processor import DocProcessor
+from my_agent.utils.shared.docx_extractor import extract_paragraphs
+
+
+def make_tricky_docx():
+    doc = Document()
+    doc.add_paragraph("关于开展公文纠错工作的通知")
+    doc.add_paragraph("")
+    doc.add_paragraph("   ")
+    paragraph = doc.add_paragraph("第一行")
+    paragraph.add_run().add_break()
+    paragraph.add_run("第二行\t制表符")
+    doc.add_page_break()
+    table = doc.add_table(rows=1, cols=2)
+    table.cell(0, 0).text = "表格内的段落不计入"
+    body_p = doc.add_paragraph("  前后空白  ")
+    body_p._p.append(parse_xml(
+        f'<w:hyperlink {nsdecls("w", "r")} r:id="rId99"><w:r><w:t xml:space="preserve">链接 </w:t></w:r></w:hyperlink>'
+    ))
+    body_p._p.append(parse_xml(
+        f'<w:r {nsdecls("w")}><w:t>A</w:t><w:noBreakHyphen/><w:cr/><w:br w:type="column"/><w:ptab/>B</w:r>'
+    ))
+    # 修订插入内容中的文字python-docx不计入段落文本
+    body_p._p.append(parse_xml(f'<w:ins {nsdecls("w")} w:id="1"><w:r><w:t>插入</w:t></w:r></w:ins>'))
+    doc.add_paragraph("结尾。")
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def test_lxml_engine_matches_python_docx():
+    data = make_tricky_docx()
+    expected = DocProcessor.extract_text(io.BytesIO(data), engine="python-docx")
+    assert DocProcessor.extract_text(io.BytesIO(data), engine="lxml") == expected
+
+    reference = Document(io.BytesIO(data)).paragraphs
+    content, paragraphs = extract_paragraphs(io.BytesIO(data))
+    assert content == expected
+    assert [p.text for p in paragraphs] == [p.text for p in reference]
+    for paragraph in paragraphs:
+        if paragraph.offset >= 0:
+            assert content[paragraph.offset:paragraph.offset + len(paragraph.text)] == paragraph.text
+        else:
+            assert not paragraph.text.strip()
+
+
+def test_invalid_document_reports_error():
+    assert DocProcessor.load_doc_stream(b"not a zip") == "加载文档时出现错误，请检查文档格式"
@@ -0,0 +1,91 @@
+# tests/test_docx_patcher.py
+
+import io
+import os
+import sys
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from docx import Document
+
+# 将项目根目录添加到 sys.path 中
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from my_agent.utils.shared.docx_extractor import extract_text
+from my_agent.utils.shared.docx_patcher import DocxPatchError, patch_docx
+from my_agent.utils.shared.docx_writer import read_raw_entries
+
+
+def make_original():
+    doc = Document()
+    doc.add_heading("关于开展工作的通之", level=1)
+    paragraph = doc.add_paragraph()
+    paragraph.add_run("各单位要").bold = True
+    paragraph.add_run("高度重是公文质量，")
+    paragraph.add_run("\t切实落实。").italic = True
+    doc.add_paragraph("")
+    doc.add_paragraph("特此通知。")
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    # 追加一个不可压缩的大附件，模拟图片
+    with zipfile.ZipFile(buffer, "a", compression=zipfile.ZIP_STORED) as archive:
+        archive.writestr("word/media/image1.png", os.urandom(256 * 1024))
+    return buffer.getvalue()
+
+
+def test_patch_rewrites_only_changed_text():
+    original = make_original()
+    text = extract_text(io.BytesIO(original))
+    corrected = text.replace("通之", "通知").replace("重是", "重视")
+
+    output = io.BytesIO()
+    result = patch_docx(io.BytesIO(original), corrected, output)
+    assert result.changed_paragraphs == 2
+
+    patched = output.getvalue()
+    assert extract_text(io.BytesIO(patched)) == corrected
+    runs = Document(io.BytesIO(patched)).paragraphs[1].runs
+    assert [(run.text, run.bold, run.italic) for run in runs] == [
+        ("各单位要", True, None), ("高度重视公文质量，", None, None), ("\t切实落实。", None, True)
+    ]
+
+    # 未修改的条目原样复制压缩数据
+    before = {e.name: e for e in read_raw_entries(io.BytesIO(original), load=True)}
+    after = {e.name: e for e in read_raw_entries(io.BytesIO(patched), load=True)}
+    assert list(before) == list(after)
+    for name in before:
+        if name != "word/document.xml":
+            assert after[name].data == before[name].data, name
+
+
+def test_unchanged_text_copies_document_and_mismatch_is_rejected():
+    original = make_original()
+    text = extract_text(io.BytesIO(original))
+    output = io.BytesIO()
+    assert patch_docx(io.BytesIO(original), text, output).changed_paragraphs == 0
+    assert zipfile.ZipFile(output).read("word/document.xml") == zipfile.ZipFile(io.BytesIO(original)).read("word/document.xml")
+
+    with pytest.raises(DocxPatchError):
+        patch_docx(io.BytesIO(original), text + "\n新增段落", io.BytesIO())
+    with pytest.raises(DocxPatchError):
+        patch_docx(io.BytesIO(original), text.replace("各单位", "各\t单位"), io.BytesIO())
+
+
+def test_concurrent_builds_use_separate_temp_files(tmp_path, monkeypatch):
+    import api.main as main
+    from api.document_store import DocumentStore
+
+    store = DocumentStore(str(tmp_path))
+    monkeypatch.setattr(main, "document_store", store)
+    original = make_original()
+    text = extract_text(io.BytesIO(original))
+    record = store.put("s", "a.docx", original, text)
+    corrected = text.replace("通之", "通知")
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        paths = list(executor.map(lambda _: main.build_patched_docx(record.document_id, corrected, "k" * 64),
+                                  range(16)))
+    assert paths[0] is not None and all(path == paths[0] for path in paths)
+    assert extract_text(str(paths[0])) == corrected
+    assert not [name for name in os.listdir(paths[0].parent) if name.endswith(".tmp")]
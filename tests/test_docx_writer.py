@@ -0,0 +1,50 @@
+# tests/test_docx_writer.py
+
+import io
+import os
+import sys
+import zipfile
+
+from docx import Document
+
+# 将项目根目录添加到 sys.path 中
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from my_agent.utils.shared.docx_writer import DocxRenderCache, text_to_docx_bytes
+
+TEXT = "关于<开展>&公文纠错的通知\n\n  正文 第一段\t附件\r第二行  \n结尾。\x0b"
+
+
+def python_docx_bytes(text):
+    doc = Document()
+    for paragraph in text.split("\n"):
+        if paragraph.strip():
+            doc.add_paragraph(paragraph.replace("\x0b", ""))
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def test_output_matches_python_docx():
+    data = text_to_docx_bytes(TEXT)
+    reference = python_docx_bytes(TEXT)
+    with zipfile.ZipFile(io.BytesIO(data)) as archive, zipfile.ZipFile(io.BytesIO(reference)) as expected:
+        assert archive.testzip() is None
+        assert archive.namelist() == expected.namelist()
+        for name in expected.namelist():
+            assert archive.read(name) == expected.read(name), name
+    assert [p.text for p in Document(io.BytesIO(data)).paragraphs] == \
+        ["关于<开展>&公文纠错的通知", "  正文 第一段\t附件\n第二行  ", "结尾。"]
+
+
+def test_render_cache_reuses_output():
+    cache = DocxRenderCache(max_bytes=200 * 1024)
+    key, first = cache.render(TEXT)
+    again_key, again = cache.render(TEXT)
+    assert key == again_key and again is first
+    assert cache.render(TEXT + "新增")[0] != key
+    assert cache.stats()["hits"] == 1
+    # 超出上限时淘汰最久未使用的结果
+    for i in range(20):
+        cache.render(f"第{i}篇")
+    assert cache.stats()["bytes"] <= 200 * 1024
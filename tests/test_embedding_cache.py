@@ -0,0 +1,68 @@
+# tests/test_embedding_cache.py
+
+import os
+import sys
+
+# 将项目根目录添加到 sys.path 中
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from langchain.embeddings.base import Embeddings
+
+from my_agent.utils.shared.embedding_cache import CachedEmbeddings
+
+
+class CountingEmbeddings(Embeddings):
+    model_name = "fake-model"
+
+    def __init__(self):
+        self.batches = []
+
+    def embed_documents(self, texts):
+        self.batches.append(list(texts))
+        return [[float(len(text)), 0.5, -1.0] for text in texts]
+
+    def embed_query(self, text):
+        self.batches.append([text])
+        return [float(len(text)), 1.0, 0.0]
+
+
+def test_only_misses_are_computed_in_batches(tmp_path):
+    model = CountingEmbeddings()
+    cache = CachedEmbeddings(model, db_path=str(tmp_path / "cache.sqlite3"), batch_size=2)
+    first = cache.embed_documents(["甲", "乙乙", "甲", "丙丙丙"])
+    assert first == [[1.0, 0.5, -1.0], [2.0, 0.5, -1.0], [1.0, 0.5, -1.0], [3.0, 0.5, -1.0]]
+    # 重复文本只计算一次，按batch_size分批
+    assert model.batches == [["甲", "乙乙"], ["丙丙丙"]]
+
+    model.batches.clear()
+    assert cache.embed_documents(["乙乙", "丁"]) == [[2.0, 0.5, -1.0], [1.0, 0.5, -1.0]]
+    assert model.batches == [["丁"]]
+    # 查询向量与文档向量分开缓存
+    assert cache.embed_query("甲") == [1.0, 1.0, 0.0]
+    assert cache.embed_query("甲") == [1.0, 1.0, 0.0]
+    assert model.batches == [["丁"], ["甲"]]
+
+    stats = cache.stats()
+    assert stats["memory_hits"] == 2 and stats["misses"] == 5
+    assert abs(stats["hit_rate"] - 2 / 7) < 1e-9
+
+    # 批量查询使用embed_query的语义，与单条查询共用缓存
+    model.batches.clear()
+    assert cache.embed_queries(["甲", "戊戊", "戊戊"]) == [[1.0, 1.0, 0.0], [2.0, 1.0, 0.0], [2.0, 1.0, 0.0]]
+    assert model.batches == [["戊戊"]]
+    assert cache.embed_query("戊戊") == [2.0, 1.0, 0.0] and model.batches == [["戊戊"]]
+
+
+def test_disk_cache_survives_restart_and_separates_models(tmp_path):
+    db_path = str(tmp_path / "cache.sqlite3")
+    CachedEmbeddings(CountingEmbeddings(), db_path=db_path).embed_documents(["公文", "纠错"])
+
+    model = CountingEmbeddings()
+    cache = CachedEmbeddings(model, db_path=db_path)
+    assert cache.embed_documents(["纠错", "公文"]) == [[2.0, 0.5, -1.0], [2.0, 0.5, -1.0]]
+    assert model.batches == []
+    assert cache.stats()["disk_hits"] == 2
+
+    other = CountingEmbeddings()
+    CachedEmbeddings(other, model_name="other-model", db_path=db_path).embed_documents(["公文"])
+    assert other.batches == [["公文"]]
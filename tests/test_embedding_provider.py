@@ -0,0 +1,114 @@
+# tests/test_embedding_provider.py
+
+import os
+import stat
+import sys
+import threading
+
+import pytest
+
+# 将项目根目录添加到 sys.path 中
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from langchain.embeddings.base import Embeddings
+
+from my_agent.utils.shared.embedding_provider import EmbeddingProvider, LazyEmbeddings
+from my_agent.utils.shared.embedding_server import (EmbeddingServer, EmbeddingServerError, RemoteEmbeddings,
+                                                    authkey_path)
+
+
+class FakeEmbeddings(Embeddings):
+    def embed_documents(self, texts):
+        if any(text == "boom" for text in texts):
+            raise ValueError("boom")
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)), 0.0]
+
+
+def test_provider_loads_once_on_first_use():
+    loads = []
+
+    def factory():
+        loads.append(1)
+        return FakeEmbeddings()
+
+    provider = EmbeddingProvider(factory, model_name="fake")
+    embeddings = LazyEmbeddings(provider)
+    # 创建代理时不加载模型
+    assert provider.status()["state"] == "idle"
+    assert embeddings.model_name == "fake"
+
+    assert embeddings.embed_query("abc") == [3.0, 0.0]
+    assert embeddings.embed_documents(["a", "bb"]) == [[1.0, 1.0], [2.0, 1.0]]
+    assert loads == [1]
+    assert provider.status()["state"] == "ready"
+
+
+def test_warmup_runs_in_background_and_requests_wait():
+    release = threading.Event()
+
+    def factory():
+        release.wait(5)
+        return FakeEmbeddings()
+
+    provider = EmbeddingProvider(factory)
+    provider.warmup()
+    assert provider.state == "loading"
+    with pytest.raises(TimeoutError):
+        provider.get(timeout=0.01)
+    release.set()
+    assert provider.get(timeout=5).embed_query("ab") == [2.0, 0.0]
+    assert provider.is_ready()
+
+
+def test_failed_load_is_reported_and_retried():
+    attempts = []
+
+    def factory():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise OSError("模型文件不存在")
+        return FakeEmbeddings()
+
+    provider = EmbeddingProvider(factory)
+    with pytest.raises(RuntimeError):
+        provider.get()
+    status = provider.status()
+    assert status["state"] == "failed"
+    assert "模型文件不存在" in status["error"]
+    assert provider.get().embed_query("a") == [1.0, 0.0]
+
+
+def test_remote_embeddings_round_trip(tmp_path):
+    address = str(tmp_path / "embedding.sock")
+    server = EmbeddingServer(FakeEmbeddings(), address, model_name="fake")
+    ready = threading.Event()
+    threading.Thread(target=server.serve_forever, args=(ready,), daemon=True).start()
+    assert ready.wait(5)
+    try:
+        remote = RemoteEmbeddings(address, timeout=5)
+        assert remote.ping() == "fake"
+        assert remote.embed_documents(["a", "bbb"]) == [[1.0, 1.0], [3.0, 1.0]]
+        assert remote.embed_query("ab") == [2.0, 0.0]
+        assert remote.embed_queries(["ab", "c"]) == [[2.0, 0.0], [1.0, 0.0]]
+        assert remote.embed_documents([]) == [] and remote.embed_queries([]) == []
+        # 服务端的错误返回给调用方，连接仍可继续使用
+        with pytest.raises(EmbeddingServerError):
+            remote.embed_documents(["boom"])
+        assert remote.embed_query("abcd") == [4.0, 0.0]
+
+        # 未设置密钥时服务进程生成随机密钥，密钥文件和套接字只有当前用户可以访问
+        assert stat.S_IMODE(os.stat(authkey_path(address)).st_mode) == 0o600
+        assert stat.S_IMODE(os.stat(address).st_mode) == 0o600
+        with pytest.raises(EmbeddingServerError):
+            RemoteEmbeddings(address, authkey=b"embedding-server", timeout=5).ping()
+        assert RemoteEmbeddings(address, timeout=5).ping() == "fake"
+        os.chmod(authkey_path(address), 0o644)
+        with pytest.raises(EmbeddingServerError):
+            RemoteEmbeddings(address, timeout=5)
+        with pytest.raises(EmbeddingServerError):
+            RemoteEmbeddings(str(tmp_path / "missing.sock"), timeout=5)
+    finally:
+        server.close()
@@ -0,0 +1,72 @@
+# tests/test_intent_classifier.py
+
+import os
+import sys
+
+# 将项目根目录添加到 sys.path 中
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from my_agent.utils.shared.intent_classifier import IntentClassifier, IntentEngine
+from benchmarks.legacy_intent import legacy_analyze
+
+MESSAGES = [
+    "你好",
+    "请帮我纠错：各单位要高度重是。",
+    "对下面的句子进行公文纠错：今天天气很好。\n第二行也要纠错：保留",
+    "重新纠错一下",
+    "我对结果不满意\n请帮我修改",
+    "帮我润色：会议指出，要狠抓落实。",
+    "对刚刚那段话进行纠错",
+    "检查错误\n之前的内容",
+    "写作技巧有哪些",
+    "修改：",
+    "请修改我的公文\n重做一遍纠错",
+    "这个结果不行",
+    "公文纠错",
+    "REDO 纠错：abc",
+]
+
+
+def test_matches_sequential_search():
+    engine = IntentEngine()
+    for message in MESSAGES:
+        result = engine.analyze(message)
+        assert (result.intent, result.history, result.payload) == legacy_analyze(message), message
+
+
+def test_priority_and_payload():
+    assert IntentClassifier.classify("请帮我修改\n重新纠错一下") == "recorrection"
+    assert IntentClassifier.is_history_correction("对刚刚那段话进行纠错")
+    assert not IntentClassifier.is_recorrection("请帮我纠错")
+    result = IntentClassifier.analyze("对下面的句子进行公文纠错：今天天气很好。")
+    assert result.intent == "correction"
+    assert result.payload == "今天天气很好。"
+
+
+def test_memo_and_long_messages():
+    engine = IntentEngine(memo_size=8)
+    engine.analyze("你好")
+    engine.analyze("你好")
+    assert engine.cache_info().hits == 1
+    long_message = "纠错：" + "字" * 5000
+    assert engine.analyze(long_message).payload == "字" * 5000
+    assert engine.cache_info().currsize == 1
+
+
+def test_classify_many_keeps_order():
+    messages = MESSAGES * 3
+    expected = [IntentClassifier.classify(message) for message in messages]
+    assert list(IntentClassifier.classify_many(iter(messages), batch_size=4)) == expected
+    assert list(IntentClassifier.classify_many(messages, workers=2, batch_size=4)) == expected
+
+
+def test_replay_counts_jsonl():
+    from intent_replay import replay
+    lines = ['{"message": "你好"}', '{"message": "请帮我纠错：今天"}', 'not json', '{"other": 1}',
+             '{"title": "重新纠错", "body": "一下"}']
+    report = replay(lines)
+    assert report["total"] == 3
+    assert report["skipped"] == 2
+    assert report["intents"]["chat"]["count"] == 2
+    report = replay(lines[-1:], fields=["title", "body"])
+    assert report["intents"]["recorrection"]["count"] == 1
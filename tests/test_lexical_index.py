@@ -0,0 +1,86 @@
+# tests/test_lexical_index.py
+
+import math
+import os
+import sys
+
+import numpy as np
+
+# 将项目根目录添加到 sys.path 中
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from my_agent.utils.shared.lexical_index import LexicalIndex, tokenize
+from my_agent.utils.shared.retriever import CustomVectorDB
+from tests.helpers import HashEmbeddings
+
+
+TEXTS = [
+    "国务院关于印发《党政机关公文处理工作条例》的通知",
+    "国发〔2023〕5号 关于进一步优化营商环境的意见",
+    "GB/T 9704-2012 党政机关公文格式",
+    "关于做好春节期间安全生产工作的通知",
+]
+
+
+def bm25(query, texts, k1=1.2, b=0.75):
+    """逐词计算的BM25，用于核对向量化实现"""
+    docs = [tokenize(text) for text in texts]
+    avg = sum(len(doc) for doc in docs) / len(docs)
+    scores = []
+    for doc in docs:
+        score = 0.0
+        for term in set(tokenize(query)):
+            df = sum(term in d for d in docs)
+            tf = doc.count(term)
+            if tf:
+                idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+                score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(doc) / avg))
+        scores.append(score)
+    return scores
+
+
+def test_tokenize_bigrams_and_numbers():
+    assert tokenize("公文格式") == ["公文", "文格", "格式"]
+    assert tokenize("国发〔２０２３〕5号") == ["国发", "2023", "5", "号"]
+    assert tokenize("GB/T 9704") == ["gb", "t", "9704"]
+
+
+def test_scores_match_reference_and_survive_save(tmp_path):
+    index = LexicalIndex()
+    index.add(TEXTS[:2], 0)
+    index.add(TEXTS[2:], 2)
+    for query in ("公文处理条例", "国发2023 5号", "通知"):
+        ids, scores = index.score(query)
+        expected = bm25(query, TEXTS)
+        assert ids.tolist() == [i for i, s in enumerate(expected) if s > 0]
+        np.testing.assert_allclose(scores, [expected[i] for i in ids], rtol=1e-5)
+
+    path = str(tmp_path / "lexical_index.npz")
+    index.save(path)
+    reloaded = LexicalIndex.load(path)
+    reloaded.add(["公文处理"], 4)
+    ids, scores = reloaded.score("公文处理")
+    expected = bm25("公文处理", TEXTS + ["公文处理"])
+    np.testing.assert_allclose(scores, [expected[i] for i in ids], rtol=1e-5)
+    assert reloaded.score("完全无关")[0].size == 0
+
+
+def test_hybrid_search_finds_exact_document_number(tmp_path):
+    texts = TEXTS + [f"第{i}号文件的其他内容" for i in range(200)]
+    db = CustomVectorDB(HashEmbeddings(), str(tmp_path))
+    db.add_texts(texts, [{"text": t} for t in texts])
+
+    results = db.lexical_search_with_score("国发〔2023〕5号", k=1)
+    assert results[0][0].page_content == TEXTS[1]
+    hybrid = db.hybrid_search("国发〔2023〕5号", k=3)
+    assert TEXTS[1] in [doc.page_content for doc in hybrid]
+    # 预筛选时只在命中查询词的文档中计算向量相似度
+    prefiltered = db.hybrid_search("党政机关公文", k=2, prefilter_k=2)
+    assert {doc.page_content for doc in prefiltered} == {TEXTS[0], TEXTS[2]}
+
+    # 没有保存索引时重新打开，从元数据补建词法索引
+    reopened = CustomVectorDB(HashEmbeddings(), str(tmp_path))
+    assert len(reopened.lexical) == len(texts)
+    db.save()
+    reopened = CustomVectorDB(HashEmbeddings(), str(tmp_path), read_only=True)
+    assert reopened.lexical_search_with_score("国发〔2023〕5号", k=1)[0][0].page_content == TEXTS[1]
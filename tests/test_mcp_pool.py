@@ -0,0 +1,171 @@
+# tests/test_mcp_pool.py
+
+import asyncio
+import os
+import sys
+import textwrap
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+# 将项目根目录添加到 sys.path 中
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from my_agent.utils.mcp_pool import MCPWorkerPool, AsyncMCPWorkerPool, MCPError, MCPTimeoutError
+
+# 模拟的CSC服务：按行读取JSON-RPC请求，每个请求在单独的线程中处理，夹带一行日志输出
+FAKE_SERVER = textwrap.dedent('''
+    import json, os, sys, threading, time
+    print("fake csc server ready", flush=True)
+    output_lock = threading.Lock()
+
+    def handle(request):
+        params = request["params"]
+        if request["method"] == "sleep":
+            time.sleep(params["seconds"])
+        result = {"text": params.get("text"), "pid": os.getpid()}
+        with output_lock:
+            print(json.dumps({"jsonrpc": "2.0", "id": request["id"], "result": result}), flush=True)
+
+    for line in sys.stdin:
+        request = json.loads(line)
+        if request["method"] == "crash":
+            sys.exit(3)
+        threading.Thread(target=handle, args=(request,), daemon=True).start()
+''')
+
+
+@pytest.fixture
+def server_script(tmp_path):
+    script = tmp_path / "csc_server.py"
+    script.write_text(FAKE_SERVER, encoding="utf-8")
+    return str(script)
+
+
+def test_pool_reuses_worker_processes(server_script):
+    pool = MCPWorkerPool(server_script, size=2, timeout=10)
+    try:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            responses = list(executor.map(
+                lambda i: pool.call("echo", {"text": f"文本{i}"}), range(20)
+            ))
+        assert [r["result"]["text"] for r in responses] == [f"文本{i}" for i in range(20)]
+        # 20次调用只会启动不超过2个进程
+        assert len({r["result"]["pid"] for r in responses}) <= 2
+    finally:
+        pool.shutdown()
+
+
+def test_pool_restarts_crashed_worker(server_script):
+    pool = MCPWorkerPool(server_script, size=1, timeout=10)
+    try:
+        first_pid = pool.call("echo", {"text": "a"})["result"]["pid"]
+        with pytest.raises(MCPError):
+            pool.call("crash", {})
+        second_pid = pool.call("echo", {"text": "b"})["result"]["pid"]
+        assert second_pid != first_pid
+    finally:
+        pool.shutdown()
+
+
+def test_pool_timeout_recycles_worker(server_script):
+    pool = MCPWorkerPool(server_script, size=1, timeout=10)
+    try:
+        with pytest.raises(MCPTimeoutError):
+            pool.call("sleep", {"seconds": 5}, timeout=0.5)
+        assert pool.call("echo", {"text": "ok"})["result"]["text"] == "ok"
+    finally:
+        pool.shutdown()
+
+
+def test_pool_timeout_keeps_other_requests_on_worker(server_script):
+    pool = MCPWorkerPool(server_script, size=1, timeout=10)
+    try:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            slow = executor.submit(pool.call, "sleep", {"seconds": 1.5, "text": "慢"})
+            quick = executor.submit(pool.call, "sleep", {"seconds": 0.3, "text": "快"})
+            # 超时期间同一进程仍有响应返回，只放弃超时的请求，其他请求不受影响
+            with pytest.raises(MCPTimeoutError):
+                pool.call("sleep", {"seconds": 5}, timeout=0.8)
+            assert quick.result()["result"]["text"] == "快"
+            assert slow.result()["result"]["pid"] == quick.result()["result"]["pid"]
+        assert pool.call("echo", {"text": "ok"})["result"]["pid"] == slow.result()["result"]["pid"]
+    finally:
+        pool.shutdown()
+
+
+def test_missing_server_script_reports_error(tmp_path):
+    pool = MCPWorkerPool(str(tmp_path / "missing.py"), size=1, timeout=10)
+    try:
+        with pytest.raises(MCPError):
+            pool.call("echo", {"text": "a"})
+    finally:
+        pool.shutdown()
+
+
+def test_async_pool_does_not_block_event_loop(server_script):
+    async def scenario():
+        pool = AsyncMCPWorkerPool(server_script, size=2, timeout=10)
+        try:
+            ticks = 0
+
+            async def ticker():
+                nonlocal ticks
+                while True:
+                    await asyncio.sleep(0.01)
+                    ticks += 1
+
+            ticker_task = asyncio.ensure_future(ticker())
+            responses = await asyncio.gather(
+                pool.call("sleep", {"seconds": 0.3, "text": "慢"}),
+                *[pool.call("echo", {"text": f"文本{i}"}) for i in range(10)]
+            )
+            ticker_task.cancel()
+            assert responses[0]["result"]["text"] == "慢"
+            assert [r["result"]["text"] for r in responses[1:]] == [f"文本{i}" for i in range(10)]
+            # 等待纠错期间事件循环仍在调度其他任务
+            assert ticks > 5
+        finally:
+            await pool.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_async_pool_cancellation_and_timeout(server_script):
+    async def scenario():
+        pool = AsyncMCPWorkerPool(server_script, size=1, timeout=10)
+        try:
+            task = asyncio.ensure_future(pool.call("sleep", {"seconds": 0.5}))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            # 被取消请求的迟到响应会被丢弃，进程继续服务后续请求
+            assert (await pool.call("echo", {"text": "ok"}))["result"]["text"] == "ok"
+
+            with pytest.raises(MCPTimeoutError):
+                await pool.call("sleep", {"seconds": 5}, timeout=0.3)
+            assert (await pool.call("echo", {"text": "again"}))["result"]["text"] == "again"
+        finally:
+            await pool.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_async_pool_timeout_keeps_other_requests_on_worker(server_script):
+    async def scenario():
+        pool = AsyncMCPWorkerPool(server_script, size=1, timeout=10)
+        try:
+            slow = asyncio.ensure_future(pool.call("sleep", {"seconds": 1.5, "text": "慢"}))
+            quick = asyncio.ensure_future(pool.call("sleep", {"seconds": 0.3, "text": "快"}))
+            await asyncio.sleep(0.05)
+            # 超时期间同一进程仍有响应返回，只放弃超时的请求，其他请求不受影响
+            with pytest.raises(MCPTimeoutError):
+                await pool.call("sleep", {"seconds": 5}, timeout=0.8)
+            assert (await quick)["result"]["text"] == "快"
+            assert (await slow)["result"]["pid"] == (await quick)["result"]["pid"]
+            assert (await pool.call("echo", {"text": "ok"}))["result"]["pid"] == (await slow)["result"]["pid"]
+        finally:
+            await pool.shutdown()
+
+    asyncio.run(scenario())
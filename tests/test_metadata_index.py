@@ -0,0 +1,81 @@
+# tests/test_metadata_index.py
+
+import os
+import sys
+
+import numpy as np
+
+# 将项目根目录添加到 sys.path 中
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from my_agent.utils.shared.metadata_index import MetadataIndex
+from my_agent.utils.shared.retriever import CustomVectorDB
+from tests.helpers import UnusedEmbeddings
+
+DEPARTMENTS = ["办公厅", "财政厅", "教育厅"]
+
+
+def make_metadata(i):
+    return {"id": i, "text": f"第{i}号文件", "department": DEPARTMENTS[i % 3], "year": 2020 + i % 5,
+            "tags": ["公开"] if i % 2 else ["内部", "内部"]}
+
+
+def test_match_combines_fields_and_values(tmp_path):
+    metadatas = [make_metadata(i) for i in range(100)]
+    index = MetadataIndex()
+    index.add(metadatas[:60], 0)
+    index.add(metadatas[60:], 60)
+
+    def expected(predicate):
+        return [i for i, item in enumerate(metadatas) if predicate(item)]
+
+    query = {"department": "财政厅", "year": [2021, 2024]}
+    assert index.match(query).tolist() == expected(lambda m: m["department"] == "财政厅" and m["year"] in (2021, 2024))
+    assert index.match({"tags": "内部"}).tolist() == expected(lambda m: m["id"] % 2 == 0)
+    assert index.match({"year": "2021"}).size == 0
+    assert index.match({"department": "不存在"}).size == 0
+
+    path = str(tmp_path / "filter_index.npz")
+    index.save(path)
+    reloaded = MetadataIndex.load(path)
+    reloaded.add([make_metadata(100)], 100)
+    assert reloaded.match({"department": "财政厅", "year": 2020}).tolist() == \
+        expected(lambda m: m["department"] == "财政厅" and m["year"] == 2020) + [100]
+
+
+def test_filtered_search_scores_only_matching_rows(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(3000, 16)).astype(np.float32)
+    metadatas = [make_metadata(i) for i in range(3000)]
+    db = CustomVectorDB(UnusedEmbeddings(), str(tmp_path))
+    for start in range(0, 3000, 1000):
+        db.add_embeddings([""] * 1000, vectors[start:start + 1000], metadatas[start:start + 1000])
+
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    allowed = np.array([i for i, m in enumerate(metadatas) if m["department"] == "教育厅" and m["year"] == 2022])
+    query = rng.normal(size=16)
+    expected = allowed[np.argsort(-(normalized[allowed] @ query))[:5]].tolist()
+    filter = {"department": "教育厅", "year": 2022}
+
+    results = db.similarity_search_with_score_by_vector(query, k=5, filter=filter)
+    assert [doc.metadata["id"] for doc, _ in results] == expected
+    batch = db.similarity_search_batch_with_score_by_vector([query, query], k=5, filter=filter)
+    assert [[doc.metadata["id"] for doc, _ in row] for row in batch] == [expected, expected]
+    assert db.similarity_search_by_vector(query, k=5, filter={"year": 1999}) == []
+
+    # 命中的行较少时即使建立了IVF索引也计算全部命中的行，结果与全量计算一致
+    db.build_index(nlist=16)
+    results = db.similarity_search_with_score_by_vector(query, k=5, filter=filter, nprobe=8)
+    assert [doc.metadata["id"] for doc, _ in results] == expected
+    # 命中的行较多时只在探测的倒排列表中计算，结果仍满足过滤条件
+    results = db.similarity_search_with_score_by_vector(query, k=5, filter=filter, nprobe=1)
+    assert len(results) == 5
+    assert all(doc.metadata["id"] in allowed for doc, _ in results)
+
+    # 重新打开后过滤索引和按需读取的元数据可用
+    reopened = CustomVectorDB(UnusedEmbeddings(), str(tmp_path), read_only=True)
+    assert len(reopened.metadata) == 3000
+    assert reopened.metadata[1234] == metadatas[1234]
+    assert reopened.metadata[-1] == metadatas[-1]
+    assert [m["id"] for m in reopened.metadata[998:1002]] == [998, 999, 1000, 1001]
+    assert reopened.filters.match(filter).tolist() == allowed.tolist()
@@ -0,0 +1,80 @@
+# tests/test_repository.py
+
+import os
+import sys
+
+import pytest
+
+# 将项目根目录添加到 sys.path 中
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from api.storage import SQLiteRecordStore
+from api.repository import RecordRepository
+
+
+def make_repo(tmp_path):
+    return RecordRepository(SQLiteRecordStore(str(tmp_path / "records.sqlite3"), "chats"))
+
+
+def test_indexes_follow_upsert_and_delete(tmp_path):
+    repo = make_repo(tmp_path)
+    for i in range(10):
+        repo.upsert({"id": f"c{i}", "userid": "u1" if i % 2 else "u2", "title": f"聊天{i}"})
+
+    assert repo.upsert({"id": "c3", "userid": "u1", "title": "改名"}) is True
+    assert repo.get("c3")["title"] == "改名"
+    assert repo.delete("c5") is True
+    assert repo.delete("c5") is False
+
+    items, cursor = repo.list("u1")
+    assert [item["id"] for item in items] == ["c1", "c3", "c7", "c9"]
+    assert cursor is None
+    assert repo.delete_by_user("u2") == 5
+    assert len(repo) == 4
+
+    # 重新从存储加载后索引一致
+    reloaded = RecordRepository(repo.store)
+    assert [item["id"] for item in reloaded.list()[0]] == ["c1", "c3", "c7", "c9"]
+
+
+def test_cursor_pagination_survives_deletes(tmp_path):
+    repo = make_repo(tmp_path)
+    for i in range(25):
+        repo.upsert({"id": f"f{i}", "userid": "u"})
+    # 大量删除触发索引压缩
+    for i in range(0, 25, 3):
+        repo.delete(f"f{i}")
+    expected = [f"f{i}" for i in range(25) if i % 3]
+
+    seen, cursor = [], None
+    while True:
+        items, cursor = repo.list("u", limit=4, cursor=cursor)
+        seen.extend(item["id"] for item in items)
+        if cursor is None:
+            break
+    assert seen == expected
+
+    items, _ = repo.list("u", limit=3, offset=2)
+    assert [item["id"] for item in items] == expected[2:5]
+    assert repo.list("missing", limit=3) == ([], None)
+
+
+def test_invalid_page_params_are_rejected(tmp_path):
+    from fastapi.testclient import TestClient
+    from api.main import app, get_page_params
+
+    repo = make_repo(tmp_path)
+    repo.upsert({"id": "f0", "userid": "u"})
+    for kwargs in ({"limit": 0}, {"limit": -1}, {"cursor": "None"}, {"cursor": "abc"}):
+        with pytest.raises(ValueError):
+            repo.list("u", **kwargs)
+    for body in ({"limit": 0}, {"limit": "x"}, {"cursor": "None"}, {"cursor": "１２"}, {"offset": "x"}):
+        with pytest.raises(ValueError):
+            get_page_params(body)
+    assert get_page_params({"limit": "2", "cursor": 5, "offset": -1}) == (2, "5", 0)
+
+    # 接口对无效的分页参数返回400，而不是500
+    client = TestClient(app)
+    for path in ("/chat/list", "/file/history"):
+        assert client.post(path, json={"limit": 0}).json()["code"] == 400
+        assert client.post(path, json={"limit": 2, "cursor": "abc"}).json()["code"] == 400
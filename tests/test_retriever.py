@@ -0,0 +1,101 @@
+# tests/test_retriever.py
+
+import json
+import os
+import sys
+
+import numpy as np
+
+# 将项目根目录添加到 sys.path 中
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from my_agent.utils.shared.retriever import CustomVectorDB, top_k, top_k_rows
+from tests.helpers import HashEmbeddings
+
+
+def test_top_k_matches_full_sort():
+    scores = np.random.default_rng(0).normal(size=1000).astype(np.float32)
+    assert top_k(scores, 10).tolist() == np.argsort(-scores)[:10].tolist()
+    assert top_k(scores[:3], 10).tolist() == np.argsort(-scores[:3]).tolist()
+    assert top_k(scores, 0).size == 0
+
+
+def test_search_returns_scores_in_order(tmp_path):
+    embeddings = HashEmbeddings()
+    texts = [f"第{i}条公文" for i in range(3000)]
+    db = CustomVectorDB(embeddings, str(tmp_path))
+    for start in range(0, len(texts), 700):
+        db.add_texts(texts[start:start + 700], [{"text": t} for t in texts[start:start + 700]])
+    assert db.vectors.dtype == np.float32 and db.vectors.flags.c_contiguous
+    assert db.vectors.shape == (3000, 16)
+
+    raw = np.array(embeddings.embed_documents(texts))
+    query = np.array(embeddings.embed_query(texts[42]))
+    expected = raw @ query / (np.linalg.norm(raw, axis=1) * np.linalg.norm(query))
+    results = db.similarity_search_with_score(texts[42], k=5)
+    assert [doc.page_content for doc, _ in results] == [texts[i] for i in np.argsort(-expected)[:5]]
+    assert results[0][0].page_content == texts[42]
+    assert abs(results[0][1] - 1.0) < 1e-5
+    assert [doc.page_content for doc in db.similarity_search(texts[42], k=5)] == [d.page_content for d, _ in results]
+
+    reloaded = CustomVectorDB(embeddings, str(tmp_path))
+    assert np.array_equal(reloaded.vectors, db.vectors)
+
+
+def test_load_legacy_float64_vectors(tmp_path):
+    np.save(tmp_path / "vectors.npy", np.array([[3.0, 4.0], [0.0, 2.0]]))
+    with open(tmp_path / "metadata.json", "w") as f:
+        json.dump([{"text": "a"}, {"text": "b"}], f)
+    db = CustomVectorDB(HashEmbeddings(dim=2), str(tmp_path))
+    assert db.vectors.dtype == np.float32
+    np.testing.assert_allclose(db.vectors, [[0.6, 0.8], [0.0, 1.0]], rtol=1e-6)
+    assert db.similarity_search_by_vector([0.0, 1.0], k=1)[0].page_content == "b"
+
+
+def test_top_k_rows_matches_full_sort():
+    scores = np.random.default_rng(1).normal(size=(5, 300)).astype(np.float32)
+    assert top_k_rows(scores, 7).tolist() == np.argsort(-scores, axis=1)[:, :7].tolist()
+    assert top_k_rows(scores[:, :3], 7).tolist() == np.argsort(-scores[:, :3], axis=1).tolist()
+
+
+def test_batch_search_matches_single_queries(tmp_path):
+    embeddings = HashEmbeddings()
+    texts = [f"段落{i}" for i in range(2000)]
+    db = CustomVectorDB(embeddings, str(tmp_path))
+    db.add_texts(texts[:1500], [{"text": t} for t in texts[:1500]])
+    db.add_texts(texts[1500:], [{"text": t} for t in texts[1500:]])
+    queries = [texts[7], "不在库中的查询", texts[1999]]
+
+    def pages(results):
+        return [[doc.page_content for doc, _ in row] for row in results]
+
+    expected = [db.similarity_search_with_score(q, k=5) for q in queries]
+    batch = db.similarity_search_batch_with_score(queries, k=5)
+    assert pages(batch) == pages(expected)
+    np.testing.assert_allclose([[s for _, s in row] for row in batch],
+                               [[s for _, s in row] for row in expected], rtol=1e-5)
+    assert [[d.page_content for d in row] for row in db.similarity_search_batch(queries, k=5)] == pages(expected)
+    assert db.similarity_search_batch([], k=5) == []
+
+    # 扫描全部倒排列表时与精确检索一致
+    db.build_index(nlist=8)
+    assert pages(db.similarity_search_batch_with_score(queries, k=5, nprobe=8)) == pages(expected)
+    # 候选集较小时只计算各查询所探测列表的并集
+    results = db.similarity_search_batch_with_score([texts[7], texts[1999]], k=3, nprobe=1)
+    assert [row[0][0].page_content for row in results] == [texts[7], texts[1999]]
+
+
+def test_batch_search_embeds_queries_as_queries(tmp_path):
+    class PrefixedEmbeddings(HashEmbeddings):
+        """查询带指令前缀的模型，查询向量与同一文本的文档向量不同"""
+
+        def embed_query(self, text):
+            return self._embed("查询：" + text)
+
+    db = CustomVectorDB(PrefixedEmbeddings(), str(tmp_path))
+    texts = [f"段落{i}" for i in range(200)]
+    db.add_texts(texts, [{"text": t} for t in texts])
+    queries = [texts[3], texts[150]]
+    expected = [[doc.page_content for doc, _ in db.similarity_search_with_score(q, k=5)] for q in queries]
+    assert [[doc.page_content for doc, _ in row] for row in db.similarity_search_batch_with_score(queries, k=5)] \
+        == expected
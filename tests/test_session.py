@@ -0,0 +1,42 @@
+# tests/test_session.py
+
+import os
+import sys
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+# 将项目根目录添加到 sys.path 中
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from api.session import SESSION_COOKIE, SESSION_HEADER, SessionCookieMiddleware, session_id_of
+
+
+def make_app():
+    app = FastAPI()
+    app.add_middleware(SessionCookieMiddleware)
+
+    @app.get("/session")
+    async def session(request: Request):
+        return {"session_id": session_id_of(request)}
+
+    return app
+
+
+def test_clients_behind_one_address_get_separate_sessions():
+    app = make_app()
+    first, second = TestClient(app), TestClient(app)
+    response = first.get("/session")
+    session_id = response.json()["session_id"]
+    assert session_id and response.cookies[SESSION_COOKIE] == session_id
+    assert "httponly" in response.headers["set-cookie"].lower()
+
+    # 之后的请求带上Cookie，沿用同一会话，不再设置Cookie
+    response = first.get("/session")
+    assert response.json()["session_id"] == session_id and "set-cookie" not in response.headers
+    # 来自同一IP的另一个客户端得到不同的会话
+    assert second.get("/session").json()["session_id"] != session_id
+
+    # 请求头中的会话ID优先
+    response = TestClient(app).get("/session", headers={SESSION_HEADER: "abc"})
+    assert response.json()["session_id"] == "abc" and "set-cookie" not in response.headers
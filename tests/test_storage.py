@@ -0,0 +1,44 @@
+# tests/test_storage.py
+
+import json
+import os
+import sys
+
+# 将项目根目录添加到 sys.path 中
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from api.storage import SQLiteRecordStore
+
+
+def test_upsert_update_delete_keep_order(tmp_path):
+    store = SQLiteRecordStore(str(tmp_path / "chats.sqlite3"), "chats")
+    store.upsert({"id": "a", "userid": "u1", "title": "第一个"})
+    store.upsert({"id": "b", "userid": "u2", "title": "第二个"})
+    store.upsert({"id": "c", "userid": "u1", "title": "第三个"})
+    # 更新不改变位置
+    store.upsert({"id": "a", "userid": "u1", "title": "已修改"})
+
+    assert [chat["id"] for chat in store.list()] == ["a", "b", "c"]
+    assert [chat["title"] for chat in store.list("u1")] == ["已修改", "第三个"]
+    assert store.delete("b") is True
+    assert store.delete("b") is False
+    assert store.get("b") is None
+    assert store.count() == 2
+
+
+def test_store_persists_across_instances(tmp_path):
+    db_path = str(tmp_path / "chats.sqlite3")
+    SQLiteRecordStore(db_path, "chats").upsert({"id": "a", "userid": "u1", "messages": [{"content": "你好"}]})
+    assert SQLiteRecordStore(db_path, "chats").get("a")["messages"][0]["content"] == "你好"
+
+
+def test_migrate_from_json_runs_once(tmp_path):
+    legacy = tmp_path / "chat_history.json"
+    legacy.write_text(json.dumps([{"id": "a", "userid": "u1"}, {"id": "b", "userid": "u2"}]), encoding="utf-8")
+    store = SQLiteRecordStore(str(tmp_path / "chats.sqlite3"), "chats")
+
+    assert store.migrate_from_json(str(legacy)) == 2
+    store.delete("a")
+    # 再次启动不会重新导入已删除的记录
+    assert store.migrate_from_json(str(legacy)) == 0
+    assert [chat["id"] for chat in store.list()] == ["b"]
@@ -0,0 +1,75 @@
+# tests/test_upload.py
+
+import io
+import os
+import sys
+import tempfile
+import tracemalloc
+
+from docx import Document
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+# 将项目根目录添加到 sys.path 中
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from api.document_store import DocumentStore
+from api.upload import UploadSizeLimitMiddleware, ingest_docx
+
+
+def make_docx(paragraphs):
+    doc = Document()
+    for paragraph in paragraphs:
+        doc.add_paragraph(paragraph)
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def make_app(max_bytes):
+    app = FastAPI()
+    app.add_middleware(UploadSizeLimitMiddleware, paths=["/upload"], max_bytes=max_bytes)
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        return {"size": file.size}
+
+    return app
+
+
+def test_oversized_upload_is_rejected_with_413():
+    client = TestClient(make_app(max_bytes=1024))
+    assert client.post("/upload", files={"file": ("a.docx", b"x" * 512)}).json() == {"size": 512}
+    assert client.post("/upload", files={"file": ("a.docx", b"x" * 200 * 1024)}).status_code == 413
+
+    # 没有Content-Length的分块上传在读取过程中被拦截
+    def chunks():
+        yield b"--b\r\nContent-Disposition: form-data; name=\"file\"; filename=\"a.docx\"\r\n\r\n"
+        for _ in range(100):
+            yield b"x" * 4096
+        yield b"\r\n--b--\r\n"
+
+    response = client.post("/upload", content=chunks(),
+                           headers={"Content-Type": "multipart/form-data; boundary=b"})
+    assert response.status_code == 413
+
+
+def test_ingest_does_not_copy_upload_into_memory(tmp_path):
+    store = DocumentStore(str(tmp_path))
+    data = make_docx([f"第{i}段内容" for i in range(50)])
+    # 追加8MB无关数据，模拟大文件，只检查接收和保存的内存占用
+    payload = os.urandom(8 * 1024 * 1024)
+
+    with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as upload:
+        upload.write(payload)
+        tracemalloc.start()
+        store.put("s", "big.bin", upload, "")
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    assert peak < 1024 * 1024
+
+    with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as upload:
+        upload.write(data)
+        record, content = ingest_docx(store, "s", "a.docx", upload)
+    assert content.splitlines()[3] == "第3段内容"
+    assert store.original_path(record.document_id).read_bytes() == data
@@ -0,0 +1,144 @@
+# tests/test_vector_deletes.py
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# 将项目根目录添加到 sys.path 中
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from my_agent.utils.shared.retriever import CustomVectorDB
+from my_agent.utils.shared.vector_segments import SegmentStore
+from tests.helpers import UnusedEmbeddings, ids_of, make_batch
+
+
+def brute_force(vectors, alive, query, k):
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    scores = normalized @ (query / np.linalg.norm(query))
+    scores[~alive] = -np.inf
+    return np.argsort(-scores, kind="stable")[:k].tolist()
+
+
+def test_delete_upsert_and_compact_keep_ids_stable(tmp_path):
+    db = CustomVectorDB(UnusedEmbeddings(), str(tmp_path))
+    vectors = []
+    for start in range(0, 600, 200):
+        batch, metadatas = make_batch(start, 200)
+        assert db.add_embeddings([""] * 200, batch, metadatas) == [str(i) for i in range(start, start + 200)]
+        vectors.append(batch)
+    vectors = np.concatenate(vectors)
+    alive = np.ones(600, dtype=bool)
+    query = np.random.default_rng(99).normal(size=16)
+
+    # 按检索结果删除，之后的各种检索都不再返回
+    top = ids_of(db.similarity_search_with_score_by_vector(query, k=5))
+    assert db.delete([str(i) for i in top[:3]] + ["不存在"])
+    assert not db.delete(["不存在"])
+    alive[top[:3]] = False
+    expected = brute_force(vectors, alive, query, 10)
+    assert ids_of(db.similarity_search_with_score_by_vector(query, k=10)) == expected
+    assert [ids_of(r) for r in db.similarity_search_batch_with_score_by_vector([query], k=10)] == [expected]
+    assert all(doc.metadata["id"] not in top[:3] for doc, _ in db.lexical_search_with_score("文件", k=600))
+    assert len(db.lexical_search_with_score("文件", k=600)) == 597
+    filtered = db.similarity_search_with_score_by_vector(query, k=600, filter={"year": 2020})
+    assert len(filtered) == int(sum(alive[i] for i in range(0, 600, 3)))
+    assert db.metadata[top[0]] is None and db.get_by_ids([str(top[0])]) == []
+
+    # 按编号更新：旧的行删除，新的行使用同一编号
+    vectors_new, _ = make_batch(1000, 2)
+    assert db.add_embeddings([""] * 2, vectors_new, [{"id": "a", "text": "甲"}, {"id": "b", "text": "乙"}],
+                             ids=["政策-1", str(top[3])]) == ["政策-1", str(top[3])]
+    assert [doc.page_content for doc in db.get_by_ids([str(top[3]), "政策-1"])] == ["乙", "甲"]
+    results = db.similarity_search_with_score_by_vector(vectors_new[1], k=2)
+    assert results[0][0].id == str(top[3]) and results[0][0].metadata["id"] == "b"
+    assert top[3] not in ids_of(db.similarity_search_with_score_by_vector(query, k=600))
+    db.add_embeddings([""], vectors_new[:1] * -1, [{"id": "a2", "text": "甲二"}], ids=["政策-1"])
+    assert [doc.page_content for doc in db.get_by_ids(["政策-1"])] == ["甲二"]
+
+    # 合并后清除已删除的行，行号和文档编号不变，索引不需要重建
+    before = db.similarity_search_with_score_by_vector(query, k=20)
+    db.compact()
+    assert len(db._store.segments) == 1 and db._store.segments[0].count == 598
+    assert ids_of(db.similarity_search_with_score_by_vector(query, k=20)) == ids_of(before)
+    assert [doc.id for doc, _ in db.similarity_search_with_score_by_vector(query, k=20)] == \
+        [doc.id for doc, _ in before]
+    assert db.metadata[top[0]] is None and db.metadata[599]["id"] == 599
+    assert [doc.page_content for doc in db.get_by_ids(["政策-1", str(top[3])])] == ["甲二", "乙"]
+    expected = [doc.id for doc, _ in db.similarity_search_with_score_by_vector(query, k=10, exact=True)]
+    db.build_index(nlist=8)
+    assert [doc.id for doc, _ in db.similarity_search_with_score_by_vector(query, k=10, nprobe=8)] == expected
+
+    # 重新打开后删除和更新都保留，新写入的行号不会与已清除的行重复
+    reopened = CustomVectorDB(UnusedEmbeddings(), str(tmp_path))
+    assert [doc.id for doc, _ in reopened.similarity_search_with_score_by_vector(query, k=10)] == expected
+    assert reopened.add_embeddings([""], vectors_new[:1], [{"id": "c"}]) == [str(db._store.snapshot.next_row)]
+    assert reopened.delete(["政策-1", str(top[3])])
+    assert reopened.get_by_ids(["政策-1", str(top[3])]) == []
+    assert len(reopened._store) == 597
+    reopened.set_quantization("int8")
+    results = reopened.similarity_search_with_score_by_vector(vectors_new[0], k=5)
+    assert len(results) == 5 and not {doc.id for doc, _ in results} & {"政策-1", str(top[3]), str(top[0])}
+
+
+def test_snapshot_reads_survive_compaction(tmp_path):
+    store = SegmentStore(str(tmp_path), max_segments=8, purge_ratio=0.6)
+    for start in range(0, 300, 100):
+        store.append(*make_batch(start, 100))
+    old = store.snapshot
+    store.delete([str(i) for i in range(100, 150)])
+    assert not store.snapshot.live(np.array([120])).any() and old.live(np.array([120])).all()
+
+    # 合并期间的删除补记到合并后的分段，完整合并随后再清除这些行
+    merge = store._merge
+    calls = []
+
+    def merge_with_concurrent_delete(segments, name, quantized):
+        if not calls:
+            store.delete(["150", "10"])
+        calls.append(name)
+        return merge(segments, name, quantized)
+
+    store._merge = merge_with_concurrent_delete
+    store.compact(full=True)
+    assert len(calls) == 2
+    assert len(store.segments) == 1 and store.segments[0].count == 248
+    assert store.segments[0].deleted_count == 0
+    assert not store.snapshot.live(np.array([10, 150])).any()
+    assert store.snapshot.metadata[151]["id"] == 151
+
+    # 旧快照中的分段文件已删除，仍可读取
+    assert not any(name.startswith(old.segments[1].name) for name in os.listdir(tmp_path / "segments"))
+    rows = np.array([5, 120, 250])
+    assert np.array_equal(old.take(rows), np.concatenate([make_batch(0, 100)[0][5:6], make_batch(100, 100)[0][20:21],
+                                                          make_batch(200, 100)[0][50:51]]))
+    assert [old.metadata[row]["id"] for row in rows] == [5, 120, 250]
+
+    # 已删除的行超过比例时在后台重写
+    assert store.delete([str(i) for i in range(150, 300)]) == 149
+    store.wait()
+    assert store.segments[0].deleted_count == 0 and store.segments[0].count == 99
+    reader = SegmentStore(str(tmp_path), read_only=True)
+    assert len(reader) == 99 and reader.metadata[99]["id"] == 99
+    assert reader.metadata[10] is None and reader.metadata[250] is None and len(reader.metadata) == 300
+
+
+def test_numeric_ids_cannot_collide_with_default_ids(tmp_path):
+    db = CustomVectorDB(UnusedEmbeddings(), str(tmp_path))
+    vectors, metadatas = make_batch(0, 10)
+    # 数字编号会与之后分配的默认编号（行号）重复，不能用于新文档
+    with pytest.raises(ValueError):
+        db.add_embeddings(["a"], vectors[:1], [{"id": "a"}], ids=["7"])
+    with pytest.raises(ValueError):
+        db.add_embeddings(["a", "b"], vectors[:2], [{"id": "a"}, {"id": "b"}], ids=[None, "1"])
+    assert db.add_embeddings([""] * 9, vectors[:9], metadatas[:9]) == [str(i) for i in range(9)]
+
+    # 已有文档的数字编号可以用于更新，之后的默认编号不会与之重复
+    db.add_embeddings(["新"], vectors[9:], [{"id": "new", "text": "新"}], ids=["7"])
+    assert db.add_embeddings([""] * 2, vectors[:2], metadatas[:2]) == ["10", "11"]
+    assert [doc.page_content for doc in db.get_by_ids(["7"])] == ["新"]
+    assert db.delete(["7"])
+    assert db.get_by_ids(["7"]) == []
+    with pytest.raises(ValueError):
+        db.add_embeddings(["a"], vectors[:1], [{"id": "a"}], ids=["7"])
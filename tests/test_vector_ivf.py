@@ -0,0 +1,51 @@
+# tests/test_vector_ivf.py
+
+import os
+import sys
+
+# 将项目根目录添加到 sys.path 中
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from my_agent.utils.shared.retriever import CustomVectorDB
+from tests.helpers import UnusedEmbeddings, clustered, ids_of
+
+
+def add(db, vectors, start):
+    db.add_embeddings([""] * len(vectors), vectors, [{"id": start + i} for i in range(len(vectors))])
+
+
+def test_ivf_search_and_incremental_insert(tmp_path):
+    data = clustered(3000)
+    db = CustomVectorDB(UnusedEmbeddings(), str(tmp_path))
+    add(db, data[:2000], 0)
+    db.build_index(nlist=16)
+    add(db, data[2000:], 2000)
+
+    # 扫描全部列表时与精确检索结果相同
+    for query in data[::300]:
+        exact = db.similarity_search_with_score_by_vector(query, k=10, exact=True)
+        assert ids_of(db.similarity_search_with_score_by_vector(query, k=10, nprobe=16)) == ids_of(exact)
+
+    hits = sum(len(set(ids_of(db.similarity_search_with_score_by_vector(q, k=10, nprobe=4)))
+                   & set(ids_of(db.similarity_search_with_score_by_vector(q, k=10, exact=True))))
+               for q in data[1::100])
+    assert hits / (30 * 10) > 0.8
+    # 训练后新增的向量可以被检索到
+    assert ids_of(db.similarity_search_with_score_by_vector(data[2500], k=1, nprobe=2)) == [2500]
+
+
+def test_index_persistence_catches_up(tmp_path):
+    data = clustered(1200, seed=1)
+    db = CustomVectorDB(UnusedEmbeddings(), str(tmp_path))
+    add(db, data[:1000], 0)
+    db.build_index(nlist=8)
+    # 保存索引之后追加的向量在重新打开时补入索引
+    add(db, data[1000:], 1000)
+
+    reopened = CustomVectorDB(UnusedEmbeddings(), str(tmp_path), read_only=True)
+    assert reopened.index is not None and reopened.index.indexed_count == 1200
+    assert ids_of(reopened.similarity_search_with_score_by_vector(data[1100], k=1, nprobe=8)) == [1100]
+
+    db.drop_index()
+    assert not os.path.exists(tmp_path / "ivf_index.npz")
+    assert CustomVectorDB(UnusedEmbeddings(), str(tmp_path)).index is None
@@ -0,0 +1,61 @@
+# tests/test_vector_quantization.py
+
+import os
+import sys
+
+import numpy as np
+
+# 将项目根目录添加到 sys.path 中
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from my_agent.utils.shared.retriever import CustomVectorDB
+from my_agent.utils.shared.vector_segments import quantize_int8
+from tests.helpers import UnusedEmbeddings, clustered, ids_of
+
+
+def test_quantize_int8_error_is_bounded():
+    vectors = np.random.default_rng(0).normal(size=(100, 64)).astype(np.float32)
+    vectors[3] = 0
+    codes, scales = quantize_int8(vectors)
+    assert codes.dtype == np.int8 and scales.dtype == np.float32
+    error = np.abs(codes * scales[:, None] - vectors)
+    assert np.all(error <= scales[:, None] / 2 + 1e-6)
+    assert not codes[3].any()
+
+
+def test_quantized_search_reranks_with_full_precision(tmp_path):
+    vectors = clustered(4000, dim=32, scale=0.5)
+    queries = clustered(20, dim=32, seed=1, scale=0.5)
+    db = CustomVectorDB(UnusedEmbeddings(), str(tmp_path))
+    for start in range(0, 4000, 1000):
+        db.add_embeddings([""] * 1000, vectors[start:start + 1000], [{"id": i} for i in range(start, start + 1000)])
+    expected = [ids_of(db.similarity_search_with_score_by_vector(q, k=10)) for q in queries]
+
+    # 为已有分段补建量化向量
+    db.set_quantization("int8")
+    assert all(segment.codes is not None for segment in db._store.segments)
+    results = [db.similarity_search_with_score_by_vector(q, k=10) for q in queries]
+    recall = np.mean([len(set(ids_of(r)) & set(e)) / 10 for r, e in zip(results, expected)])
+    assert recall >= 0.95
+    # 返回的分数是float32向量的精确余弦相似度
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    query = queries[0] / np.linalg.norm(queries[0])
+    for doc, score in results[0]:
+        assert abs(score - float(normalized[doc.metadata["id"]] @ query)) < 1e-5
+    batch = db.similarity_search_batch_with_score_by_vector(queries, k=10)
+    assert [ids_of(r) for r in batch] == [ids_of(r) for r in results]
+    assert ids_of(db.similarity_search_with_score_by_vector(queries[0], k=10, exact=True)) == expected[0]
+
+    # 之后写入和合并的分段都带有量化向量，只读进程按清单使用量化向量
+    db.add_embeddings([""] * 500, clustered(500, dim=32, seed=2, scale=0.5), [{"id": 4000 + i} for i in range(500)])
+    db.compact()
+    assert len(db._store.segments) == 1 and db._store.segments[0].codes.shape == (4500, 32)
+    reader = CustomVectorDB(UnusedEmbeddings(), str(tmp_path), read_only=True)
+    assert reader._store.quantization == "int8"
+    assert ids_of(reader.similarity_search_with_score_by_vector(queries[0], k=10)) == \
+        ids_of(db.similarity_search_with_score_by_vector(queries[0], k=10))
+
+    db.set_quantization(None)
+    assert not any(name.endswith(".q8.npy") for name in os.listdir(tmp_path / "segments"))
+    assert ids_of(db.similarity_search_with_score_by_vector(queries[0], k=10, exact=True)) == \
+        ids_of(db.similarity_search_with_score_by_vector(queries[0], k=10))
@@ -0,0 +1,63 @@
+# tests/test_vector_segments.py
+
+import os
+import sys
+
+import numpy as np
+
+# 将项目根目录添加到 sys.path 中
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from my_agent.utils.shared.vector_segments import SegmentStore
+from tests.helpers import make_batch
+
+
+def test_append_compact_and_reopen(tmp_path):
+    store = SegmentStore(str(tmp_path), max_segments=3)
+    expected = []
+    start = 0
+    for count in (50, 5, 5, 5, 5, 5, 20, 1, 1):
+        vectors, metadata = make_batch(start, count)
+        assert store.append(vectors, metadata) == start
+        expected.append(vectors)
+        start += count
+    store.wait()
+    assert len(store.segments) <= 3
+    assert isinstance(store.segments[0].vectors, np.memmap)
+
+    expected = np.concatenate(expected)
+    merged = np.concatenate([segment.vectors for segment in store.segments])
+    assert np.array_equal(merged, expected)
+    assert [item["id"] for item in store.metadata] == list(range(start))
+    assert [segment.start for segment in store.segments] == \
+        [sum(s.count for s in store.segments[:i]) for i in range(len(store.segments))]
+
+    # 合并后的旧分段文件已删除
+    names = {segment.name for segment in store.segments}
+    files = {name.split(".")[0] for name in os.listdir(tmp_path / "segments")}
+    assert files == names
+
+    store.compact(full=True)
+    assert len(store.segments) == 1
+    reopened = SegmentStore(str(tmp_path))
+    assert np.array_equal(reopened.segments[0].vectors, expected)
+    assert [item["id"] for item in reopened.metadata] == list(range(start))
+
+
+def test_read_only_reader_refresh(tmp_path):
+    writer = SegmentStore(str(tmp_path))
+    writer.append(*make_batch(0, 10))
+    reader = SegmentStore(str(tmp_path), read_only=True)
+    assert len(reader) == 10
+    assert not reader.refresh()
+
+    writer.append(*make_batch(10, 4))
+    writer.compact(full=True)
+    assert reader.refresh()
+    assert len(reader) == 14 and len(reader.segments) == 1
+    try:
+        reader.append(*make_batch(20, 1))
+    except PermissionError:
+        pass
+    else:
+        raise AssertionError("只读存储不应允许写入")